@@ -0,0 +1,56 @@
+import contextvars
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+# Shared, bounded pool for Gemini calls. Every request submits its generations
+# here so they run side by side, and the pool size caps how many Gemini
+# round trips the whole process has in flight at once.
+AI_POOL_SIZE = int(os.getenv("AI_POOL_SIZE", "8"))
+AI_TIMEOUT = float(os.getenv("AI_TIMEOUT", "20"))
+
+executor = ThreadPoolExecutor(max_workers=AI_POOL_SIZE, thread_name_prefix="gemini")
+
+# When the page stops waiting for the call running on this thread (monotonic).
+# Nothing stops a call that is already running, so calls check it themselves
+# (model_router.py) and don't hold a pool thread for an answer nobody reads.
+_expires_at = contextvars.ContextVar("ai_pool_expires_at", default=None)
+
+
+def expires_at():
+    return _expires_at.get()
+
+
+def _run(expires, fn, args, kwargs):
+    if time.monotonic() >= expires:
+        raise TimeoutError("gave up waiting in the Gemini queue")
+    token = _expires_at.set(expires)
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        _expires_at.reset(token)
+
+
+def submit(fn, *args, **kwargs):
+    started_at = time.monotonic()
+    future = executor.submit(_run, started_at + AI_TIMEOUT, fn, args, kwargs)
+    future.started_at = started_at
+    return future
+
+
+# Wait for a submitted call, but never longer than `timeout` seconds after it was
+# submitted. A slow or failing call yields `fallback` instead of an exception so
+# only that panel degrades.
+def result_or(future, fallback=None, timeout=None, label="gemini"):
+    if future is None:
+        return fallback
+    timeout = AI_TIMEOUT if timeout is None else timeout
+    remaining = max(0.0, timeout - (time.monotonic() - future.started_at))
+    try:
+        return future.result(timeout=remaining)
+    except TimeoutError:
+        future.cancel()
+        print(f"⚠️ {label} timed out after {timeout:.1f}s")
+    except Exception as e:
+        print(f"⚠️ {label} failed: {e}")
+    return fallback
@@ -0,0 +1,99 @@
+from datetime import date
+
+import numpy as np
+
+# Vectorized spending analytics.
+#
+# A user's transactions are turned into columnar NumPy arrays once
+# (txn_model.columns(), straight from the slotted records), and every
+# aggregate (daily/weekly gambling totals, rolling sums, hour and weekday
+# histograms, net winnings, spend against the weekly limit) is computed with
+# array operations, so years of history cost about the same as a month.
+
+WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+
+
+def _rolling(values, window):
+    sums = np.cumsum(values)
+    sums[window:] = sums[window:] - sums[:-window]
+    return sums
+
+
+def analyze(columns, today=None, weekly_checkin=None):
+    today = today or date.today()
+    day, amount, hour, gambling = columns["day"], columns["amount"], columns["hour"], columns["gambling"]
+
+    result = {
+        "transactions": int(day.size),
+        "gambling_count": int(gambling.sum()),
+        "gambling_total": round(float(amount[gambling].sum()), 2),
+        "daily": [],
+        "weekly": [],
+        "hour_histogram": [0.0] * 24,
+        "weekday_histogram": [0.0] * 7,
+        "rolling_7": 0.0,
+        "rolling_30": 0.0,
+        "net_winnings": None,
+        "week_to_date": 0.0,
+        "weekly_limit": None,
+        "limit_used": None,
+        "peak_hour": None,
+        "peak_weekday": None,
+    }
+
+    today_ordinal = today.toordinal()
+    g_day = day[gambling]
+    g_amount = amount[gambling]
+
+    if g_day.size:
+        first = int(g_day.min())
+        last = max(int(g_day.max()), today_ordinal)
+        daily = np.bincount(g_day - first, weights=g_amount, minlength=last - first + 1)
+        rolling_7 = _rolling(daily, 7)
+        rolling_30 = _rolling(daily, 30)
+        days = np.nonzero(daily)[0]
+        result["daily"] = [
+            {"date": date.fromordinal(first + int(i)).isoformat(), "amount": round(float(daily[i]), 2),
+             "rolling_7": round(float(rolling_7[i]), 2), "rolling_30": round(float(rolling_30[i]), 2)}
+            for i in days
+        ]
+        today_index = today_ordinal - first
+        result["rolling_7"] = round(float(rolling_7[today_index]), 2)
+        result["rolling_30"] = round(float(rolling_30[today_index]), 2)
+
+        # Weeks start on Monday; date(1, 1, 1) has ordinal 1 and is a Monday
+        week_start = g_day - (g_day - 1) % 7
+        weeks, index = np.unique(week_start, return_inverse=True)
+        weekly = np.bincount(index, weights=g_amount)
+        result["weekly"] = [{"week": date.fromordinal(int(w)).isoformat(), "amount": round(float(a), 2)}
+                            for w, a in zip(weeks, weekly)]
+
+        weekday = (g_day - 1) % 7
+        result["weekday_histogram"] = np.round(np.bincount(weekday, weights=g_amount, minlength=7), 2).tolist()
+        result["peak_weekday"] = WEEKDAYS[int(np.argmax(result["weekday_histogram"]))]
+
+        g_hour = hour[gambling]
+        known = g_hour >= 0
+        if known.any():
+            hours = np.bincount(g_hour[known].astype(np.int64), weights=g_amount[known], minlength=24)
+            result["hour_histogram"] = np.round(hours, 2).tolist()
+            result["peak_hour"] = int(np.argmax(hours))
+
+        this_monday = today_ordinal - (today_ordinal - 1) % 7
+        result["week_to_date"] = round(float(g_amount[g_day >= this_monday].sum()), 2)
+
+    g_winnings = columns["winnings"][gambling]
+    if g_winnings.size and not np.isnan(g_winnings).all():
+        result["net_winnings"] = round(float(np.nansum(g_winnings)), 2)
+
+    if weekly_checkin and weekly_checkin.get("limit"):
+        limit = float(weekly_checkin["limit"])
+        result["weekly_limit"] = limit
+        result["limit_used"] = round(result["week_to_date"] / limit, 3) if limit else None
+
+    return result
+
+
+# Points for the dashboard chart: one per day with gambling, oldest first
+def chart_points(result):
+    return result["daily"]
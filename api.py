@@ -0,0 +1,147 @@
+import base64
+import binascii
+import gzip
+import json
+import os
+from datetime import date
+
+from werkzeug.http import parse_accept_header
+
+# Helpers for the JSON API under /api/v1 (the routes are in app.py).
+#
+# The API serves what the dashboard shows (transactions with their gambling
+# flag, progress, chart data) from the local store, without rendering a page
+# or calling Gemini, for mobile and polling clients.
+#
+#   ?limit=     page size (API_PAGE_SIZE, at most API_MAX_PAGE_SIZE)
+#   ?cursor=    next_cursor from the previous page; opaque to clients
+#   ?fields=    comma-separated fields to return, e.g. fields=date,amount
+#   ?days=      history window (TXN_WINDOW_DAYS, at most TXN_MAX_WINDOW_DAYS)
+#
+# Responses over API_COMPRESS_MIN_BYTES are compressed with brotli (when the
+# brotli package is installed) or gzip, whichever the client accepts.
+
+API_PAGE_SIZE = int(os.getenv("API_PAGE_SIZE", "100"))
+API_MAX_PAGE_SIZE = int(os.getenv("API_MAX_PAGE_SIZE", "500"))
+API_COMPRESS_MIN_BYTES = int(os.getenv("API_COMPRESS_MIN_BYTES", "1024"))
+
+TRANSACTION_FIELDS = ("transaction_id", "date", "name", "merchant_name", "amount", "category", "pending",
+                      "gambling")
+PROGRESS_FIELDS = ("days_clean", "money_saved", "last_gambling_date", "daily_spend_estimate", "computed_on",
+                   "checkin_message")
+
+# "points" is analytics' daily list; the rest are its other aggregates
+CHART_FIELDS = ("points", "weekly", "rolling_7", "rolling_30", "week_to_date", "weekly_limit", "limit_used",
+                "hour_histogram", "weekday_histogram", "peak_hour", "peak_weekday", "net_winnings",
+                "transactions", "gambling_count", "gambling_total")
+
+# Preferred first when the client accepts several equally
+ENCODINGS = ("br", "gzip")
+
+
+class APIError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def int_arg(value, name, default, maximum):
+    if value is None:
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        raise APIError(f"{name} must be an integer")
+    if not 1 <= number <= maximum:
+        raise APIError(f"{name} must be between 1 and {maximum}")
+    return number
+
+
+def fields_arg(value, allowed):
+    if not value:
+        return None
+    fields = [field.strip() for field in value.split(",") if field.strip()]
+    unknown = [field for field in fields if field not in allowed]
+    if unknown:
+        raise APIError(f"Unknown fields: {', '.join(unknown)} (allowed: {', '.join(allowed)})")
+    return fields
+
+
+def project(item, fields):
+    if fields is None:
+        return item
+    return {field: item[field] for field in fields if field in item}
+
+
+# Cursors point just past the last transaction of a page: (date, transaction_id)
+def encode_cursor(record):
+    raw = json.dumps([record.date.isoformat(), record.transaction_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    if not cursor:
+        return None
+    try:
+        day, transaction_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        date.fromisoformat(day)
+    except (binascii.Error, ValueError, TypeError):
+        raise APIError("Invalid cursor")
+    return day, transaction_id
+
+
+# The same order as the store's pages, for lists paged in memory
+def sort_key(record):
+    return -record.day, record.transaction_id or ""
+
+
+def cursor_key(after):
+    return -date.fromisoformat(after[0]).toordinal(), after[1] or ""
+
+
+def transaction_json(record):
+    return {
+        "transaction_id": record.transaction_id,
+        "date": record.date.isoformat(),
+        "name": record.name,
+        "merchant_name": record.merchant_name,
+        "amount": record.amount,
+        "category": list(record.category) if record.category else None,
+        "pending": record.pending,
+        "gambling": bool(record.gambling),
+    }
+
+
+_brotli = None
+
+
+def brotli_module():
+    global _brotli
+    if _brotli is None:
+        try:
+            import brotli  # optional: pip install brotli
+        except ImportError:
+            brotli = False
+        _brotli = brotli
+    return _brotli or None
+
+
+def negotiate_encoding(accept_encoding):
+    accepted = parse_accept_header(accept_encoding or "")
+    candidates = [e for e in ENCODINGS if e != "br" or brotli_module() is not None]
+    best = max(candidates, key=lambda e: accepted[e], default=None)
+    return best if best is not None and accepted[best] > 0 else None
+
+
+# (body, headers) for a JSON payload, compressed if it is worth it
+def encode(data, accept_encoding):
+    body = json.dumps(data, separators=(",", ":")).encode("utf-8")
+    headers = {"Vary": "Accept-Encoding"}
+    encoding = negotiate_encoding(accept_encoding) if len(body) >= API_COMPRESS_MIN_BYTES else None
+    if encoding == "br":
+        body = brotli_module().compress(body, quality=5)
+    elif encoding == "gzip":
+        body = gzip.compress(body, compresslevel=6)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return body, headers
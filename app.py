@@ -1,24 +1,35 @@
-from flask import Flask, request, jsonify, render_template, redirect, url_for
+from flask import Flask, Response, g, request, jsonify, render_template, redirect, stream_with_context, url_for
 from flask_cors import CORS
 from dotenv import load_dotenv
+from markupsafe import Markup
 import os
 import json
-import google.generativeai as genai
+from contextlib import nullcontext
 from datetime import datetime, timedelta
-from plaid.model.transactions_get_request import TransactionsGetRequest
-from plaid.model.transactions_get_request_options import TransactionsGetRequestOptions
 from datetime import date
+import queue
 import random
-
-# Plaid v8 imports
-from plaid.api import plaid_api
-from plaid.model.link_token_create_request import LinkTokenCreateRequest
-from plaid.model.link_token_create_request_user import LinkTokenCreateRequestUser
-from plaid.model.products import Products
-from plaid.model.country_code import CountryCode
-from plaid.model.item_public_token_exchange_request import ItemPublicTokenExchangeRequest
-from plaid.configuration import Configuration
-from plaid.api_client import ApiClient
+import sys
+import time
+
+import ai_pool
+import api
+import capture
+from classifier import classifier
+import clients
+import jobs
+import llm_cache
+import metrics
+import model_router
+import page_cache
+import prompts
+import scheduler
+import singleflight
+import storage
+import txn_model
+import txn_store
+import upstream
+import webhooks
 
 # Load .env values
 load_dotenv()
@@ -26,43 +37,173 @@ load_dotenv()
 app = Flask(__name__, template_folder='templates')
 CORS(app)
 
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-
-GAMBLING_KEYWORDS = ['draftkings', 'fanduel', 'betmgm', 'sportsbook', 'caesars', 'poker', 'casino']
+# Opt-in traffic capture for replay.py; installed first so its hooks see every
+# request, including ones turned away by later hooks
+if capture.CAPTURE_FILE:
+    capture.install(app)
 
 # In-memory "database"
 users = {}
 
 USERS_FILE = "users.json"
+USERS_DB = os.getenv("USERS_DB", "quitbet.db")
+USERS_BACKEND = os.getenv("USERS_BACKEND", "sqlite")  # "sqlite" or "json"
+
+# Writes are coalesced: save_users() marks users dirty, the flush happens once at
+# request teardown, or in the background every FLUSH_INTERVAL seconds /
+# FLUSH_MAX_DIRTY dirty users when PERSIST_MODE=background.
+PERSIST_MODE = os.getenv("PERSIST_MODE", "request")  # "request" or "background"
+FLUSH_INTERVAL = float(os.getenv("FLUSH_INTERVAL", "2.0"))
+FLUSH_MAX_DIRTY = int(os.getenv("FLUSH_MAX_DIRTY", "100"))
+
+user_store = storage.WriteBehindStore(
+    storage.open_store(USERS_BACKEND, USERS_FILE, USERS_DB),
+    interval=FLUSH_INTERVAL if PERSIST_MODE == "background" else None,
+    max_dirty=FLUSH_MAX_DIRTY if PERSIST_MODE == "background" else None,
+)
 
 
-# Load users from file
+# Load users from the configured backend
 def load_users():
-    if os.path.exists(USERS_FILE):
-        with open(USERS_FILE, "r") as f:
-            return json.load(f)
-    return {}
+    return user_store.load_all()
 
 
-# Save users to file
-def save_users(users):
-    with open(USERS_FILE, "w") as f:
-        json.dump(users, f, indent=2)
+# Mark users dirty; pass the email that changed so SQLite only rewrites that user
+# (and moves its saved_at, part of the dashboard's data version)
+def save_users(users, email=None):
+    if email in users:
+        users[email]["saved_at"] = time.time()
+    user_store.save(users, [email] if email else None)
+
 
+# With several worker processes (SHARED_STATE=1, set by gunicorn.conf.py) users
+# are read from SQLite on every request instead of living in one process's memory
+SHARED_STATE = os.getenv("SHARED_STATE", "0") == "1"
 
 # Initialize users dict
-users = load_users()
-
-# Set up Plaid client
-configuration = Configuration(
-    host="https://sandbox.plaid.com",
-    api_key={
-        'clientId': os.getenv("PLAID_CLIENT_ID"),
-        'secret': os.getenv("PLAID_SECRET"),
-    }
-)
-api_client = ApiClient(configuration)
-plaid_client = plaid_api.PlaidApi(api_client)
+if SHARED_STATE:
+    if USERS_BACKEND != "sqlite":
+        raise RuntimeError("SHARED_STATE=1 needs USERS_BACKEND=sqlite")
+    users = storage.SharedUsers(user_store.backend)
+else:
+    users = load_users()
+
+
+# Everything done on behalf of one request (or one scheduler job) sees a single
+# consistent copy of each user
+def user_scope():
+    return users.scope() if SHARED_STATE else nullcontext()
+
+
+@app.before_request
+def open_user_scope():
+    scope = user_scope()
+    scope.__enter__()
+    g.user_scope = scope
+
+
+@app.teardown_request
+def flush_users(exc):
+    if PERSIST_MODE == "request":
+        with metrics.span("save_users"):
+            user_store.flush()
+    scope = g.pop("user_scope", None)
+    if scope is not None:
+        scope.__exit__(None, None, None)
+
+
+# Per-request timing: every request lands in the latency histogram, and with
+# METRICS_TIMING_HEADER=1 the stage breakdown is returned as Server-Timing
+METRICS_TIMING_HEADER = os.getenv("METRICS_TIMING_HEADER", "0") == "1"
+METRICS_LOG = os.getenv("METRICS_LOG", "0") == "1"
+
+
+@app.before_request
+def start_request_timer():
+    metrics.begin_request()
+
+
+@app.after_request
+def record_request_timing(response):
+    elapsed, spans = metrics.end_request()
+    if elapsed is None:
+        return response
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    metrics.request_seconds.observe(elapsed, route=route)
+    if METRICS_TIMING_HEADER:
+        response.headers["Server-Timing"] = metrics.server_timing(spans, elapsed)
+    if METRICS_LOG:
+        stages = " ".join(f"{stage}={seconds * 1000:.1f}ms" for stage, seconds in spans)
+        print(f"⏱️ {request.method} {route} {response.status_code} {elapsed * 1000:.1f}ms {stages}")
+    return response
+
+
+# Concurrent identical work (same user's dashboard, same Plaid sync, same
+# Gemini prompt) runs once and is shared, and each user gets at most
+# USER_MAX_IN_FLIGHT requests at a time
+flights = singleflight.SingleFlight()
+admission = singleflight.Admission()
+
+
+def too_many_requests():
+    return "⏳ Too many requests in flight for this user, try again in a moment", 429, {"Retry-After": "1"}
+
+
+@app.before_request
+def admit_user():
+    email = (request.view_args or {}).get("email")
+    if email is None:
+        return None
+    if not admission.try_enter(email):
+        return too_many_requests()
+    g.admitted = email
+
+
+@app.teardown_request
+def release_user(exc):
+    email = g.pop("admitted", None)
+    if email is not None:
+        admission.leave(email)
+
+# Transactions are synced incrementally into a local store ("sync"), or fetched
+# fresh from /transactions/get on every view ("get", the old behaviour)
+PLAID_SYNC_MODE = os.getenv("PLAID_SYNC_MODE", "sync")
+SYNC_MAX_AGE = int(os.getenv("SYNC_MAX_AGE", "900"))  # seconds
+WEBHOOK_SYNC_MAX_AGE = int(os.getenv("WEBHOOK_SYNC_MAX_AGE", "21600"))  # with webhooks, in case one is missed
+TXN_WINDOW_DAYS = int(os.getenv("TXN_WINDOW_DAYS", "30"))
+# PLAID_SYNC_MODE=get pages through /transactions/get TXN_PAGE_SIZE at a time
+# (Plaid allows up to 500) and never asks for more than TXN_MAX_WINDOW_DAYS
+TXN_PAGE_SIZE = int(os.getenv("TXN_PAGE_SIZE", "500"))
+TXN_MAX_WINDOW_DAYS = int(os.getenv("TXN_MAX_WINDOW_DAYS", "730"))
+TXN_DB = os.getenv("TXN_DB", USERS_DB)
+# With a webhook URL, Plaid tells /plaid/webhook when an Item has new
+# transactions and a background job syncs them, so page views only read the
+# local store
+PLAID_WEBHOOK_URL = os.getenv("PLAID_WEBHOOK_URL")
+
+transaction_store = txn_store.TransactionStore(TXN_DB)
+
+# "1" sends the dashboard immediately and streams the Gemini panels over SSE;
+# ?stream=0/1 overrides it per request
+STREAM_DASHBOARD = os.getenv("STREAM_DASHBOARD", "0")
+
+# Plaid and Gemini clients are built on first use (see clients.py) to keep cold
+# starts fast. Tests and benchmarks may assign fakes to these directly.
+plaid_client = None
+async_plaid = None  # asgi.py
+genai = None
+
+
+def get_plaid_client():
+    return clients.once(sys.modules[__name__], "plaid_client", clients.build_plaid_client)
+
+
+def get_async_plaid():
+    return clients.once(sys.modules[__name__], "async_plaid", clients.build_async_plaid)
+
+
+def get_genai():
+    return clients.once(sys.modules[__name__], "genai", clients.load_genai)
 
 
 @app.route('/')
@@ -80,7 +221,7 @@ def signup():
             return "User already exists", 400
 
         users[email] = {'password': password}
-        save_users(users)  # 🔄 Save to file
+        save_users(users, email)  # 🔄 Save to store
         return redirect(url_for('login'))
 
     return render_template('signup.html')
@@ -112,7 +253,7 @@ def show_survey(email):
             "goal_to_save": goal,
             "limit": 500  # fixed cap
         }
-        save_users(users)
+        save_users(users, email)
 
         return redirect(url_for('get_transactions', email=email))
 
@@ -121,6 +262,12 @@ def show_survey(email):
 
 @app.route('/connect_bank/<email>')
 def connect_bank(email):
+    # Plaid v8 imports
+    from plaid.model.link_token_create_request import LinkTokenCreateRequest
+    from plaid.model.link_token_create_request_user import LinkTokenCreateRequestUser
+    from plaid.model.products import Products
+    from plaid.model.country_code import CountryCode
+
     user_id = f"user_{abs(hash(email)) % 100000}"  # Safe, unique ID
 
     request_data = LinkTokenCreateRequest(
@@ -128,9 +275,10 @@ def connect_bank(email):
         client_name="QuitBet",
         products=[Products("transactions")],
         country_codes=[CountryCode("US")],
-        language="en"
+        language="en",
+        **({"webhook": PLAID_WEBHOOK_URL} if PLAID_WEBHOOK_URL else {})
     )
-    response = plaid_client.link_token_create(request_data)
+    response = get_plaid_client().link_token_create(request_data)
     link_token = response.link_token
     return render_template('connect_bank.html', link_token=link_token, email=email)
 
@@ -141,139 +289,283 @@ def exchange_token():
     public_token = data['public_token']
     email = data['email']
 
+    from plaid.model.item_public_token_exchange_request import ItemPublicTokenExchangeRequest
+
     exchange_request = ItemPublicTokenExchangeRequest(public_token=public_token)
-    exchange_response = plaid_client.item_public_token_exchange(exchange_request)
-    access_token = exchange_response.access_token
+    exchange_response = get_plaid_client().item_public_token_exchange(exchange_request)
+    store_access_token(email, exchange_response.access_token, exchange_response.item_id)
+
+    return jsonify({'message': '✅ Bank connected successfully!'})
 
-    # Store the token
+
+# Store the token (and the Item id webhooks refer to)
+def store_access_token(email, access_token, item_id):
     if email in users:
         users[email]['access_token'] = access_token
-        save_users(users)  # 🔄 Save to file
+        users[email]['item_id'] = item_id
+        transaction_store.reset(email)
+        save_users(users, email)  # 🔄 Save to store
+        if PLAID_WEBHOOK_URL:
+            user_store.flush()  # the job runs on another thread
+            webhook_jobs.submit(item_id, ingest_user, email)
 
-    return jsonify({'message': '✅ Bank connected successfully!'})
 
+# Each task goes to its own Gemini tier and generation config (model_router.py)
+router = model_router.ModelRouter(get_genai)
+
+
+# All Gemini generations go through here so identical prompts are answered
+# from the response cache instead of another round trip. With `on_chunk` the
+# response is streamed and each piece of text is passed on as it arrives.
+def generate_text(task, prompt, on_chunk=None):
+    def generate():
+        with metrics.span(f"gemini_{task}"):
+            return router.generate(task, prompt, on_chunk)
+
+    def generate_once():
+        return flights.do(("gemini", llm_cache.make_key(router.model_name(task), prompt)), generate)
 
-def generate_gemini_insight(email, txns, gambling_txns):
-    if not txns:
-        return "No recent transactions found."
+    return llm_cache.cache.get_or_generate(task, router.model_name(task), prompt, generate_once)
 
-    if gambling_txns:
-        prompt = f"""
-        You're QuitBet, an AI trained to help people quit gambling.
 
-        User: {email}
-        Here are recent transactions:
-        {txns}
+INSIGHT_UNAVAILABLE = "⚠️ Your insight is taking longer than usual. Refresh in a moment to see it."
+NO_TRANSACTIONS = "No recent transactions found."
 
-        These appear to be gambling-related:
-        {gambling_txns}
 
-        Generate a 1–2 sentence helpful reflection or alert, like:
-        “You bet $300 this week, mostly after 10 PM. Let’s talk about setting limits.”
+def generate_gemini_checkin(email, days_clean, on_chunk=None):
+    prompt = prompts.checkin_prompt(days_clean)
+    return generate_text("checkin", prompt, on_chunk)
 
-        Be supportive, helpful, and motivational.
-        """
+
+# Streak and money-saved bookkeeping for one user; safe to call repeatedly
+def update_progress(email, found_gambling, today):
+    user = users[email]
+
+    # Load progress for user (or initialize if missing)
+    progress = user.get("progress", {
+        "last_gambling_date": None,
+        "days_clean": 0,
+        "money_saved": 0.0
+    })
+
+    # Use saved estimate if exists, or assign random and save it
+    if "daily_spend_estimate" not in user:
+        user["daily_spend_estimate"] = random.randint(30, 100)
+
+    estimate = user["daily_spend_estimate"]
+
+    if found_gambling:
+        # Update last gambling date and reset streak
+        progress["last_gambling_date"] = today.isoformat()
+        progress["days_clean"] = 0
+        progress["money_saved"] = 0.0
     else:
-        prompt = f"""
-        You're QuitBet, an AI trained to support people trying to quit gambling.
+        last_date = progress.get("last_gambling_date")
+        if last_date:
+            days_since = (today - datetime.fromisoformat(last_date).date()).days
+        else:
+            days_since = 1  # First day if no previous gambling
 
-        User: {email}
-        Here are recent transactions:
-        {txns}
+        # Only update if it's a new clean day
+        if days_since > progress["days_clean"]:
+            progress["days_clean"] = days_since
+            progress["money_saved"] = days_since * estimate
 
-        No gambling activity was detected.
+    progress["computed_on"] = today.isoformat()
 
-        Generate a short encouraging message like:
-        “Great job staying on track! You’ve made 7 healthy choices this week.”
+    # Save updated progress to the user store
+    user["progress"] = progress
+    save_users(users, email)
+    return progress
 
-        Your tone should be warm, motivating, and a little personalized.
-        """
 
-    model = genai.GenerativeModel("models/gemini-1.5-pro")  # or "gemini-1.5-flash"
-    response = model.generate_content(prompt)
-    return response.text
+# Scheduler job: refresh one user's transactions, progress and today's
+# check-in message ahead of their next visit
+def precompute_user(email, force_sync=False):
+    user = users.get(email, {})
+    access_token = user.get("access_token")
+    if not access_token:
+        return
 
+    today = datetime.today().date()
+    today_str = today.isoformat()
 
-def generate_gemini_checkin(email, days_clean):
-    prompt = f"""
-    You're QuitBet, an AI coach helping users quit gambling.
+    if PLAID_SYNC_MODE == "sync" and (force_sync or transaction_store.is_stale(email, SYNC_MAX_AGE)):
+        # One token per /transactions/sync page, like the page-by-page mode below
+        sync_transactions(email, access_token, before_call=scheduler.plaid_limiter.acquire)
 
-    This user is on day {days_clean} of their clean streak.
+    start_date = today - timedelta(days=TXN_WINDOW_DAYS)
+    if PLAID_SYNC_MODE == "sync":
+        found_gambling = any(classifier.classify(transaction_store.list_transactions(email, start_date, today)))
+    else:
+        # Classify page by page and stop fetching at the first bet
+        found_gambling = False
+        pages = iter_transaction_pages(access_token, start_date, today)
+        while not found_gambling:
+            scheduler.plaid_limiter.acquire()  # one token per page request
+            page = next(pages, None)
+            if page is None:
+                break
+            found_gambling = any(classifier.classify(page))
 
-    Write a short, friendly, motivational daily check-in message. Be personal, positive, and ask a reflective question.
+    progress = update_progress(email, found_gambling, today)
 
-    Examples:
-    - "It's Day 3 clean, Stanley! What's one thing that helped you resist yesterday?"
-    - "4 days strong — incredible. Want to reflect on your proudest moment this week?"
+    if progress.get("checkin_for") != today_str and progress.get("last_checkin_date") != today_str:
+        with scheduler.gemini_limiter:
+            progress["checkin_message"] = generate_gemini_checkin(email, progress["days_clean"])
+        progress["checkin_for"] = today_str
+        save_users(users, email)
 
-    Limit to 1–2 sentences.
-    """
 
-    model = genai.GenerativeModel("models/gemini-1.5-pro")
-    response = model.generate_content(prompt)
-    return response.text
+def run_sweep():
+    def job(email):
+        with user_scope():
+            precompute_user(email)
 
+    emails = [email for email, user in list(users.items()) if user.get("access_token")]
+    result = scheduler.sweep(emails, job)
+    user_store.flush()
+    return result
 
 
-def generate_gemini_question(email, transactions, days_clean):
-    simplified_txns = []
-    for txn in transactions[-5:]:
-        try:
-            date_val = txn["date"]
-            if isinstance(date_val, date):  # If it's a datetime.date object
-                date_val = date_val.isoformat()
-
-            simplified_txns.append({
-                "name": txn["name"],
-                "amount": txn["amount"],
-                "date": date_val
-            })
-        except Exception:
-            simplified_txns.append({
-                "name": getattr(txn, "name", "N/A"),
-                "amount": getattr(txn, "amount", "N/A"),
-                "date": str(getattr(txn, "date", "N/A"))
-            })
+def fetch_webhook_key(kid):
+    from plaid.model.webhook_verification_key_get_request import WebhookVerificationKeyGetRequest
 
-    prompt = f"""
-    You're QuitBet, an AI assistant helping people quit gambling.
+    response = get_plaid_client().webhook_verification_key_get(WebhookVerificationKeyGetRequest(key_id=kid))
+    return response["key"]
 
-    You are about to ask the user a **personalized question** based on their recent activity.
 
-    Here are the last few transactions:
-    {json.dumps(simplified_txns, indent=2)}
+webhook_keys = webhooks.KeyCache(fetch_webhook_key)
+webhook_dedupe = webhooks.Deduper()
+webhook_jobs = jobs.JobQueue(name="webhook-jobs")
 
-    They are currently on day {days_clean} of their clean streak.
 
-    Generate one short, meaningful question to help them reflect on their behavior, progress, or emotions. Use a supportive tone.
-    """
+def find_user_by_item(item_id):
+    if SHARED_STATE:
+        return user_store.backend.email_for_item(item_id)
+    for email, user in list(users.items()):
+        if user.get("item_id") == item_id:
+            return email
+    return None
 
-    model = genai.GenerativeModel("models/gemini-1.5-pro")
-    response = model.generate_content(prompt)
-    return response.text.strip()
 
+# Webhook job: pull the Item's new transactions into the store, then reclassify
+# and update progress and today's check-in before the user's next visit
+def ingest_user(email):
+    with user_scope():
+        precompute_user(email, force_sync=True)
+    user_store.flush()
 
-@app.route('/transactions/<email>')
-def get_transactions(email):
-    access_token = users.get(email, {}).get('access_token')
-    if not access_token:
-        return "❌ No access token for this user", 400
 
-    start_date = date.today() - timedelta(days=30)
-    end_date = date.today()
+@app.route('/plaid/webhook', methods=['POST'])
+def plaid_webhook():
+    body = request.get_data()
+    if webhooks.WEBHOOK_VERIFY:
+        try:
+            token = webhooks.verify(body, request.headers.get("Plaid-Verification"), webhook_keys)
+        except webhooks.WebhookError as e:
+            print(f"⚠️ Rejected Plaid webhook: {e}")
+            return jsonify({"error": str(e)}), 401
+
+        # Plaid retries anything that isn't a 200, so everything below acknowledges.
+        # Without verification there is no delivery id; the job queue still
+        # collapses a burst for one Item into one sync.
+        if webhook_dedupe.seen(webhooks.delivery_key(token)):
+            return jsonify({"status": "duplicate"})
+
+    payload = json.loads(body or b"{}")
+    if (payload.get("webhook_type") != "TRANSACTIONS"
+            or payload.get("webhook_code") not in webhooks.TRANSACTION_CODES):
+        return jsonify({"status": "ignored"})
+
+    item_id = payload.get("item_id")
+    email = find_user_by_item(item_id)
+    if email is None:
+        print(f"⚠️ Plaid webhook for unknown item {item_id}")
+        return jsonify({"status": "unknown_item"})
+
+    queued = webhook_jobs.submit(item_id, ingest_user, email)
+    return jsonify({"status": "queued" if queued else "already_queued"})
+
+
+# Pages of transactions straight from /transactions/get, oldest allowed start
+# clamped to TXN_MAX_WINDOW_DAYS
+def iter_transaction_pages(access_token, start_date, end_date):
+    start_date = max(start_date, end_date - timedelta(days=TXN_MAX_WINDOW_DAYS))
+    return txn_store.iter_transaction_pages(get_plaid_client(), access_token, start_date, end_date,
+                                            TXN_PAGE_SIZE)
+
+
+# Only go upstream when the local copy is older than SYNC_MAX_AGE; with
+# webhooks the store is kept current in the background, so only an Item that
+# has never been synced, or whose webhooks haven't arrived for
+# WEBHOOK_SYNC_MAX_AGE, is fetched inline
+def sync_is_due(email):
+    if PLAID_WEBHOOK_URL:
+        return transaction_store.is_stale(email, WEBHOOK_SYNC_MAX_AGE)
+    return transaction_store.is_stale(email, SYNC_MAX_AGE)
+
+
+# One /transactions/sync loop per user at a time; concurrent callers share it.
+# `before_call` runs before each Plaid request (see txn_store.sync_user)
+def sync_transactions(email, access_token, before_call=None):
+    return flights.do(("plaid_sync", email), lambda: txn_store.sync_user(
+        get_plaid_client(), transaction_store, email, access_token, before_call))
+
+
+# Bring the stored copy up to date if it is due; a failed sync falls back to
+# what is stored, unless nothing is
+def refresh_transactions(email, access_token):
+    if PLAID_SYNC_MODE == "sync" and sync_is_due(email):
+        try:
+            sync_transactions(email, access_token)
+        except Exception as e:
+            if transaction_store.get_cursor(email) is None:
+                raise
+            print(f"⚠️ Plaid sync failed for {email}, serving stored transactions: {e}")
 
-    txn_request = TransactionsGetRequest(
-        access_token=access_token,
-        start_date=start_date,
-        end_date=end_date,
-        options=TransactionsGetRequestOptions(count=20)
-    )
 
-    reflect_state = request.args.get("reflect", "ask")
+def fetch_transactions(email, access_token, start_date, end_date):
+    if PLAID_SYNC_MODE == "get":
+        return [txn for page in iter_transaction_pages(access_token, start_date, end_date) for txn in page]
 
-    response = plaid_client.transactions_get(txn_request)
-    txns = response['transactions']
+    refresh_transactions(email, access_token)
+    return transaction_store.list_transactions(email, start_date, end_date)
 
+
+def transaction_window():
+    return date.today() - timedelta(days=TXN_WINDOW_DAYS), date.today()
+
+
+# Version stamp of everything the dashboard is built from (page_cache.py). None
+# when there is nothing stable to stamp: /transactions/get fetches live, and
+# demo users get made-up rows on every view.
+def data_version(email):
+    if PLAID_SYNC_MODE == "get" or email.endswith("@example.com"):
+        return None
+    txns, txns_changed = transaction_store.version(email)
+    return page_cache.DataVersion(email, txns, txns_changed, users.get(email, {}).get("saved_at"),
+                                  date.today().isoformat(), classifier.version)
+
+
+# Everything the dashboard shows except the Gemini panels. Concurrent loads
+# for the same user (double clicks, several tabs) share one computation.
+def load_dashboard(email, access_token):
+    def load():
+        start_date, end_date = transaction_window()
+        # Read before the fetch: a sync landing in between leaves fragments
+        # cached under the older version, never stale ones under the newer
+        version = data_version(email)
+        with metrics.span("plaid_fetch"):
+            txns = fetch_transactions(email, access_token, start_date, end_date)
+        return build_dashboard(email, txns, version)
+
+    return flights.do(("dashboard", email), load)
+
+
+# Classification, progress and analytics for fetched transactions; no upstream
+# calls, so the async app (asgi.py) shares it as well
+def build_dashboard(email, txns, version=None):
     # Add fake gambling transactions for demo/testing purposes
     fake_gambling_sources = [
         "DraftKings Sportsbook", "FanDuel", "BetMGM", "Caesars Casino", "PokerStars",
@@ -292,108 +584,471 @@ def get_transactions(email):
                 "winnings": round(random.uniform(-amount, amount), 2)
             })
 
-    gambling_txns = [
-        txn for txn in txns
-        if any(kw in txn['name'].lower() for kw in GAMBLING_KEYWORDS)
-    ]
-
-    # Load progress for user (or initialize if missing)
-    progress = users[email].get("progress", {
-        "last_gambling_date": None,
-        "days_clean": 0,
-        "money_saved": 0.0
-    })
+    # One normalized record per transaction: dates as ordinals, merchant key and
+    # gambling flag computed once, then a single sort (newest first)
+    with metrics.span("classify"):
+        txns = txn_model.sort_newest_first(txn_model.classify(txn_model.from_plaid(txns), classifier))
+        gambling_txns = [txn for txn in txns if txn.gambling]
 
     today = datetime.today().date()
-    # Use user-specific estimate, or default to 40
-    # Use saved estimate if exists, or assign random and save it
-    if "daily_spend_estimate" not in users[email]:
-        users[email]["daily_spend_estimate"] = random.randint(30, 100)
-        save_users(users)  # Save updated estimate permanently
+    today_str = today.isoformat()
 
-    estimate = users[email]["daily_spend_estimate"]
+    # Progress is normally precomputed by the scheduler; only recompute when it
+    # hasn't run today, or when this view found gambling the sweep didn't see
+    progress = users[email].get("progress")
+    if (progress is None or progress.get("computed_on") != today_str
+            or (gambling_txns and progress.get("days_clean"))):
+        progress = update_progress(email, bool(gambling_txns), today)
+
+    # Daily totals, rolling sums and behaviour patterns for the chart and prompts
+    import analytics
+
+    with metrics.span("analytics"):
+        patterns = analytics.analyze(txn_model.columns(txns), today, users[email].get("weekly_checkin"))
+
+    return {
+        "txns": txns,
+        "gambling_txns": gambling_txns,
+        "progress": progress,
+        "estimate": users[email]["daily_spend_estimate"],
+        "today_str": today_str,
+        "patterns": patterns,
+        "chart_data": analytics.chart_points(patterns),
+        "version": version,
+    }
 
-    if gambling_txns:
-        # Update last gambling date and reset streak
-        progress["last_gambling_date"] = today.isoformat()
-        progress["days_clean"] = 0
-        progress["money_saved"] = 0.0
-    else:
-        last_date = progress.get("last_gambling_date")
-        if last_date:
-            days_since = (today - datetime.fromisoformat(last_date).date()).days
-        else:
-            days_since = 1  # First day if no previous gambling
 
-        # Only update if it's a new clean day
-        if days_since > progress["days_clean"]:
-            progress["days_clean"] = days_since
-            progress["money_saved"] = days_since * estimate
+# The Gemini panels this view needs, as {panel: prompt}, plus a check-in the
+# scheduler already generated, if any. An insight prompt of None means there
+# is nothing to reflect on.
+def plan_ai_panels(email, dashboard, reflect_state):
+    txns = dashboard["txns"]
+    progress = dashboard["progress"]
+
+    panel_prompts = {"insight": None}
+    if txns:
+        checkin = users.get(email, {}).get("weekly_checkin")
+        panel_prompts["insight"] = prompts.insight_prompt(email, txns, dashboard["gambling_txns"], checkin,
+                                                          dashboard["patterns"])
+
+    # Only generate a question if the user agrees
+    if reflect_state == "yes":
+        panel_prompts["question"] = prompts.question_prompt(txns, dashboard["gambling_txns"],
+                                                            progress["days_clean"])
+
+    # Gemini Daily Check-in Message (precomputed by the scheduler when it can be)
+    daily_checkin = None
+    if progress.get("last_checkin_date") != dashboard["today_str"]:
+        if progress.get("checkin_for") == dashboard["today_str"]:
+            daily_checkin = progress.get("checkin_message")
+        else:
+            panel_prompts["checkin"] = prompts.checkin_prompt(progress["days_clean"])
+
+    return panel_prompts, daily_checkin
+
+
+def generate_panel(panel, prompt, on_chunk=None):
+    if prompt is None:
+        return NO_TRANSACTIONS
+    text = generate_text(panel, prompt, on_chunk)
+    return text.strip() if panel == "question" else text
+
+
+# Kick off the Gemini panels on the shared pool. The three calls are
+# independent, so they run side by side and the page waits for the slowest one,
+# not the sum. Returns {panel: future} plus a precomputed check-in, if any.
+def start_ai_panels(email, dashboard, reflect_state, on_chunk=None):
+    def chunks_for(panel):
+        return (lambda delta: on_chunk(panel, delta)) if on_chunk else None
+
+    panel_prompts, daily_checkin = plan_ai_panels(email, dashboard, reflect_state)
+    futures = {panel: ai_pool.submit(generate_panel, panel, prompt, chunks_for(panel))
+               for panel, prompt in panel_prompts.items()}
+    return futures, daily_checkin
+
+
+# Only mark today's check-in as done if it was actually generated
+def record_checkin_shown(email, dashboard, daily_checkin):
+    if daily_checkin:
+        dashboard["progress"]["last_checkin_date"] = dashboard["today_str"]
+        # A coalesced dashboard may hold another request's copy of the user
+        users[email].setdefault("progress", dashboard["progress"])["last_checkin_date"] = dashboard["today_str"]
+        save_users(users, email)
+
+
+# The tables and chart JSON are rendered once per data version and reused
+def render_dashboard(email, dashboard, reflect_state, stream=False, ai_insight=None,
+                     personal_question=None, daily_checkin=None):
+    progress = dashboard["progress"]
+    version = dashboard.get("version")
+
+    def fragment(name, render):
+        return page_cache.fragments.get_or_render(version and version.fragment_key(name), render)
+
+    with metrics.span("render"):
+        tables = fragment("tables", lambda: Markup(render_template(
+            "partials/transaction_tables.html", transactions=dashboard["txns"],
+            gambling=dashboard["gambling_txns"])))
+        chart_data = fragment("chart", lambda: json.dumps(dashboard["chart_data"]))
+        return render_template(
+            "transactions.html",
+            daily_spend_estimate=dashboard["estimate"],
+            tables=tables,
+            email=email,
+            insight=ai_insight,
+            days_clean=progress["days_clean"],
+            money_saved=progress["money_saved"],
+            daily_checkin=daily_checkin,
+            personal_question=personal_question,
+            reflect_state=reflect_state,
+            chart_data=chart_data,
+            stream=stream,
+        )
 
-    # Save updated progress to users.json
-    users[email]["progress"] = progress
-    save_users(users)
 
-    # Convert all transaction dates to datetime.date objects
-    for txn in txns:
-        if isinstance(txn['date'], str):
-            txn['date'] = datetime.fromisoformat(txn['date']).date()
+@app.route('/transactions/<email>')
+def get_transactions(email):
+    access_token = users.get(email, {}).get('access_token')
+    if not access_token:
+        return "❌ No access token for this user", 400
 
-    # Sort transactions by date (newest first)
-    txns.sort(key=lambda x: x['date'], reverse=True)
+    reflect_state = request.args.get("reflect", "ask")  # "yes", "no", or "ask"
+    stream = request.args.get("stream", STREAM_DASHBOARD) == "1"
+
+    # Sync if due, then compare the data version with what the browser has;
+    # unchanged means a 304 and none of the work below
+    refresh_transactions(email, access_token)
+    version = data_version(email)
+    if version is not None:
+        etag = version.etag(reflect_state, stream)
+        if page_cache.is_fresh(request.headers.get("If-None-Match"), request.headers.get("If-Modified-Since"),
+                               etag, version.last_modified):
+            page_cache.not_modified.inc()
+            return "", 304, page_cache.validator_headers(etag, version.last_modified)
+
+    # Streaming mode: send the page now, the Gemini panels follow over SSE and
+    # start from the dashboard built here
+    if stream:
+        dashboard = load_dashboard(email, access_token)
+        page_cache.recent_dashboards.put(email, handoff_version(email), dashboard)
+        validators = validators_after(email, version, reflect_state, stream)
+        return render_dashboard(email, dashboard, reflect_state, stream=True), 200, validators
+
+    # Identical concurrent views wait for one run and render the same panels
+    dashboard, panels = flights.do(("transactions", email, reflect_state),
+                                   lambda: dashboard_with_panels(email, access_token, reflect_state))
+    validators = validators_after(email, version, reflect_state, stream)
+    if not panels_complete(dashboard, reflect_state, panels):
+        validators = {"Cache-Control": "no-store"}
+    return render_dashboard(email, dashboard, reflect_state, ai_insight=panels["insight"],
+                            personal_question=panels["question"],
+                            daily_checkin=panels["checkin"]), 200, validators
+
+
+# Validators for a response whose work started at version `before`. Building
+# it can save the user (progress, check-in), which moves the version, so they
+# are stamped with the version as it is now; if the transactions moved on
+# meanwhile, the older stamp is kept and the next revalidation just misses.
+def validators_after(email, before, *variant):
+    if before is None:
+        return {}
+    after = data_version(email)
+    if after is None or after.txns != before.txns:
+        after = before
+    return page_cache.validator_headers(after.etag(*variant), after.last_modified)
+
+
+# What /events checks a stream-mode page's dashboard against: the data version
+# as it is after the page's own saves (building it can update progress)
+def handoff_version(email):
+    version = data_version(email)
+    return version and version.etag()
+
+
+def dashboard_with_panels(email, access_token, reflect_state):
+    dashboard = load_dashboard(email, access_token)
+    futures, daily_checkin = start_ai_panels(email, dashboard, reflect_state)
+    with metrics.span("gemini_wait"):
+        panels = {
+            "insight": ai_pool.result_or(futures["insight"], INSIGHT_UNAVAILABLE, label="insight"),
+            "question": ai_pool.result_or(futures.get("question"), label="question"),
+            "checkin": ai_pool.result_or(futures.get("checkin"), daily_checkin, label="checkin"),
+        }
 
-    # Sort gambling transactions by date (newest first)
-    gambling_txns.sort(key=lambda x: x['date'], reverse=True)
+    record_checkin_shown(email, dashboard, panels["checkin"])
+    return dashboard, panels
 
-    # Save updated progress to users.json
-    users[email]["progress"] = progress
-    save_users(users)
 
-    ai_insight = generate_gemini_insight(email, txns, gambling_txns)
+# A page with a stand-in or missing panel isn't worth revalidating against: a
+# 304 would keep it until the data changes
+def panels_complete(dashboard, reflect_state, panels):
+    return (panels["insight"] != INSIGHT_UNAVAILABLE
+            and (reflect_state != "yes" or panels["question"] is not None)
+            and dashboard["progress"].get("last_checkin_date") == dashboard["today_str"])
 
-    reflect_state = request.args.get("reflect", "ask")  # "yes", "no", or "ask"
 
-    # Only generate a question if the user agrees
-    if reflect_state == "yes":
-        personal_question = generate_gemini_question(email, txns, progress["days_clean"])
-    else:
-        personal_question = None
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
-    # Gemini Daily Check-in Message
-    today_str = today.isoformat()
-    last_check = progress.get("last_checkin_date")
 
-    if last_check != today_str:
-        daily_checkin = generate_gemini_checkin(email, progress["days_clean"])
-        progress["last_checkin_date"] = today_str
-        save_users(users)
-    else:
-        daily_checkin = None
+# Server-sent events for the streaming dashboard: "chunk" events carry Gemini
+# output as it is generated, a "panel" event carries each finished panel, and
+# "end" closes the stream
+@app.route('/transactions/<email>/events')
+def transaction_events(email):
+    access_token = users.get(email, {}).get('access_token')
+    if not access_token:
+        return "❌ No access token for this user", 400
 
+    reflect_state = request.args.get("reflect", "ask")
+    dashboard = page_cache.recent_dashboards.get(email, handoff_version(email))
+    if dashboard is None:
+        dashboard = load_dashboard(email, access_token)
+    events = queue.Queue()
+
+    futures, daily_checkin = start_ai_panels(
+        email, dashboard, reflect_state,
+        on_chunk=lambda panel, delta: events.put(("chunk", {"panel": panel, "delta": delta})))
+    for panel, future in futures.items():
+        future.add_done_callback(lambda f, panel=panel: events.put(("done", panel)))
+
+    fallbacks = {"insight": INSIGHT_UNAVAILABLE, "question": None, "checkin": None}
+
+    def generate():
+        if "checkin" not in futures:
+            record_checkin_shown(email, dashboard, daily_checkin)
+            yield sse("panel", {"panel": "checkin", "text": daily_checkin})
+
+        pending = set(futures)
+        deadline = time.monotonic() + ai_pool.AI_TIMEOUT
+        while pending:
+            try:
+                kind, payload = events.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if kind == "chunk":
+                yield sse("chunk", payload)
+                continue
+            pending.discard(payload)
+            text = ai_pool.result_or(futures[payload], fallbacks[payload], label=payload)
+            if payload == "checkin":
+                record_checkin_shown(email, dashboard, text)
+            yield sse("panel", {"panel": payload, "text": text})
+
+        # Anything still running past the deadline degrades to its fallback
+        for panel in pending:
+            futures[panel].cancel()
+            yield sse("panel", {"panel": panel, "text": fallbacks[panel]})
+
+        if PERSIST_MODE == "request":
+            user_store.flush()
+        yield sse("end", {})
+
+    return Response(stream_with_context(generate()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+# JSON API (api.py): the dashboard's data without the page or any Gemini call.
+# Responses are stamped with the same data version as the page, so a polling
+# client revalidating unchanged data gets a 304.
+@app.errorhandler(api.APIError)
+def api_error(e):
+    return jsonify({"error": str(e)}), e.status
+
+
+def api_access_token(email):
+    access_token = users.get(email, {}).get("access_token")
+    if not access_token:
+        raise api.APIError("No access token for this user", 404)
+    refresh_transactions(email, access_token)
+    return access_token
+
+
+def api_window():
+    days = api.int_arg(request.args.get("days"), "days", TXN_WINDOW_DAYS, TXN_MAX_WINDOW_DAYS)
+    return date.today() - timedelta(days=days), date.today()
+
+
+def api_response(email, build):
+    version = data_version(email)
+    variant = ("api", request.path, request.query_string)
+    if version is not None:
+        etag = version.etag(*variant)
+        if page_cache.is_fresh(request.headers.get("If-None-Match"), request.headers.get("If-Modified-Since"),
+                               etag, version.last_modified):
+            page_cache.not_modified.inc()
+            return "", 304, page_cache.validator_headers(etag, version.last_modified)
+
+    data = build()
+    validators = validators_after(email, version, *variant)  # /progress saves
+    body, headers = api.encode(data, request.headers.get("Accept-Encoding"))
+    return Response(body, mimetype="application/json", headers={**validators, **headers})
+
+
+# Classified records for the window, newest first
+def api_records(email, access_token, start_date, end_date):
+    txns = txn_model.from_plaid(fetch_transactions(email, access_token, start_date, end_date))
+    return txn_model.sort_newest_first(txn_model.classify(txns, classifier))
+
+
+# Chunks of records after the cursor, in page order. The store is paged with
+# SQL; /transactions/get (PLAID_SYNC_MODE=get) is fetched whole and paged here.
+def iter_api_transactions(email, access_token, start_date, end_date, after, chunk):
+    if PLAID_SYNC_MODE == "get":
+        records = sorted(txn_model.from_plaid(fetch_transactions(email, access_token, start_date, end_date)),
+                         key=api.sort_key)
+        if after is not None:
+            start = api.cursor_key(after)
+            records = [r for r in records if api.sort_key(r) > start]
+        yield records
+        return
+
+    while True:
+        rows = transaction_store.page(email, start_date, end_date, after, chunk)
+        if rows:
+            yield txn_model.from_plaid(rows)
+        if len(rows) < chunk:
+            return
+        after = (rows[-1]["date"], rows[-1]["transaction_id"])
+
+
+@app.route('/api/v1/users/<email>/transactions')
+def api_transactions(email):
+    access_token = api_access_token(email)
+    limit = api.int_arg(request.args.get("limit"), "limit", api.API_PAGE_SIZE, api.API_MAX_PAGE_SIZE)
+    fields = api.fields_arg(request.args.get("fields"), api.TRANSACTION_FIELDS)
+    after = api.decode_cursor(request.args.get("cursor"))
+    gambling_only = request.args.get("gambling") == "1"
+    start_date, end_date = api_window()
+
+    def build():
+        # One row past the page tells whether there is another; with
+        # gambling=1 keep reading until the page is full
+        page = []
+        for records in iter_api_transactions(email, access_token, start_date, end_date, after, limit + 1):
+            txn_model.classify(records, classifier)
+            page.extend(r for r in records if r.gambling or not gambling_only)
+            if len(page) > limit:
+                break
+        has_more = len(page) > limit
+        page = page[:limit]
+        return {
+            "transactions": [api.project(api.transaction_json(r), fields) for r in page],
+            "next_cursor": api.encode_cursor(page[-1]) if has_more else None,
+            "has_more": has_more,
+        }
 
-    # Reuse existing filtered gambling_txns list
-    chart_data = [
-        {
-            "date": txn["date"].isoformat() if isinstance(txn["date"], date) else txn["date"],
-            "amount": txn["amount"]
+    return api_response(email, build)
+
+
+@app.route('/api/v1/users/<email>/progress')
+def api_progress(email):
+    access_token = api_access_token(email)
+    fields = api.fields_arg(request.args.get("fields"), api.PROGRESS_FIELDS)
+
+    def build():
+        # Same rule as build_dashboard: recompute once a day unless the
+        # scheduler already has
+        today = date.today()
+        progress = users[email].get("progress")
+        if progress is None or progress.get("computed_on") != today.isoformat():
+            start_date, end_date = transaction_window()
+            records = api_records(email, access_token, start_date, end_date)
+            progress = update_progress(email, any(r.gambling for r in records), today)
+        # Only a check-in the scheduler already generated; never a new one
+        checkin = progress.get("checkin_message") if progress.get("checkin_for") == today.isoformat() else None
+        data = {
+            "days_clean": progress["days_clean"],
+            "money_saved": progress["money_saved"],
+            "last_gambling_date": progress.get("last_gambling_date"),
+            "daily_spend_estimate": users[email].get("daily_spend_estimate"),
+            "computed_on": progress.get("computed_on"),
+            "checkin_message": checkin,
         }
-        for txn in gambling_txns
-    ]
+        return api.project(data, fields)
+
+    return api_response(email, build)
+
+
+@app.route('/api/v1/users/<email>/chart')
+def api_chart(email):
+    access_token = api_access_token(email)
+    fields = api.fields_arg(request.args.get("fields"), api.CHART_FIELDS)
+    start_date, end_date = api_window()
+
+    def build():
+        import analytics
+
+        records = api_records(email, access_token, start_date, end_date)
+        patterns = analytics.analyze(txn_model.columns(records), date.today(), users[email].get("weekly_checkin"))
+        data = {"points": analytics.chart_points(patterns), **patterns}
+        del data["daily"]  # same list as points
+        return api.project(data, fields)
+
+    return api_response(email, build)
+
+
+metrics.register(metrics.Gauge(
+    "quitbet_pending_user_writes", "Users marked dirty but not yet flushed",
+    lambda: [({}, user_store.pending())]))
+metrics.register(metrics.Gauge(
+    "quitbet_webhook_jobs_waiting", "Webhook sync jobs waiting for a worker",
+    lambda: [({}, webhook_jobs.stats()["waiting"])]))
+metrics.register(metrics.Gauge(
+    "quitbet_circuit_open", "1 while an upstream circuit breaker is open",
+    lambda: [({"upstream": name}, int(state["state"] == "open"))
+             for name, state in upstream.breaker_states().items()]))
+
+background_scheduler = None
+
+WARMUP = os.getenv("WARMUP", "1") == "1"
+WARMUP_DELAY = float(os.getenv("WARMUP_DELAY", "1.0"))  # seconds after start
+
+
+# Background threads (write-behind flusher, scheduler). Threads don't survive
+# fork(), so under a pre-forking server this runs in each worker after the fork.
+def start_background_services(run_scheduler=None):
+    global background_scheduler
+    user_store.start()
+
+    # Build the SDK clients after the server is up instead of on the first request
+    if WARMUP:
+        clients.warm_up([get_plaid_client, get_genai, clients.import_request_models, clients.import_analytics],
+                        WARMUP_DELAY)
+
+    # Precompute progress and check-ins off the request path
+    if run_scheduler is None:
+        run_scheduler = os.getenv("SCHEDULER_ENABLED") == "1"
+    if run_scheduler and background_scheduler is None:
+        background_scheduler = scheduler.Scheduler(run_sweep)
+        background_scheduler.start()
+
+
+# Production entry point; see wsgi.py and gunicorn.conf.py
+def create_app(start_services=True):
+    app.config["DEBUG"] = False
+    if start_services:
+        start_background_services()
+    return app
+
+
+@app.route('/cache/stats')
+def cache_stats():
+    return jsonify({"llm": llm_cache.cache.stats(), "merchants": classifier.stats(),
+                    "webhook_jobs": webhook_jobs.stats(), "admission": admission.stats(),
+                    "in_flight": flights.in_flight(), "fragments": page_cache.fragments.stats()})
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+# Circuit breaker state for each upstream
+@app.route('/upstreams')
+def upstream_status():
+    return jsonify(upstream.breaker_states())
 
-    return render_template(
-        "transactions.html",
-        daily_spend_estimate=estimate,
-        transactions=txns,
-        gambling=gambling_txns,
-        email=email,
-        insight=ai_insight,
-        days_clean=progress["days_clean"],
-        money_saved=progress["money_saved"],
-        daily_checkin=daily_checkin,
-        personal_question=personal_question,
-        reflect_state=reflect_state,
-        chart_data=json.dumps(chart_data),
-    )
 
 @app.route('/answer_question/<email>', methods=['POST'])
 def answer_question(email):
@@ -402,7 +1057,7 @@ def answer_question(email):
     return redirect(url_for('get_transactions', email=email))
 
 if __name__ == '__main__':
-    import os
+    start_background_services()
     port = int(os.environ.get("PORT", 5000))
     app.run(debug=True, host="0.0.0.0", port=port)
 
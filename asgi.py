@@ -0,0 +1,310 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import re
+import time
+import traceback
+from urllib.parse import parse_qs
+
+from asgiref.wsgi import WsgiToAsgi
+
+# Several worker processes (uvicorn --workers N runs each in a child process,
+# or WEB_CONCURRENCY > 1) share one SQLite database, so users are read per
+# request as under gunicorn.conf.py. Set before app.py reads it.
+MULTI_WORKER = multiprocessing.parent_process() is not None or int(os.getenv("WEB_CONCURRENCY", "1")) > 1
+if MULTI_WORKER:
+    os.environ.setdefault("SHARED_STATE", "1")
+    os.environ.setdefault("LLM_CACHE_DB", os.getenv("USERS_DB", "quitbet.db"))
+    if os.environ["SHARED_STATE"] != "1":
+        raise RuntimeError("Several asgi.py workers need SHARED_STATE=1")
+
+import ai_pool
+import app as core
+import capture
+import llm_cache
+import metrics
+import page_cache
+import singleflight
+import txn_store
+
+# Async serving mode.
+#
+# connect_bank, exchange_token and transactions spend nearly all their time
+# waiting on Plaid and Gemini. Here they run as coroutines on one event loop,
+# using the async REST client for Plaid (async_clients.py) and Gemini's
+# generate_content_async, so a waiting request holds a few KB of coroutine
+# state instead of a worker thread. Everything else is the Flask app, served
+# through asgiref's WSGI adapter on its thread pool.
+#
+#   uvicorn asgi:application --host 0.0.0.0 --port $PORT --workers 4
+#
+# The handlers share storage, classification, progress, analytics, prompts and
+# rendering with app.py; only the upstream I/O differs. That shared work
+# (SQLite reads and writes, classification, rendering) is blocking, so it runs
+# on the default thread pool via asyncio.to_thread and never stalls the loop.
+
+# Requests handled at once per process; the rest wait for a slot
+ASYNC_MAX_IN_FLIGHT = int(os.getenv("ASYNC_MAX_IN_FLIGHT", "1000"))
+
+_slots = asyncio.Semaphore(ASYNC_MAX_IN_FLIGHT)
+
+# Coalescing as in app.py (flights), for coroutines; admission is shared with
+# the Flask routes
+flights = singleflight.AsyncSingleFlight()
+
+
+class Request:
+    def __init__(self, scope, body):
+        self.method = scope["method"]
+        self.path = scope["path"]
+        self.query_string = scope.get("query_string", b"")
+        self.args = {k: v[-1] for k, v in parse_qs(self.query_string.decode()).items()}
+        self.headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers", [])}
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body or b"null")
+
+
+def text_response(body, status=200, content_type="text/html; charset=utf-8", headers=None):
+    return status, content_type, body.encode(), headers or {}
+
+
+def json_response(data, status=200):
+    return status, "application/json", json.dumps(data).encode(), {}
+
+
+# Templates use url_for, which needs a request context
+def _render(req, build, headers):
+    with core.app.test_request_context(req.path, query_string=req.query_string.decode()):
+        return text_response(build(), headers=headers)
+
+
+async def render(req, build, headers=None):
+    return await asyncio.to_thread(_render, req, build, headers)
+
+
+# Cached Gemini generation, as app.generate_text but awaited
+async def generate_text(task, prompt):
+    async def generate():
+        with metrics.span(f"gemini_{task}"):
+            return await core.router.generate_async(task, prompt)
+
+    def generate_once():
+        return flights.do(("gemini", llm_cache.make_key(core.router.model_name(task), prompt)), generate)
+
+    return await llm_cache.cache.get_or_generate_async(task, core.router.model_name(task), prompt, generate_once)
+
+
+async def generate_panel(panel, prompt, fallback):
+    if prompt is None:
+        return core.NO_TRANSACTIONS
+    try:
+        text = await asyncio.wait_for(generate_text(panel, prompt), ai_pool.AI_TIMEOUT)
+    except asyncio.TimeoutError:
+        print(f"⚠️ {panel} timed out after {ai_pool.AI_TIMEOUT:.1f}s")
+        return fallback
+    except Exception as e:
+        print(f"⚠️ {panel} failed: {e}")
+        return fallback
+    return text.strip() if panel == "question" else text
+
+
+async def refresh_transactions(email, access_token):
+    if core.PLAID_SYNC_MODE == "sync" and await asyncio.to_thread(core.sync_is_due, email):
+        try:
+            await flights.do(("plaid_sync", email), lambda: txn_store.sync_user_async(
+                core.get_async_plaid(), core.transaction_store, email, access_token))
+        except Exception as e:
+            if await asyncio.to_thread(core.transaction_store.get_cursor, email) is None:
+                raise
+            print(f"⚠️ Plaid sync failed for {email}, serving stored transactions: {e}")
+
+
+async def fetch_transactions(email, access_token, start_date, end_date):
+    # /transactions/get paging has no async client; keep it off the event loop
+    if core.PLAID_SYNC_MODE == "get":
+        return await asyncio.to_thread(core.fetch_transactions, email, access_token, start_date, end_date)
+
+    await refresh_transactions(email, access_token)
+    return await asyncio.to_thread(core.transaction_store.list_transactions, email, start_date, end_date)
+
+
+async def connect_bank(req, email):
+    body = {
+        "user": {"client_user_id": f"user_{abs(hash(email)) % 100000}"},
+        "client_name": "QuitBet",
+        "products": ["transactions"],
+        "country_codes": ["US"],
+        "language": "en",
+    }
+    if core.PLAID_WEBHOOK_URL:
+        body["webhook"] = core.PLAID_WEBHOOK_URL
+    response = await core.get_async_plaid().link_token_create(body)
+    return await render(req, lambda: core.render_template('connect_bank.html', link_token=response["link_token"],
+                                                    email=email))
+
+
+async def exchange_token(req):
+    data = req.json()
+    response = await core.get_async_plaid().item_public_token_exchange({"public_token": data['public_token']})
+    await asyncio.to_thread(core.store_access_token, data['email'], response["access_token"], response["item_id"])
+    return json_response({'message': '✅ Bank connected successfully!'})
+
+
+async def load_dashboard(email, access_token):
+    start_date, end_date = core.transaction_window()
+    version = await asyncio.to_thread(core.data_version, email)  # before the fetch, as in app.load_dashboard
+    with metrics.span("plaid_fetch"):
+        txns = await fetch_transactions(email, access_token, start_date, end_date)
+    return await asyncio.to_thread(core.build_dashboard, email, txns, version)
+
+
+async def dashboard_with_panels(email, access_token, reflect_state):
+    dashboard = await flights.do(("dashboard", email), lambda: load_dashboard(email, access_token))
+
+    # The panels are independent; wait for the slowest, not the sum
+    panel_prompts, daily_checkin = await asyncio.to_thread(core.plan_ai_panels, email, dashboard, reflect_state)
+    fallbacks = {"insight": core.INSIGHT_UNAVAILABLE, "question": None, "checkin": daily_checkin}
+    with metrics.span("gemini_wait"):
+        texts = await asyncio.gather(*(generate_panel(panel, prompt, fallbacks[panel])
+                                       for panel, prompt in panel_prompts.items()))
+    panels = {"question": None, "checkin": daily_checkin, **dict(zip(panel_prompts, texts))}
+
+    await asyncio.to_thread(core.record_checkin_shown, email, dashboard, panels["checkin"])
+    return dashboard, panels
+
+
+async def get_transactions(req, email):
+    user = await asyncio.to_thread(core.users.get, email, {})
+    access_token = user.get('access_token')
+    if not access_token:
+        return text_response("❌ No access token for this user", 400)
+
+    reflect_state = req.args.get("reflect", "ask")
+    stream = req.args.get("stream", core.STREAM_DASHBOARD) == "1"
+
+    # Conditional GET as in app.get_transactions
+    await refresh_transactions(email, access_token)
+    version = await asyncio.to_thread(core.data_version, email)
+    if version is not None:
+        etag = version.etag(reflect_state, stream)
+        if page_cache.is_fresh(req.headers.get("if-none-match"), req.headers.get("if-modified-since"),
+                               etag, version.last_modified):
+            page_cache.not_modified.inc()
+            return text_response("", 304, headers=page_cache.validator_headers(etag, version.last_modified))
+
+    if stream:
+        dashboard = await flights.do(("dashboard", email), lambda: load_dashboard(email, access_token))
+        handoff = await asyncio.to_thread(core.handoff_version, email)
+        page_cache.recent_dashboards.put(email, handoff, dashboard)  # for /events
+        validators = await asyncio.to_thread(core.validators_after, email, version, reflect_state, stream)
+        return await render(req, lambda: core.render_dashboard(email, dashboard, reflect_state, stream=True),
+                            validators)
+
+    dashboard, panels = await flights.do(("transactions", email, reflect_state),
+                                         lambda: dashboard_with_panels(email, access_token, reflect_state))
+    validators = await asyncio.to_thread(core.validators_after, email, version, reflect_state, stream)
+    if not core.panels_complete(dashboard, reflect_state, panels):
+        validators = {"Cache-Control": "no-store"}
+    return await render(req, lambda: core.render_dashboard(
+        email, dashboard, reflect_state, ai_insight=panels["insight"],
+        personal_question=panels["question"], daily_checkin=panels["checkin"]), validators)
+
+
+ROUTES = [
+    ("GET", "/connect_bank/<email>", connect_bank),
+    ("POST", "/exchange_token", exchange_token),
+    ("GET", "/transactions/<email>", get_transactions),
+]
+_compiled = [(method, rule, re.compile("^" + re.sub(r"<(\w+)>", r"(?P<\1>[^/]+)", rule) + "$"), handler)
+             for method, rule, handler in ROUTES]
+
+
+async def _read_body(receive):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+
+# What Flask's request hooks in app.py do for the sync routes: per-user
+# admission, one user scope per request, a flush at the end, and the timing
+async def handle(rule, handler, params, scope, receive, send):
+    email = params.get("email")
+    if email is not None and not core.admission.try_enter(email):
+        body, status, headers = core.too_many_requests()
+        await send({"type": "http.response.start", "status": status,
+                    "headers": [(b"content-type", b"text/plain; charset=utf-8"),
+                                (b"retry-after", headers["Retry-After"].encode())]})
+        await send({"type": "http.response.body", "body": body.encode()})
+        return
+    try:
+        await _handle(rule, handler, params, scope, receive, send)
+    finally:
+        if email is not None:
+            core.admission.leave(email)
+
+
+async def _handle(rule, handler, params, scope, receive, send):
+    async with _slots:
+        req = Request(scope, await _read_body(receive))
+        started = time.time()
+        metrics.begin_request()
+        with core.user_scope():
+            try:
+                status, content_type, body, extra_headers = await handler(req, **params)
+            except Exception:
+                traceback.print_exc()
+                status, content_type, body, extra_headers = text_response(
+                    "Internal Server Error", 500, "text/plain")
+            finally:
+                if core.PERSIST_MODE == "request":
+                    with metrics.span("save_users"):
+                        await asyncio.to_thread(core.user_store.flush)
+
+        elapsed, spans = metrics.end_request()
+        metrics.request_seconds.observe(elapsed, route=rule)
+        capture.record_request(req.method, req.path, rule, req.args, {}, capture.parse_json(req.body), req.headers,
+                               status, extra_headers, started, elapsed)
+        headers = [(b"content-type", content_type.encode()), (b"content-length", str(len(body)).encode())]
+        headers += [(name.lower().encode(), value.encode()) for name, value in extra_headers.items()]
+        if core.METRICS_TIMING_HEADER:
+            headers.append((b"server-timing", metrics.server_timing(spans, elapsed).encode()))
+        if core.METRICS_LOG:
+            stages = " ".join(f"{stage}={seconds * 1000:.1f}ms" for stage, seconds in spans)
+            print(f"⏱️ {req.method} {rule} {status} {elapsed * 1000:.1f}ms {stages} (async)")
+
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            # Every worker gets a lifespan; with several, run the scheduler
+            # out of process (python scheduler.py) as gunicorn.conf.py does
+            core.start_background_services(run_scheduler=False if MULTI_WORKER else None)
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await asyncio.to_thread(core.user_store.flush)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+flask_app = WsgiToAsgi(core.app)
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+    if scope["type"] == "http":
+        for method, rule, pattern, handler in _compiled:
+            match = pattern.match(scope["path"])
+            if match and scope["method"] == method:
+                return await handle(rule, handler, match.groupdict(), scope, receive, send)
+    await flask_app(scope, receive, send)
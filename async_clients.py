@@ -0,0 +1,60 @@
+import os
+
+import upstream
+
+# Non-blocking Plaid client for the ASGI app (asgi.py).
+#
+# plaid-python is synchronous, so this talks to the Plaid REST API directly
+# over one shared httpx.AsyncClient. Requests and responses are the plain JSON
+# bodies from https://plaid.com/docs/api/ (dicts in, dicts out); client_id and
+# secret are added to every request.
+
+PLAID_HOST = "https://sandbox.plaid.com"
+
+
+class PlaidHTTPError(Exception):
+    def __init__(self, status, body):
+        super().__init__(f"Plaid returned {status}: {body.get('error_code') or body}")
+        self.status = status
+        self.body = body
+
+
+class AsyncPlaidClient:
+    def __init__(self, client_id, secret, host=PLAID_HOST, pool_size=upstream.PLAID_POOL_SIZE):
+        import httpx
+
+        self._httpx = httpx
+        self._auth = {"client_id": client_id, "secret": secret}
+        self._http = httpx.AsyncClient(
+            base_url=host,
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        )
+
+    async def _post(self, path, body, _request_timeout=None):
+        try:
+            response = await self._http.post(path, json={**self._auth, **body}, timeout=_request_timeout)
+        except self._httpx.TimeoutException as e:
+            raise TimeoutError(str(e)) from e
+        except self._httpx.TransportError as e:
+            raise ConnectionError(str(e)) from e
+        payload = response.json()
+        if response.status_code != 200:
+            raise PlaidHTTPError(response.status_code, payload)
+        return payload
+
+    async def link_token_create(self, body, _request_timeout=None):
+        return await self._post("/link/token/create", body, _request_timeout)
+
+    async def item_public_token_exchange(self, body, _request_timeout=None):
+        return await self._post("/item/public_token/exchange", body, _request_timeout)
+
+    async def transactions_sync(self, body, _request_timeout=None):
+        return await self._post("/transactions/sync", body, _request_timeout)
+
+    async def aclose(self):
+        await self._http.aclose()
+
+
+def build_async_plaid():
+    client = AsyncPlaidClient(os.getenv("PLAID_CLIENT_ID"), os.getenv("PLAID_SECRET"))
+    return upstream.ResilientAsyncPlaid(client)
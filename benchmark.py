@@ -0,0 +1,235 @@
+import argparse
+import asyncio
+import json
+import math
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+# Load test for the signup -> login -> connect_bank -> exchange_token ->
+# transactions flow, run in-process against fakes.py stand-ins.
+#
+#   python benchmark.py --users 50 --concurrency 10 --gemini-latency lognormal:1.5:0.4
+#   python benchmark.py --compare bench_results/<old>.json
+#   python benchmark.py --async --users 500 --concurrency 500   # asgi.py instead of Flask
+#
+# Results (p50/p95/p99 per route and throughput) are printed and saved as JSON
+# under bench_results/, named after the current commit.
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+# Nearest-rank percentile: the smallest value with at least pct% of the samples at or below it
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, math.ceil(pct * len(sorted_values) / 100.0) - 1))
+    return sorted_values[index]
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return "unknown"
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def record(self, route, seconds, ok):
+        with self._lock:
+            self.samples.setdefault(route, []).append(seconds)
+            if not ok:
+                self.errors[route] = self.errors.get(route, 0) + 1
+
+    def summary(self, wall_seconds):
+        routes = {}
+        for route, values in sorted(self.samples.items()):
+            values = sorted(values)
+            routes[route] = {
+                "requests": len(values),
+                "errors": self.errors.get(route, 0),
+                "mean_ms": round(sum(values) / len(values) * 1000, 2),
+                "p50_ms": round(percentile(values, 50) * 1000, 2),
+                "p95_ms": round(percentile(values, 95) * 1000, 2),
+                "p99_ms": round(percentile(values, 99) * 1000, 2),
+                "throughput_rps": round(len(values) / wall_seconds, 2),
+            }
+        total = sum(len(v) for v in self.samples.values())
+        return {"routes": routes, "total_requests": total,
+                "wall_seconds": round(wall_seconds, 3), "throughput_rps": round(total / wall_seconds, 2)}
+
+
+def timed(recorder, route, fn, expect=(200, 302)):
+    started = time.perf_counter()
+    response = fn()
+    recorder.record(route, time.perf_counter() - started, response.status_code in expect)
+    return response
+
+
+def user_flow(app_module, recorder, n, views, query):
+    client = app_module.app.test_client()
+    email = f"bench{n}@bench.local"
+    form = {"email": email, "password": "bench"}
+    timed(recorder, "POST /signup", lambda: client.post("/signup", data=form))
+    timed(recorder, "POST /login", lambda: client.post("/login", data=form))
+    timed(recorder, "GET /connect_bank", lambda: client.get(f"/connect_bank/{email}"))
+    timed(recorder, "POST /exchange_token", lambda: client.post(
+        "/exchange_token", json={"public_token": f"public-{n}", "email": email}))
+    for _ in range(views):
+        timed(recorder, "GET /transactions", lambda: client.get(f"/transactions/{email}{query}"))
+
+
+async def async_timed(recorder, route, request, expect=(200, 302)):
+    started = time.perf_counter()
+    response = await request
+    recorder.record(route, time.perf_counter() - started, response.status_code in expect)
+    return response
+
+
+# The same flow against the ASGI app; signup and login go through its Flask
+# fallback, the upstream-bound routes through the async handlers
+async def async_user_flow(transport, recorder, n, views, query):
+    import httpx
+
+    email = f"bench{n}@bench.local"
+    form = {"email": email, "password": "bench"}
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await async_timed(recorder, "POST /signup", client.post("/signup", data=form))
+        await async_timed(recorder, "POST /login", client.post("/login", data=form))
+        await async_timed(recorder, "GET /connect_bank", client.get(f"/connect_bank/{email}"))
+        await async_timed(recorder, "POST /exchange_token", client.post(
+            "/exchange_token", json={"public_token": f"public-{n}", "email": email}))
+        for _ in range(views):
+            await async_timed(recorder, "GET /transactions", client.get(f"/transactions/{email}{query}"))
+
+
+async def run_async_flows(args):
+    import httpx
+    import asgi
+
+    transport = httpx.ASGITransport(app=asgi.application)
+    slots = asyncio.Semaphore(args.concurrency)
+    recorder = Recorder()
+
+    async def flow(n):
+        async with slots:
+            await async_user_flow(transport, recorder, n, args.views, args.query)
+
+    await asyncio.gather(*(flow(n) for n in range(args.users)))
+    return recorder
+
+
+# Samples the thread count while the load runs
+class ThreadWatcher:
+    def __init__(self):
+        self.peak = threading.active_count()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stopped.wait(0.05):
+            self.peak = max(self.peak, threading.active_count())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stopped.set()
+        self._thread.join()
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix="quitbet-bench-")
+    os.environ.setdefault("USERS_DB", os.path.join(workdir, "quitbet.db"))
+    os.environ.setdefault("TXN_DB", os.environ["USERS_DB"])
+    os.chdir(workdir)
+    sys.path.insert(0, ROOT)
+    warnings.filterwarnings("ignore")
+
+    import app as app_module
+    import fakes
+
+    fakes.install(app_module, args.plaid_latency, args.gemini_latency, args.error_rate, args.gemini_flash_latency)
+
+    started = time.perf_counter()
+    with ThreadWatcher() as threads:
+        if args.use_async:
+            recorder = asyncio.run(run_async_flows(args))
+        else:
+            recorder = Recorder()
+            with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+                for future in [pool.submit(user_flow, app_module, recorder, n, args.views, args.query)
+                               for n in range(args.users)]:
+                    future.result()
+    wall = time.perf_counter() - started
+
+    result = recorder.summary(wall)
+    result["mode"] = "async" if args.use_async else "sync"
+    result["peak_threads"] = threads.peak
+    result["max_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    result["config"] = {k: v for k, v in vars(args).items() if k not in ("output", "compare")}
+    result["commit"] = git_commit()
+    result["timestamp"] = datetime.now(timezone.utc).isoformat()
+    return result
+
+
+def print_summary(result, baseline=None):
+    print(f"commit {result['commit']}  {result.get('mode', 'sync')}  {result['total_requests']} requests in "
+          f"{result['wall_seconds']}s ({result['throughput_rps']} req/s)  peak threads {result.get('peak_threads')}  "
+          f"max RSS {result.get('max_rss_mb')} MB")
+    print(f"{'route':<24}{'n':>6}{'err':>5}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>9}")
+    for route, stats in result["routes"].items():
+        line = (f"{route:<24}{stats['requests']:>6}{stats['errors']:>5}{stats['p50_ms']:>10}"
+                f"{stats['p95_ms']:>10}{stats['p99_ms']:>10}{stats['throughput_rps']:>9}")
+        old = (baseline or {}).get("routes", {}).get(route)
+        if old:
+            line += f"   p95 {stats['p95_ms'] - old['p95_ms']:+.1f} ms vs {baseline['commit']}"
+        print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the QuitBet request flow against local fakes")
+    parser.add_argument("--users", type=int, default=20, help="virtual users, each runs the full flow")
+    parser.add_argument("--concurrency", type=int, default=5, help="users running at the same time")
+    parser.add_argument("--views", type=int, default=3, help="/transactions views per user")
+    parser.add_argument("--query", default="", help="query string for /transactions, e.g. ?reflect=yes")
+    parser.add_argument("--plaid-latency", default="lognormal:0.3:0.4")
+    parser.add_argument("--gemini-latency", default="lognormal:1.5:0.4")
+    parser.add_argument("--gemini-flash-latency", help="latency of flash-tier models (default: --gemini-latency)")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="drive asgi.py (async handlers) instead of the Flask app")
+    parser.add_argument("--output", help="where to write the JSON results")
+    parser.add_argument("--compare", help="earlier results JSON to diff against")
+    args = parser.parse_args()
+
+    output = args.output and os.path.abspath(args.output)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    result = run(args)
+    print_summary(result, baseline)
+
+    if output is None:
+        results_dir = os.path.join(ROOT, "bench_results")
+        os.makedirs(results_dir, exist_ok=True)
+        output = os.path.join(results_dir, f"{result['commit']}-{int(time.time())}.json")
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"📝 Results written to {output}")
@@ -0,0 +1,158 @@
+import hashlib
+import hmac
+import json
+import os
+import re
+import threading
+import time
+
+import upstream
+
+# Traffic capture for replay (replay.py).
+#
+# With CAPTURE_FILE set, every request (route, query args, form fields, JSON
+# body, the CAPTURE_HEADERS it carried, status, the validators it got back,
+# timing) and every Plaid call and Gemini attempt (request,
+# response or error, seconds) is appended to that file as one JSON line.
+# Off by default.
+#
+# Passwords, tokens and secrets are replaced with a keyed hash: the same value
+# always gets the same stand-in within a capture, so a replayed signup and
+# login, or a token exchange and the syncs that use the token, still line up.
+# The key comes from CAPTURE_SALT, or is random per process.
+
+CAPTURE_FILE = os.getenv("CAPTURE_FILE")  # unset = off
+CAPTURE_SALT = (os.getenv("CAPTURE_SALT") or os.urandom(16).hex()).encode()
+
+SECRET_NAMES = re.compile(r"password|token|secret|authorization|cookie|key", re.IGNORECASE)
+REDACTED_PREFIX = "redacted-"
+
+# Request headers that change the response (conditional GETs, compression) and
+# the response validators replay needs to translate them
+CAPTURE_HEADERS = ("If-None-Match", "If-Modified-Since", "Accept-Encoding", "Accept")
+VALIDATOR_HEADERS = ("ETag", "Last-Modified")
+
+
+def redact_value(value):
+    if value is None or isinstance(value, bool):
+        return value
+    text = str(value)
+    if text.startswith(REDACTED_PREFIX):
+        return text  # already a stand-in (replayed traffic)
+    return REDACTED_PREFIX + hmac.new(CAPTURE_SALT, text.encode(), hashlib.sha256).hexdigest()[:24]
+
+
+# Copy of a JSON-like value with every secret-looking field replaced
+def redact(value, name=""):
+    if isinstance(value, dict):
+        return {k: redact(v, k) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact(v, name) for v in value]
+    if SECRET_NAMES.search(name) and not isinstance(value, (int, float)):
+        return redact_value(value)
+    return value
+
+
+def _plain(value):
+    if isinstance(value, dict):
+        return {k: _plain(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_plain(v) for v in value]
+    if hasattr(value, "to_dict"):  # Plaid SDK models
+        return value.to_dict()
+    return value
+
+
+def _default(value):
+    return value.isoformat() if hasattr(value, "isoformat") else str(value)
+
+
+# Redacted, JSON-safe form of an upstream request or response
+def normalize(value):
+    return redact(json.loads(json.dumps(_plain(value), default=_default)))
+
+
+# Stable key for an upstream request; replay looks recorded responses up by it
+def request_key(endpoint, request):
+    return hashlib.sha256(
+        f"{endpoint}\0{json.dumps(normalize(request), sort_keys=True)}".encode()).hexdigest()[:32]
+
+
+def parse_json(body):
+    try:
+        return json.loads(body) if body else None
+    except ValueError:
+        return None
+
+
+class Writer:
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    # Opened per process, so forked workers append to the same file
+    def write(self, record):
+        line = json.dumps(record, default=_default) + "\n"
+        with self._lock:
+            if self._pid != os.getpid():
+                self._file = open(self.path, "a", encoding="utf-8")
+                self._pid = os.getpid()
+            self._file.write(line)
+            self._file.flush()
+
+
+writer = None
+
+
+# The `names` found in `headers` (any mapping, looked up case-insensitively)
+def pick_headers(headers, names):
+    lowered = {k.lower(): v for k, v in headers.items()}
+    return {name: lowered[name.lower()] for name in names if name.lower() in lowered}
+
+
+def record_request(method, path, route, args, form, body, headers, status, response_headers, started, seconds):
+    if writer is None:
+        return
+    writer.write({
+        "type": "request", "t": round(started, 6), "method": method, "path": path, "route": route,
+        "args": redact(args), "form": redact(form), "json": redact(body),
+        "headers": pick_headers(headers, CAPTURE_HEADERS), "status": status,
+        "validators": pick_headers(response_headers, VALIDATOR_HEADERS), "seconds": round(seconds, 6),
+    })
+
+
+def record_upstream(endpoint, request, response, error, seconds):
+    record = {"type": "upstream", "t": round(time.time() - seconds, 6), "endpoint": endpoint,
+              "key": request_key(endpoint, request), "seconds": round(seconds, 6)}
+    if error is None:
+        record["response"] = normalize(response)
+    else:
+        record["error"] = {"type": type(error).__name__, "message": str(error),
+                           "status": getattr(error, "status", None)}
+    writer.write(record)
+
+
+def install(flask_app, path=CAPTURE_FILE):
+    from flask import g, request
+
+    global writer
+    writer = Writer(path)
+    upstream.recorder = record_upstream
+
+    @flask_app.before_request
+    def start_capture():
+        g.capture_started = (time.time(), time.perf_counter())
+
+    @flask_app.after_request
+    def capture_request(response):
+        started = g.pop("capture_started", None)
+        if started is not None:
+            record_request(request.method, request.path, request.url_rule.rule if request.url_rule else None,
+                           request.args.to_dict(), request.form.to_dict(), request.get_json(silent=True),
+                           request.headers, response.status_code, response.headers, started[0],
+                           time.perf_counter() - started[1])
+        return response
+
+    print(f"📼 Capturing traffic to {path}")
@@ -0,0 +1,161 @@
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+
+# Gambling-merchant classifier.
+#
+# The keyword list is compiled into one trie-shaped regex, so matching a name
+# costs one scan no matter how many operator names are loaded. Verdicts are
+# memoized per merchant in a bounded LRU, and the keyword file is re-read
+# whenever it changes on disk.
+
+DEFAULT_KEYWORDS = ['draftkings', 'fanduel', 'betmgm', 'sportsbook', 'caesars', 'poker', 'casino']
+
+# Resolved now, so a caller that changes directory later (benchmark.py,
+# replay.py) still reads the same file
+GAMBLING_KEYWORDS_FILE = os.path.abspath(os.getenv(
+    "GAMBLING_KEYWORDS_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "gambling_keywords.txt")))
+MERCHANT_CACHE_SIZE = int(os.getenv("MERCHANT_CACHE_SIZE", "10000"))
+RELOAD_CHECK_INTERVAL = 5.0  # seconds between mtime checks
+
+# Plaid categories that mark a transaction as gambling regardless of its name
+GAMBLING_CATEGORIES = ("ENTERTAINMENT_CASINOS_AND_GAMBLING", "GAMBLING")
+
+
+def load_keywords(path):
+    keywords = []
+    with open(path, "r") as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip().lower()
+            if line:
+                keywords.append(line)
+    return keywords
+
+
+# Build a regex from a trie of the keywords so shared prefixes are matched once
+# ("casino", "caesars" -> "ca(?:esars|sino)")
+def compile_keywords(keywords):
+    trie = {}
+    for word in set(keywords):
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = True
+
+    def pattern(node):
+        if list(node) == [""]:
+            return ""
+        optional = "" in node
+        branches = [re.escape(char) + pattern(child) for char, child in sorted(node.items()) if char]
+        if len(branches) == 1 and not optional:
+            return branches[0]
+        group = "(?:" + "|".join(branches) + ")"
+        return group + "?" if optional else group
+
+    if not trie:
+        return re.compile(r"(?!x)x")  # matches nothing
+    return re.compile(pattern(trie))
+
+
+def merchant_key(txn):
+    return (txn.get("merchant_name") or txn.get("name") or "").strip().lower()
+
+
+def _category_text(txn):
+    parts = []
+    pfc = txn.get("personal_finance_category")
+    if pfc is not None and not isinstance(pfc, str):
+        pfc = pfc.get("detailed") or pfc.get("primary")
+    if pfc:
+        parts.append(str(pfc))
+    category = txn.get("category")
+    if category:
+        parts.extend(str(c) for c in category)
+    return " ".join(parts).upper()
+
+
+class GamblingClassifier:
+    def __init__(self, keywords_file=GAMBLING_KEYWORDS_FILE, cache_size=MERCHANT_CACHE_SIZE):
+        self.keywords_file = keywords_file
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self._verdicts = OrderedDict()
+        self._mtime = None
+        self._next_check = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.set_keywords(DEFAULT_KEYWORDS)
+        self.reload_if_changed(force=True)
+
+    def set_keywords(self, keywords):
+        regex = compile_keywords(keywords)
+        with self._lock:
+            self.keywords = list(keywords)
+            self._regex = regex
+            self._verdicts.clear()
+            # Same keywords, same version in every worker process
+            self.version = hashlib.sha1("\n".join(self.keywords).encode("utf-8")).hexdigest()[:12]
+
+    def reload_if_changed(self, force=False):
+        now = time.monotonic()
+        if not force and now < self._next_check:
+            return False
+        self._next_check = now + RELOAD_CHECK_INTERVAL
+        try:
+            mtime = os.path.getmtime(self.keywords_file)
+        except OSError:
+            return False
+        if mtime == self._mtime:
+            return False
+        self._mtime = mtime
+        self.set_keywords(load_keywords(self.keywords_file))
+        return True
+
+    def _verdict(self, txn):
+        name = txn.get("name") or ""
+        merchant = txn.get("merchant_name") or ""
+        category = _category_text(txn)
+        key = (name, merchant, category)
+
+        with self._lock:
+            verdict = self._verdicts.get(key)
+            if verdict is not None:
+                self._verdicts.move_to_end(key)
+                self.hits += 1
+                metrics.cache_events.inc(cache="merchant", result="hits")
+                return verdict
+            regex = self._regex
+
+        verdict = bool(
+            any(c in category for c in GAMBLING_CATEGORIES)
+            or regex.search(name.lower())
+            or (merchant and regex.search(merchant.lower()))
+        )
+        metrics.cache_events.inc(cache="merchant", result="misses")
+        with self._lock:
+            self.misses += 1
+            self._verdicts[key] = verdict
+            if len(self._verdicts) > self.cache_size:
+                self._verdicts.popitem(last=False)
+        return verdict
+
+    # One pass over a batch; returns a flag per transaction
+    def classify(self, txns):
+        self.reload_if_changed()
+        return [self._verdict(txn) for txn in txns]
+
+    def gambling_only(self, txns):
+        return [txn for txn, flagged in zip(txns, self.classify(txns)) if flagged]
+
+    def stats(self):
+        with self._lock:
+            return {"keywords": len(self.keywords), "cached_merchants": len(self._verdicts),
+                    "hits": self.hits, "misses": self.misses}
+
+
+classifier = GamblingClassifier()
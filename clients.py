@@ -0,0 +1,87 @@
+import os
+import threading
+import time
+
+import upstream
+
+# Plaid and Gemini SDKs are slow to import (grpc, protobuf and hundreds of
+# generated Plaid models), so nothing here is imported or built until the first
+# request needs it. warm_up() does it ahead of time on a background thread.
+
+_lock = threading.Lock()
+
+
+def build_plaid_client():
+    from plaid.api import plaid_api
+    from plaid.api_client import ApiClient
+    from plaid.configuration import Configuration
+
+    configuration = Configuration(
+        host="https://sandbox.plaid.com",
+        api_key={
+            'clientId': os.getenv("PLAID_CLIENT_ID"),
+            'secret': os.getenv("PLAID_SECRET"),
+        }
+    )
+    configuration.connection_pool_maxsize = upstream.PLAID_POOL_SIZE
+    api_client = ApiClient(configuration)
+    return upstream.ResilientPlaid(plaid_api.PlaidApi(api_client))
+
+
+# Non-blocking REST client for the ASGI app
+def build_async_plaid():
+    import async_clients
+
+    return async_clients.build_async_plaid()
+
+
+def load_genai():
+    import google.generativeai as genai
+
+    genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+    return genai
+
+
+# Build a client once even when several threads ask for it at the same time
+def once(holder, name, build):
+    value = getattr(holder, name)
+    if value is None:
+        with _lock:
+            value = getattr(holder, name)
+            if value is None:
+                value = build()
+                setattr(holder, name, value)
+    return value
+
+
+# Import the request models the handlers use, so the first real request
+# doesn't pay for them either
+def import_request_models():
+    import plaid.model.country_code  # noqa: F401
+    import plaid.model.item_public_token_exchange_request  # noqa: F401
+    import plaid.model.link_token_create_request  # noqa: F401
+    import plaid.model.link_token_create_request_user  # noqa: F401
+    import plaid.model.products  # noqa: F401
+    import plaid.model.transactions_get_request  # noqa: F401
+    import plaid.model.transactions_get_request_options  # noqa: F401
+    import plaid.model.transactions_sync_request  # noqa: F401
+
+
+def warm_up(steps, delay=0.0):
+    def run():
+        time.sleep(delay)
+        started = time.perf_counter()
+        for step in steps:
+            try:
+                step()
+            except Exception as e:
+                print(f"⚠️ Warm-up step {getattr(step, '__name__', step)} failed: {e}")
+        print(f"🔥 Warm-up finished in {time.perf_counter() - started:.2f}s")
+
+    thread = threading.Thread(target=run, name="warm-up", daemon=True)
+    thread.start()
+    return thread
+
+
+def import_analytics():
+    import analytics  # noqa: F401  (pulls in NumPy)
@@ -0,0 +1,219 @@
+import asyncio
+import hashlib
+import random
+import threading
+import time
+import types
+from datetime import date, datetime, time as clock, timedelta
+
+# Local stand-ins for Plaid and Gemini, for load tests and offline development.
+#
+# Latency is given as a spec string:
+#   "fixed:0.2"              always 200 ms
+#   "uniform:0.05:0.3"       anywhere between 50 and 300 ms
+#   "lognormal:0.4:0.5"      median 400 ms, sigma 0.5 (long right tail)
+# and `error_rate` is the fraction of calls that fail with a 503.
+
+MERCHANTS = ["Starbucks", "Uber", "Safeway", "Netflix", "Shell", "Amazon", "Chipotle", "Target"]
+GAMBLING_MERCHANTS = ["DraftKings Sportsbook", "FanDuel", "BetMGM", "Caesars Casino", "PokerStars"]
+
+
+class FakeUpstreamError(Exception):
+    def __init__(self, upstream):
+        super().__init__(f"fake {upstream} error")
+        self.status = 503
+
+
+# Plaid SDK responses allow both response.field and response["field"]
+class Response(dict):
+    __getattr__ = dict.__getitem__
+
+
+class Latency:
+    def __init__(self, spec="fixed:0"):
+        kind, *params = spec.split(":")
+        self.kind = kind
+        self.params = [float(p) for p in params]
+        if kind not in ("fixed", "uniform", "lognormal"):
+            raise ValueError(f"Unknown latency distribution: {spec}")
+        self.spec = spec
+
+    def sample(self):
+        if self.kind == "fixed":
+            return self.params[0]
+        if self.kind == "uniform":
+            return random.uniform(self.params[0], self.params[1])
+        median, sigma = self.params
+        return median * random.lognormvariate(0, sigma)
+
+    def wait(self):
+        delay = self.sample()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def _maybe_fail(error_rate, upstream):
+    if error_rate and random.random() < error_rate:
+        raise FakeUpstreamError(upstream)
+
+
+# Deterministic history per access token: the same token always sees the same
+# transactions, and roughly one in `gambling_every` of them is a bet
+def fake_history(access_token, days=90, per_day=2, gambling_every=8):
+    rng = random.Random(hashlib.sha256(access_token.encode()).hexdigest())
+    today = date.today()
+    txns = []
+    for day in range(days):
+        for n in range(per_day):
+            index = len(txns)
+            gambling = rng.randrange(gambling_every) == 0
+            day_date = today - timedelta(days=day)
+            txns.append({
+                "transaction_id": f"{access_token[-8:]}-{index}",
+                "name": rng.choice(GAMBLING_MERCHANTS if gambling else MERCHANTS),
+                "merchant_name": None,
+                "amount": round(rng.uniform(3, 300 if gambling else 80), 2),
+                "date": day_date,
+                "datetime": datetime.combine(day_date, clock(rng.randrange(24), rng.randrange(60))),
+                "category": None,
+                "personal_finance_category": None,
+                "pending": False,
+            })
+    return txns
+
+
+class FakePlaid:
+    def __init__(self, latency="fixed:0", error_rate=0.0, history_days=90, page_size=100):
+        self.latency = Latency(latency)
+        self.error_rate = error_rate
+        self.history_days = history_days
+        self.page_size = page_size
+        self.webhook_keys = {}  # kid -> JWK, see webhook_sim.py
+        self.calls = {}
+        self._lock = threading.Lock()
+
+    def _call(self, method):
+        with self._lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+        self.latency.wait()
+        _maybe_fail(self.error_rate, "plaid")
+
+    def link_token_create(self, request, **kwargs):
+        self._call("link_token_create")
+        return Response(link_token=f"link-sandbox-{random.getrandbits(64):016x}")
+
+    def item_public_token_exchange(self, request, **kwargs):
+        self._call("item_public_token_exchange")
+        digest = hashlib.sha256(str(request["public_token"]).encode()).hexdigest()
+        return Response(access_token=f"access-sandbox-{digest[:24]}", item_id=f"item-sandbox-{digest[24:48]}")
+
+    def webhook_verification_key_get(self, request, **kwargs):
+        self._call("webhook_verification_key_get")
+        return {"key": self.webhook_keys[request["key_id"]]}
+
+    def transactions_get(self, request, **kwargs):
+        self._call("transactions_get")
+        start, end = request["start_date"], request["end_date"]
+        txns = [t for t in fake_history(request["access_token"], self.history_days) if start <= t["date"] <= end]
+        options = request.get("options")
+        offset = options.get("offset", 0) if options is not None else 0
+        count = options.get("count", 100) if options is not None else 100
+        return {"transactions": txns[offset:offset + count], "total_transactions": len(txns)}
+
+    # Cursor is simply the offset into the history
+    def transactions_sync(self, request, **kwargs):
+        self._call("transactions_sync")
+        txns = fake_history(request["access_token"], self.history_days)
+        cursor = request.get("cursor")
+        offset = int(cursor) if cursor else 0
+        page = txns[offset:offset + self.page_size]
+        next_offset = offset + len(page)
+        return {"added": page, "modified": [], "removed": [],
+                "next_cursor": str(next_offset), "has_more": next_offset < len(txns)}
+
+
+# The same fake behind the async REST client's interface (dict bodies in and
+# out), sleeping without blocking the event loop
+class AsyncFakePlaid:
+    def __init__(self, latency="fixed:0", error_rate=0.0, history_days=90, page_size=100):
+        self.latency = Latency(latency)
+        self.error_rate = error_rate
+        self._responses = FakePlaid(history_days=history_days, page_size=page_size)
+        self.calls = self._responses.calls
+
+    def __getattr__(self, method):
+        respond = getattr(self._responses, method)
+
+        async def call(body, **kwargs):
+            await asyncio.sleep(self.latency.sample())
+            _maybe_fail(self.error_rate, "plaid")
+            return respond(body)
+
+        return call
+
+
+class FakeGenerativeModel:
+    latency = Latency("fixed:0")
+    flash_latency = None  # flash models use this instead when set
+    error_rate = 0.0
+    calls = 0
+
+    def __init__(self, model_name="models/gemini-1.5-pro", **kwargs):
+        self.model_name = model_name
+
+    # Like the real client, give up once request_options' timeout has passed
+    def _delay(self, kwargs):
+        latency = self.flash_latency if self.flash_latency and "flash" in self.model_name else self.latency
+        delay = latency.sample()
+        timeout = (kwargs.get("request_options") or {}).get("timeout")
+        if timeout is not None and delay > timeout:
+            return timeout, TimeoutError(f"fake gemini timed out after {timeout}s")
+        return delay, None
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        FakeGenerativeModel.calls += 1
+        delay, timed_out = self._delay(kwargs)
+        time.sleep(delay)
+        if timed_out:
+            raise timed_out
+        _maybe_fail(self.error_rate, "gemini")
+        text = self._reply(prompt)
+        if stream:
+            words = text.split(" ")
+            return iter(types.SimpleNamespace(text=w + (" " if i < len(words) - 1 else ""))
+                        for i, w in enumerate(words))
+        return types.SimpleNamespace(text=text)
+
+    async def generate_content_async(self, prompt, **kwargs):
+        FakeGenerativeModel.calls += 1
+        delay, timed_out = self._delay(kwargs)
+        await asyncio.sleep(delay)
+        if timed_out:
+            raise timed_out
+        _maybe_fail(self.error_rate, "gemini")
+        return types.SimpleNamespace(text=self._reply(prompt))
+
+    def _reply(self, prompt):
+        return f"Keep going! ({self.model_name.split('/')[-1]}, {len(prompt)} prompt chars)"
+
+
+class FakeGenAI:
+    GenerativeModel = FakeGenerativeModel
+
+    def configure(self, **kwargs):
+        pass
+
+
+# Point a loaded app module at the fakes. The resilience layer stays in the
+# path so benchmarks measure what production runs.
+def install(app_module, plaid_latency="fixed:0", gemini_latency="fixed:0", error_rate=0.0, flash_latency=None):
+    import upstream
+
+    FakeGenerativeModel.latency = Latency(gemini_latency)
+    FakeGenerativeModel.flash_latency = Latency(flash_latency) if flash_latency else None
+    FakeGenerativeModel.error_rate = error_rate
+    fake_plaid = FakePlaid(plaid_latency, error_rate)
+    app_module.plaid_client = upstream.ResilientPlaid(fake_plaid)
+    app_module.async_plaid = upstream.ResilientAsyncPlaid(AsyncFakePlaid(plaid_latency, error_rate))
+    app_module.genai = FakeGenAI()
+    return fake_plaid
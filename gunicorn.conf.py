@@ -0,0 +1,36 @@
+import multiprocessing
+import os
+
+# Production server settings (gunicorn -c gunicorn.conf.py wsgi:application)
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+
+# Classic 2 x cores + 1; WEB_CONCURRENCY overrides it (small hosting plans)
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+
+# Most request time is spent waiting on Plaid and Gemini, so each worker also
+# serves a few requests concurrently on threads
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+
+# Import the app once in the master; workers fork from it
+preload_app = True
+
+# SSE streams and slow Gemini calls need more than the 30 s default
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = "-"
+
+# Several processes share one SQLite database, so users are read per request
+# rather than cached in any one worker, and the LLM cache lives on disk too
+os.environ.setdefault("SHARED_STATE", "1")
+os.environ.setdefault("LLM_CACHE_DB", os.getenv("USERS_DB", "quitbet.db"))
+
+
+def post_fork(server, worker):
+    import app
+
+    # Run the scheduler out of process (python scheduler.py) rather than once per worker
+    app.start_background_services(run_scheduler=False)
@@ -0,0 +1,75 @@
+import os
+import queue
+import threading
+import time
+
+# Background work queue for jobs triggered by webhooks.
+#
+# Jobs are keyed (one key per Plaid Item): submitting a key that is already
+# waiting in the queue is a no-op, so a burst of webhooks for one Item turns
+# into a single sync. A key that is currently *running* can be queued again,
+# because the running job may already have missed the newer data.
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+
+
+class JobQueue:
+    def __init__(self, workers=JOB_WORKERS, name="jobs"):
+        self.workers = workers
+        self.name = name
+        self.completed = 0
+        self.failed = 0
+        self.coalesced = 0
+        self._queue = queue.Queue()
+        self._queued = set()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._pid = None
+
+    # Threads don't survive fork(), so workers are started lazily in whichever
+    # process first submits a job
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._threads = [threading.Thread(target=self._run, name=f"{self.name}-{i}", daemon=True)
+                             for i in range(self.workers)]
+            for thread in self._threads:
+                thread.start()
+            self._pid = os.getpid()
+
+    def submit(self, key, fn, *args):
+        self._ensure_started()
+        with self._lock:
+            if key in self._queued:
+                self.coalesced += 1
+                return False
+            self._queued.add(key)
+        self._queue.put((key, fn, args, time.monotonic()))
+        return True
+
+    def _run(self):
+        while True:
+            key, fn, args, queued_at = self._queue.get()
+            with self._lock:
+                self._queued.discard(key)
+            try:
+                fn(*args)
+                self.completed += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"⚠️ Job {key} failed after {time.monotonic() - queued_at:.1f}s: {e}")
+            finally:
+                self._queue.task_done()
+
+    # Block until everything submitted so far has run (simulator and scripts)
+    def join(self):
+        self._queue.join()
+
+    def stats(self):
+        with self._lock:
+            waiting = len(self._queued)
+        return {"waiting": waiting, "completed": self.completed, "failed": self.failed,
+                "coalesced": self.coalesced, "workers": self.workers}
@@ -0,0 +1,134 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+
+# Content-addressed cache for Gemini responses.
+#
+# Keys are sha256(model name + whitespace-normalized prompt), so identical
+# inputs hit regardless of how the prompt was indented. Entries live in a
+# size-bounded in-memory LRU, and optionally in a SQLite file so cached answers
+# survive restarts. TTLs are per task (insight / question / checkin).
+
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "1024"))
+LLM_CACHE_DB = os.getenv("LLM_CACHE_DB")  # unset = memory only
+
+TTLS = {
+    "insight": int(os.getenv("LLM_CACHE_TTL_INSIGHT", "1800")),
+    "question": int(os.getenv("LLM_CACHE_TTL_QUESTION", "600")),
+    "checkin": int(os.getenv("LLM_CACHE_TTL_CHECKIN", "86400")),
+}
+DEFAULT_TTL = 600
+
+
+def make_key(model_name, prompt):
+    normalized = re.sub(r"\s+", " ", prompt).strip()
+    return hashlib.sha256(f"{model_name}\0{normalized}".encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    def __init__(self, max_entries=LLM_CACHE_SIZE, db_path=None):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {}
+        self.db_path = db_path
+        self._db = None
+        if db_path:
+            self._open_db()
+            # Forked workers share the file, not the parent's connection
+            os.register_at_fork(after_in_child=self._open_db)
+
+    def _open_db(self):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, task TEXT, value TEXT, expires_at REAL)")
+        self._db.commit()
+
+    def _count(self, task, field):
+        stats = self._stats.setdefault(task, {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0})
+        stats[field] += 1
+        metrics.cache_events.inc(cache="llm", task=task, result=field)
+
+    def get(self, task, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self._count(task, "hits")
+                    return value
+                del self._entries[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+                if row and row[1] > now:
+                    self._remember(task, key, row[0], row[1])
+                    self._count(task, "disk_hits")
+                    return row[0]
+
+            self._count(task, "misses")
+            return None
+
+    def set(self, task, key, value, ttl=None):
+        expires_at = time.time() + (TTLS.get(task, DEFAULT_TTL) if ttl is None else ttl)
+        with self._lock:
+            self._remember(task, key, value, expires_at)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, task, value, expires_at) VALUES (?, ?, ?, ?)",
+                    (key, task, value, expires_at))
+                self._db.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (time.time(),))
+                self._db.commit()
+
+    def _remember(self, task, key, value, expires_at):
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._count(task, "evictions")
+
+    def get_or_generate(self, task, model_name, prompt, generate):
+        key = make_key(model_name, prompt)
+        value = self.get(task, key)
+        if value is None:
+            value = generate()
+            self.set(task, key, value)
+        return value
+
+    async def get_or_generate_async(self, task, model_name, prompt, generate):
+        key = make_key(model_name, prompt)
+        value = self.get(task, key)
+        if value is None:
+            value = await generate()
+            self.set(task, key, value)
+        return value
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "disk": self._db is not None,
+                "tasks": {task: dict(counts) for task, counts in self._stats.items()},
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM llm_cache")
+                self._db.commit()
+
+
+cache = LLMCache(db_path=LLM_CACHE_DB)
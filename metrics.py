@@ -0,0 +1,145 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# Minimal in-process metrics with Prometheus text exposition.
+#
+# span("stage") times a block into the quitbet_stage_seconds histogram and, when
+# called while serving a request, also notes it for that request's Server-Timing
+# header. Everything is a few dict lookups and a lock, cheap enough to leave on.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _label_str(labels):
+    if not labels:
+        return ""
+    body = ",".join(f'{k}="{str(v)}"'.replace("\n", " ") for k, v in labels)
+    return "{" + body + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_str(key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                running = 0
+                for bound, n in zip(self.buckets, counts):
+                    running += n
+                    lines.append(f"{self.name}_bucket{_label_str(key + (('le', bound),))} {running}")
+                lines.append(f"{self.name}_bucket{_label_str(key + (('le', '+Inf'),))} {count}")
+                lines.append(f"{self.name}_sum{_label_str(key)} {total}")
+                lines.append(f"{self.name}_count{_label_str(key)} {count}")
+        return lines
+
+
+class Gauge:
+    # Value is read from a callback at scrape time
+    def __init__(self, name, help_text, collect):
+        self.name = name
+        self.help = help_text
+        self.collect = collect
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        for labels, value in self.collect():
+            lines.append(f"{self.name}{_label_str(tuple(sorted(labels.items())))} {value}")
+        return lines
+
+
+registry = []
+
+
+def register(metric):
+    registry.append(metric)
+    return metric
+
+
+stage_seconds = register(Histogram("quitbet_stage_seconds", "Time spent in each hot-path stage"))
+request_seconds = register(Histogram("quitbet_request_seconds", "End-to-end request latency by route"))
+upstream_errors = register(Counter("quitbet_upstream_errors_total", "Failed upstream calls"))
+cache_events = register(Counter("quitbet_cache_events_total", "Cache lookups by cache and result"))
+
+# (started, [(stage, seconds)]) for the request currently being served. A
+# context variable rather than a thread-local, so concurrent requests on one
+# asyncio event loop (see asgi.py) keep separate timings.
+_request = contextvars.ContextVar("quitbet_request", default=None)
+
+
+def begin_request():
+    _request.set((time.perf_counter(), []))
+
+
+def end_request():
+    state = _request.get()
+    _request.set(None)
+    if state is None:
+        return None, []
+    started, spans = state
+    return time.perf_counter() - started, spans
+
+
+@contextmanager
+def span(stage):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        stage_seconds.observe(elapsed, stage=stage)
+        state = _request.get()
+        if state is not None:
+            state[1].append((stage, elapsed))
+
+
+def server_timing(spans, total):
+    parts = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in spans]
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+def render():
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,171 @@
+import os
+import threading
+import time
+
+import ai_pool
+import llm_cache
+import metrics
+import upstream
+
+# Which Gemini model answers which task.
+#
+# Each task (insight, question, checkin) maps to a tier and its own generation
+# config; model instances are built once per (tier, task) and reused. A task on
+# the pro tier gets GEMINI_BUDGET_<TASK> seconds; past that the same prompt
+# goes to flash instead. Every attempt is timed per tier and task in
+# quitbet_gemini_seconds, which is what to look at when moving a task between
+# tiers or changing its budget.
+#
+#   GEMINI_PRO_MODEL / GEMINI_FLASH_MODEL    model names behind the tiers
+#   GEMINI_TIER_<TASK>                       "pro" or "flash"
+#   GEMINI_MAX_TOKENS_<TASK>                 max_output_tokens
+#   GEMINI_BUDGET_<TASK>                     seconds before falling back
+
+TIERS = {
+    "pro": os.getenv("GEMINI_PRO_MODEL", "models/gemini-1.5-pro"),
+    "flash": os.getenv("GEMINI_FLASH_MODEL", "models/gemini-1.5-flash"),
+}
+
+# Where a tier goes when it blows the budget
+FALLBACK_TIER = {"pro": "flash"}
+
+# task: (tier, max_output_tokens, temperature, latency budget in seconds)
+DEFAULT_ROUTES = {
+    "insight": ("pro", 400, 0.7, 8.0),
+    "question": ("flash", 80, 0.9, 4.0),
+    "checkin": ("flash", 80, 0.9, 4.0),
+}
+
+gemini_seconds = metrics.register(metrics.Histogram(
+    "quitbet_gemini_seconds", "Gemini generation latency by tier, task and outcome"))
+gemini_fallbacks = metrics.register(metrics.Counter(
+    "quitbet_gemini_fallbacks_total", "Generations moved to a faster tier"))
+
+
+class Route:
+    def __init__(self, task, tier, max_output_tokens, temperature, budget):
+        self.task = task
+        self.tier = os.getenv(f"GEMINI_TIER_{task.upper()}", tier)
+        self.budget = float(os.getenv(f"GEMINI_BUDGET_{task.upper()}", budget))
+        self.generation_config = {
+            "max_output_tokens": int(os.getenv(f"GEMINI_MAX_TOKENS_{task.upper()}", max_output_tokens)),
+            "temperature": temperature,
+        }
+        if self.tier not in TIERS:
+            raise ValueError(f"Unknown Gemini tier for {task}: {self.tier}")
+
+    @property
+    def model_name(self):
+        return TIERS[self.tier]
+
+
+routes = {task: Route(task, *settings) for task, settings in DEFAULT_ROUTES.items()}
+
+
+class ModelRouter:
+    def __init__(self, get_genai, routes=routes):
+        self.get_genai = get_genai
+        self.routes = routes
+        self._models = {}
+        self._lock = threading.Lock()
+
+    # The name responses are cached under: the task's own tier, even when a
+    # fallback answered
+    def model_name(self, task):
+        return self.routes[task].model_name
+
+    def model(self, tier, task):
+        genai = self.get_genai()
+        key = (id(genai), tier, task)
+        model = self._models.get(key)
+        if model is None:
+            with self._lock:
+                model = self._models.get(key)
+                if model is None:
+                    model = self._models[key] = genai.GenerativeModel(
+                        TIERS[tier], generation_config=self.routes[task].generation_config)
+        return model
+
+    # [(tier, deadline, retried)]: the routed tier on its budget (no retries,
+    # falling back is the retry), then the fallback tier on the normal deadline
+    def _plan(self, task):
+        route = self.routes[task]
+        fallback = FALLBACK_TIER.get(route.tier)
+        if fallback is None:
+            return [(route.tier, None, True)]
+        return [(route.tier, min(route.budget, upstream.DEADLINES["gemini"]), False), (fallback, None, True)]
+
+    # On the Gemini pool (ai_pool.py) every attempt, retry and fallback has to
+    # fit in the time the page waits for the answer
+    def generate(self, task, prompt, on_chunk=None):
+        plan = self._plan(task)
+        expires_at = ai_pool.expires_at()
+        emitted = []
+
+        def relay(text):
+            emitted.append(text)
+            on_chunk(text)
+
+        for index, (tier, deadline, retried) in enumerate(plan):
+            def attempt(deadline, tier=tier):
+                model = self.model(tier, task)
+                options = {"timeout": deadline}
+                if on_chunk is None:
+                    return model.generate_content(prompt, request_options=options).text
+                parts = []
+                for chunk in model.generate_content(prompt, stream=True, request_options=options):
+                    parts.append(chunk.text)
+                    relay(chunk.text)
+                return "".join(parts)
+
+            started = time.perf_counter()
+            try:
+                # A stream that already emitted text can't be retried without duplicating it
+                text = upstream.call(f"gemini_{tier}", "gemini", attempt, idempotent=retried and on_chunk is None,
+                                     fallback_key=llm_cache.make_key(TIERS[tier], prompt), deadline=deadline,
+                                     request={"model": TIERS[tier], "prompt": prompt}, expires_at=expires_at)
+            except Exception as e:
+                self._observe(tier, task, started, e)
+                out_of_time = expires_at is not None and time.monotonic() >= expires_at
+                if index + 1 == len(plan) or emitted or out_of_time or not _can_fall_back(e):
+                    raise
+                gemini_fallbacks.inc(task=task, tier=tier, to=plan[index + 1][0])
+                continue
+            self._observe(tier, task, started)
+            return text
+
+    async def generate_async(self, task, prompt):
+        plan = self._plan(task)
+        for index, (tier, deadline, retried) in enumerate(plan):
+            async def attempt(deadline, tier=tier):
+                response = await self.model(tier, task).generate_content_async(
+                    prompt, request_options={"timeout": deadline})
+                return response.text
+
+            started = time.perf_counter()
+            try:
+                text = await upstream.call_async(f"gemini_{tier}", "gemini", attempt, idempotent=retried,
+                                                 fallback_key=llm_cache.make_key(TIERS[tier], prompt),
+                                                 deadline=deadline,
+                                                 request={"model": TIERS[tier], "prompt": prompt})
+            except Exception as e:
+                self._observe(tier, task, started, e)
+                if index + 1 == len(plan) or not _can_fall_back(e):
+                    raise
+                gemini_fallbacks.inc(task=task, tier=tier, to=plan[index + 1][0])
+                continue
+            self._observe(tier, task, started)
+            return text
+
+    def _observe(self, tier, task, started, error=None):
+        if error is None:
+            outcome = "ok"
+        else:
+            name = type(error).__name__
+            outcome = "timeout" if "Timeout" in name or "DeadlineExceeded" in name else "error"
+        gemini_seconds.observe(time.perf_counter() - started, tier=tier, task=task, outcome=outcome)
+
+
+# Slow or unavailable is worth another tier; a rejected prompt isn't
+def _can_fall_back(exc):
+    return isinstance(exc, upstream.CircuitOpenError) or upstream.is_transient(exc)
@@ -0,0 +1,149 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+
+from werkzeug.http import http_date, parse_date, parse_etags, quote_etag
+
+import metrics
+
+# Conditional GET and rendered-fragment caching for the dashboard.
+#
+# A DataVersion stamps everything the dashboard page is built from, and is
+# cheap to read before doing any of the work: the stored transactions'
+# version (txn_store), when the user record was last saved (progress,
+# check-in, survey), the day (the window and the check-in move with it), the
+# keyword list and the templates. The page's ETag and Last-Modified come from
+# it, so a browser revalidating an unchanged dashboard gets a 304 without a
+# fetch, classification, Gemini call or render.
+#
+# When the page does have to be rendered, the transaction tables and the chart
+# JSON come from a small LRU keyed by the parts of the version they depend on,
+# so a new check-in or streak doesn't re-render a few thousand table rows.
+#
+# In stream mode the page's dashboard is also kept for a few seconds, for the
+# /events request the page opens right after, so that request doesn't fetch,
+# classify and analyse everything again.
+
+FRAGMENT_CACHE_SIZE = int(os.getenv("FRAGMENT_CACHE_SIZE", "256"))
+STREAM_HANDOFF_TTL = float(os.getenv("STREAM_HANDOFF_TTL", "30"))  # seconds
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+
+not_modified = metrics.register(metrics.Counter(
+    "quitbet_not_modified_total", "Dashboard views answered with 304 Not Modified"))
+
+
+# Newest template mtime; a deploy that changes a template changes every ETag
+def template_stamp(directory=TEMPLATE_DIR):
+    stamps = [os.path.getmtime(os.path.join(root, name))
+              for root, _, names in os.walk(directory) for name in names]
+    return max(stamps, default=0.0)
+
+
+TEMPLATES = template_stamp()
+
+
+class DataVersion:
+    def __init__(self, email, txns, txns_changed, user_saved, day, keywords, templates=TEMPLATES):
+        self.email = email
+        self.txns = txns
+        self.txns_changed = txns_changed or 0.0
+        self.user_saved = user_saved or 0.0
+        self.day = day
+        self.keywords = keywords
+        self.templates = templates
+
+    # Tables and chart only depend on the transactions, not on progress
+    def fragment_key(self, fragment):
+        return (fragment, self.email, self.txns, self.day, self.keywords, self.templates)
+
+    # Weak: regenerated Gemini text can differ by a word without the data changing
+    def etag(self, *variant):
+        parts = (self.email, self.txns, self.user_saved, self.day, self.keywords, self.templates) + variant
+        return hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()[:20]
+
+    @property
+    def last_modified(self):
+        midnight = time.mktime(date.fromisoformat(self.day).timetuple())
+        return max(self.txns_changed, self.user_saved, midnight, self.templates)
+
+
+def validator_headers(etag, last_modified):
+    return {"ETag": quote_etag(etag, weak=True), "Last-Modified": http_date(last_modified),
+            "Cache-Control": "private, no-cache"}
+
+
+# RFC 9110: If-None-Match wins when present; If-Modified-Since is only
+# consulted without it
+def is_fresh(if_none_match, if_modified_since, etag, last_modified):
+    if if_none_match:
+        return parse_etags(if_none_match).contains_weak(etag)
+    since = parse_date(if_modified_since) if if_modified_since else None
+    return since is not None and int(last_modified) <= since.timestamp()
+
+
+class FragmentCache:
+    def __init__(self, max_entries=FRAGMENT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    # key=None (no stable version) always renders
+    def get_or_render(self, key, render):
+        if key is None:
+            return render()
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                metrics.cache_events.inc(cache="fragment", result="hits")
+                return value
+
+        value = render()
+        metrics.cache_events.inc(cache="fragment", result="misses")
+        with self._lock:
+            self.misses += 1
+            self._entries[key] = value
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+fragments = FragmentCache()
+
+
+# The last dashboard built for each user, handed to the next request that wants
+# it within `ttl` seconds and at the same version (an etag; None when there is
+# no cheap version, where only the ttl applies)
+class RecentDashboards:
+    def __init__(self, ttl=STREAM_HANDOFF_TTL, max_entries=FRAGMENT_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, email, version, dashboard):
+        with self._lock:
+            self._entries[email] = (time.monotonic() + self.ttl, version, dashboard)
+            self._entries.move_to_end(email)
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, email, version):
+        with self._lock:
+            entry = self._entries.get(email)
+        hit = entry is not None and entry[0] > time.monotonic() and entry[1] == version
+        metrics.cache_events.inc(cache="dashboard", result="hits" if hit else "misses")
+        return entry[2] if hit else None
+
+
+recent_dashboards = RecentDashboards()
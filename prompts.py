@@ -0,0 +1,245 @@
+import math
+import os
+from datetime import date, datetime
+
+import metrics
+from txn_model import Transaction
+
+# Prompt construction shared by the three Gemini generations.
+#
+# Instead of pasting raw transaction lists into the prompt, transactions are
+# reduced to a compact summary (totals per merchant, gambling spend by day and
+# hour, net winnings, the largest bets) whose size doesn't grow with history.
+# Each prompt is trimmed to PROMPT_TOKEN_BUDGET estimated tokens.
+
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "700"))
+PROMPT_TOP_N = int(os.getenv("PROMPT_TOP_N", "5"))
+
+prompt_tokens = metrics.register(metrics.Histogram(
+    "quitbet_prompt_tokens", "Estimated tokens per Gemini prompt",
+    buckets=(50, 100, 200, 400, 700, 1000, 2000, 4000, 8000)))
+
+
+# Roughly four characters per token for English text
+def estimate_tokens(text):
+    return math.ceil(len(text) / 4)
+
+
+def _field(txn, name, default=None):
+    try:
+        value = txn.get(name)
+    except AttributeError:
+        value = getattr(txn, name, None)
+    return default if value is None else value
+
+
+def _day(txn):
+    if isinstance(txn, Transaction):
+        return txn.date
+    value = _field(txn, "date")
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10]) if value else None
+
+
+def _hour(txn):
+    if isinstance(txn, Transaction):
+        return txn.hour if txn.hour >= 0 else None
+    value = _field(txn, "datetime")
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return value.hour if isinstance(value, datetime) else None
+
+
+def _merchant(txn):
+    return _field(txn, "merchant_name") or _field(txn, "name", "Unknown")
+
+
+def summarize(txns, gambling_txns, top_n=PROMPT_TOP_N):
+    spend_by_merchant = {}
+    for txn in txns:
+        merchant = _merchant(txn)
+        spend_by_merchant[merchant] = spend_by_merchant.get(merchant, 0.0) + float(_field(txn, "amount", 0))
+
+    gambling_by_day = {}
+    gambling_by_hour = {}
+    net_winnings = 0.0
+    has_winnings = False
+    for txn in gambling_txns:
+        amount = float(_field(txn, "amount", 0))
+        day = _day(txn)
+        if day:
+            gambling_by_day[day] = gambling_by_day.get(day, 0.0) + amount
+        hour = _hour(txn)
+        if hour is not None:
+            gambling_by_hour[hour] = gambling_by_hour.get(hour, 0.0) + amount
+        winnings = _field(txn, "winnings")
+        if winnings is not None:
+            net_winnings += float(winnings)
+            has_winnings = True
+
+    largest_bets = sorted(gambling_txns, key=lambda t: float(_field(t, "amount", 0)), reverse=True)
+    days = [d for d in (_day(t) for t in txns) if d]
+
+    return {
+        "count": len(txns),
+        "first_day": min(days) if days else None,
+        "last_day": max(days) if days else None,
+        "total_spend": round(sum(spend_by_merchant.values()), 2),
+        "top_merchants": sorted(spend_by_merchant.items(), key=lambda kv: kv[1], reverse=True)[:top_n],
+        "gambling_count": len(gambling_txns),
+        "gambling_total": round(sum(gambling_by_day.values()), 2),
+        "gambling_by_day": sorted(gambling_by_day.items(), reverse=True)[:top_n * 2],
+        "gambling_by_hour": sorted(gambling_by_hour.items()),
+        "net_winnings": round(net_winnings, 2) if has_winnings else None,
+        "largest_bets": [(_day(t), _merchant(t), float(_field(t, "amount", 0))) for t in largest_bets[:top_n]],
+    }
+
+
+def render_summary(summary):
+    lines = [f"- {summary['count']} transactions"
+             + (f" from {summary['first_day']} to {summary['last_day']}" if summary["first_day"] else "")
+             + f", ${summary['total_spend']:.2f} total"]
+    if summary["top_merchants"]:
+        lines.append("- Top merchants: " + ", ".join(f"{m} ${v:.2f}" for m, v in summary["top_merchants"]))
+    if summary["gambling_count"]:
+        lines.append(f"- Gambling: {summary['gambling_count']} bets, ${summary['gambling_total']:.2f} total")
+        if summary["gambling_by_day"]:
+            lines.append("- Gambling by day: " + ", ".join(f"{d} ${v:.2f}" for d, v in summary["gambling_by_day"]))
+        if summary["gambling_by_hour"]:
+            lines.append("- Gambling by hour: " + ", ".join(f"{h:02d}h ${v:.2f}" for h, v in summary["gambling_by_hour"]))
+        if summary["net_winnings"] is not None:
+            lines.append(f"- Net winnings: ${summary['net_winnings']:.2f}")
+        if summary["largest_bets"]:
+            lines.append("- Largest bets: " + ", ".join(f"{d} {m} ${v:.2f}" for d, m, v in summary["largest_bets"]))
+    return "\n".join(lines)
+
+
+# Behaviour patterns precomputed by analytics.analyze()
+def render_patterns(patterns):
+    if not patterns or not patterns.get("gambling_count"):
+        return ""
+    lines = [f"- Gambling in the last 7 days: ${patterns['rolling_7']:.2f} (last 30 days: ${patterns['rolling_30']:.2f})"]
+    if patterns.get("peak_hour") is not None:
+        lines.append(f"- Most money is bet around {patterns['peak_hour']:02d}:00")
+    if patterns.get("peak_weekday"):
+        lines.append(f"- Heaviest betting day: {patterns['peak_weekday']}")
+    if patterns.get("weekly_limit"):
+        lines.append(f"- This week: ${patterns['week_to_date']:.2f} of the ${patterns['weekly_limit']:.0f} weekly limit")
+    return "\n".join(lines)
+
+
+# Dropped in this order once the lists are down to one entry each
+TRIM_SECTIONS = ("patterns", "gambling_by_hour", "largest_bets", "gambling_by_day", "top_merchants")
+
+
+# Shrink the summary until the prompt fits the budget: fewer merchants, days
+# and bets first, then whole sections, and as a last resort cut the summary
+# text (or, when the rest of the prompt alone is over, the prompt itself)
+def _fit(task, build, txns, gambling_txns, budget, patterns=None):
+    extra = render_patterns(patterns)
+
+    def fitted(prompt):
+        prompt_tokens.observe(estimate_tokens(prompt), task=task)
+        return prompt
+
+    for top_n in range(max(PROMPT_TOP_N, 1), 0, -1):
+        summary = summarize(txns, gambling_txns, top_n)
+        prompt = build(render_summary(summary) + ("\n" + extra if extra else ""))
+        if estimate_tokens(prompt) <= budget:
+            return fitted(prompt)
+
+    for section in TRIM_SECTIONS:
+        if section == "patterns":
+            extra = ""
+        else:
+            summary[section] = []
+        prompt = build(render_summary(summary) + ("\n" + extra if extra else ""))
+        if estimate_tokens(prompt) <= budget:
+            return fitted(prompt)
+
+    room = budget * 4 - len(build(""))
+    if room > 0:
+        return fitted(build(render_summary(summary)[:room]))
+    return fitted(prompt[:budget * 4])
+
+
+def _checkin_context(checkin):
+    if not checkin:
+        return ""
+    return (f"\nWeekly check-in: spent ${float(checkin.get('actual_spent') or 0):.2f} last week, "
+            f"wants to save ${float(checkin.get('goal_to_save') or 0):.2f}, "
+            f"weekly cap ${checkin.get('limit', 500)}.\n")
+
+
+def insight_prompt(email, txns, gambling_txns, checkin=None, patterns=None, budget=PROMPT_TOKEN_BUDGET):
+    context = _checkin_context(checkin)
+    if gambling_txns:
+        def build(summary):
+            return f"""You're QuitBet, an AI trained to help people quit gambling.
+
+User: {email}{context}
+Summary of recent transactions:
+{summary}
+
+Generate a 1–2 sentence helpful reflection or alert, like:
+“You bet $300 this week, mostly after 10 PM. Let’s talk about setting limits.”
+
+Be supportive, helpful, and motivational."""
+    else:
+        def build(summary):
+            return f"""You're QuitBet, an AI trained to support people trying to quit gambling.
+
+User: {email}{context}
+Summary of recent transactions:
+{summary}
+
+No gambling activity was detected.
+
+Generate a short encouraging message like:
+“Great job staying on track! You’ve made 7 healthy choices this week.”
+
+Your tone should be warm, motivating, and a little personalized."""
+
+    return _fit("insight", build, txns, gambling_txns, budget, patterns)
+
+
+def question_prompt(txns, gambling_txns, days_clean, budget=PROMPT_TOKEN_BUDGET):
+    recent = sorted(txns, key=lambda t: _day(t) or date.min, reverse=True)[:5]
+    recent_lines = "\n".join(f"- {_day(t)} {_field(t, 'name', 'N/A')} ${float(_field(t, 'amount', 0)):.2f}"
+                             for t in recent)
+
+    def build(summary):
+        return f"""You're QuitBet, an AI assistant helping people quit gambling.
+
+You are about to ask the user a **personalized question** based on their recent activity.
+
+Their last few transactions:
+{recent_lines}
+
+Overall:
+{summary}
+
+They are currently on day {days_clean} of their clean streak.
+
+Generate one short, meaningful question to help them reflect on their behavior, progress, or emotions. Use a supportive tone."""
+
+    return _fit("question", build, txns, gambling_txns, budget)
+
+
+def checkin_prompt(days_clean):
+    prompt = f"""You're QuitBet, an AI coach helping users quit gambling.
+
+This user is on day {days_clean} of their clean streak.
+
+Write a short, friendly, motivational daily check-in message. Be personal, positive, and ask a reflective question.
+
+Examples:
+- "It's Day 3 clean, Stanley! What's one thing that helped you resist yesterday?"
+- "4 days strong — incredible. Want to reflect on your proudest moment this week?"
+
+Limit to 1–2 sentences."""
+    prompt_tokens.observe(estimate_tokens(prompt), task="checkin")
+    return prompt
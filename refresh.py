@@ -0,0 +1,137 @@
+import argparse
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from ratelimit import RateLimiter
+
+# Nightly bulk refresh: sync every connected user's transactions from Plaid,
+# then classify and update progress for a whole batch at once and commit it in
+# a single transaction.
+#
+#   python refresh.py --workers 16 --rate 20 --batch-size 200
+#   python refresh.py --resume <run id>     # pick up an interrupted run
+#
+# Every /transactions/sync request, each page of a user's sync included, takes
+# a token from one limiter shared by all workers (--rate per second). Each
+# user's pages are fetched one after another, so an Item never sees more than
+# one request from us at a time.
+
+CHECKPOINT_SCHEMA = """
+CREATE TABLE IF NOT EXISTS refresh_progress (
+    run_id TEXT NOT NULL,
+    email TEXT NOT NULL,
+    finished_at REAL,
+    PRIMARY KEY (run_id, email)
+);
+"""
+
+
+class Checkpoint:
+    def __init__(self, store, run_id):
+        self.store = store
+        self.run_id = run_id
+        store._conn().executescript(CHECKPOINT_SCHEMA)
+
+    def finished(self):
+        rows = self.store._conn().execute(
+            "SELECT email FROM refresh_progress WHERE run_id = ?", (self.run_id,))
+        return {row[0] for row in rows}
+
+    def mark(self, emails):
+        conn = self.store._conn()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO refresh_progress (run_id, email, finished_at) VALUES (?, ?, ?)",
+                [(self.run_id, email, time.time()) for email in emails])
+
+
+def chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def refresh(app, emails, workers, rate, batch_size, checkpoint, max_age):
+    import txn_store
+
+    plaid_limiter = RateLimiter(rate)
+    store = app.transaction_store
+    plaid_client = app.get_plaid_client()
+    stats = {"users": 0, "failed": 0, "transactions": 0, "synced": 0}
+    stats_lock = threading.Lock()
+    today = datetime.today().date()
+    start_date = today - timedelta(days=app.TXN_WINDOW_DAYS)
+
+    def fetch(item):
+        email, access_token = item
+        try:
+            if store.is_stale(email, max_age):
+                txn_store.sync_user(plaid_client, store, email, access_token, before_call=plaid_limiter.acquire)
+                with stats_lock:
+                    stats["synced"] += 1
+            return email, store.list_transactions(email, start_date, today)
+        except Exception as e:
+            print(f"⚠️ {email}: {e}")
+            return email, None
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="refresh") as pool:
+        for batch in chunks(emails, batch_size):
+            fetched = [(email, txns) for email, txns in pool.map(fetch, batch) if txns is not None]
+            stats["failed"] += len(batch) - len(fetched)
+
+            # Classify the whole batch in one pass, then split the flags back per user
+            all_txns = [txn for _, txns in fetched for txn in txns]
+            flags = app.classifier.classify(all_txns)
+
+            with app.user_scope():
+                offset = 0
+                for email, txns in fetched:
+                    found_gambling = any(flags[offset:offset + len(txns)])
+                    offset += len(txns)
+                    app.update_progress(email, found_gambling, today)
+                # One SQLite transaction for the whole batch
+                app.user_store.flush()
+
+            checkpoint.mark([email for email, _ in fetched])
+            stats["users"] += len(fetched)
+            stats["transactions"] += len(all_txns)
+            elapsed = time.monotonic() - started
+            print(f"… {stats['users']}/{len(emails)} users, {stats['users'] / elapsed:.1f} users/s")
+
+    elapsed = time.monotonic() - started
+    stats["seconds"] = round(elapsed, 2)
+    stats["users_per_second"] = round(stats["users"] / elapsed, 2) if elapsed else None
+    stats["transactions_per_second"] = round(stats["transactions"] / elapsed, 2) if elapsed else None
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Refresh transactions and progress for every connected user")
+    parser.add_argument("--workers", type=int, default=16, help="concurrent Plaid fetches")
+    parser.add_argument("--rate", type=float, default=20.0, help="Plaid requests per second, all workers together")
+    parser.add_argument("--batch-size", type=int, default=200, help="users per commit")
+    parser.add_argument("--max-age", type=int, default=0,
+                        help="skip the Plaid sync for users synced within this many seconds")
+    parser.add_argument("--resume", metavar="RUN_ID", help="continue an earlier run, skipping finished users")
+    args = parser.parse_args()
+
+    import app
+
+    run_id = args.resume or uuid.uuid4().hex[:12]
+    checkpoint = Checkpoint(app.transaction_store, run_id)
+    done = checkpoint.finished()
+
+    emails = sorted((email, user["access_token"]) for email, user in app.users.items()
+                    if user.get("access_token") and email not in done)
+    print(f"🔄 Refresh run {run_id}: {len(emails)} users to go ({len(done)} already done)")
+
+    stats = refresh(app, emails, args.workers, args.rate, args.batch_size, checkpoint, args.max_age)
+    print(f"✅ Run {run_id}: {stats}")
+    app.user_store.close()
+
+
+if __name__ == "__main__":
+    main()
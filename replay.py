@@ -0,0 +1,289 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import types
+import warnings
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+import benchmark
+
+# Replays traffic recorded by capture.py through app.test_client().
+#
+#   CAPTURE_FILE=capture.jsonl gunicorn -c gunicorn.conf.py wsgi:application  # record
+#   python replay.py capture.jsonl --users-db snapshot.db                 # original pace
+#   python replay.py capture.jsonl --users-db snapshot.db --speed 10      # 10x faster
+#   python replay.py capture.jsonl --speed 0 --compare bench_results/<old>.json
+#
+# Requests go out at their recorded offsets divided by --speed (0: back to
+# back, as fast as --workers allow). One user's requests are sent in recorded
+# order, each after the previous one finished, so signup, exchange and views
+# still line up when the replay runs faster or slower than the original.
+#
+# Recorded conditional and Accept headers are sent again. The app stamps new
+# ETags and Last-Modified dates during a replay, so a recorded If-None-Match or
+# If-Modified-Since is swapped for what the replay returned in place of the
+# recorded validator; revalidations still get their 304s. `random` is seeded
+# (--seed), so backoff jitter and fake data come out the same every run.
+#
+# Plaid and Gemini are stood in for by the recorded responses: matched on the
+# request, else the next recorded response from the same endpoint, returned
+# after the recorded latency (also divided by --speed). Recorded failures fail again, so retries, breakers and
+# fallbacks behave as they did.
+#
+# --users-db is copied, never written; pass a copy of the users database from
+# when the capture started. Results are summarised and saved like benchmark.py.
+
+
+class ReplayMiss(Exception):
+    pass
+
+
+# Rebuilds a recorded error so upstream.is_transient() sees it the same way
+def _rebuild_error(error):
+    builtin = {"TimeoutError": TimeoutError, "ConnectionError": ConnectionError}.get(error["type"])
+    if builtin is not None:
+        return builtin(error["message"])
+    exc = type(error["type"], (Exception,), {})(error["message"])
+    exc.status = error.get("status")
+    return exc
+
+
+class Recording:
+    def __init__(self, upstream_records, speed=1.0):
+        self.speed = speed
+        self.misses = defaultdict(int)
+        self.served = defaultdict(int)
+        self._by_key = defaultdict(deque)
+        self._by_endpoint = defaultdict(deque)
+        self._lock = threading.Lock()
+        for record in upstream_records:
+            record["used"] = False
+            self._by_key[record["key"]].append(record)
+            self._by_endpoint[record["endpoint"]].append(record)
+
+    @staticmethod
+    def _next(queue):
+        while queue:
+            record = queue.popleft()
+            if not record["used"]:
+                return record
+        return None
+
+    def take(self, endpoint, request):
+        import capture  # not at the top: app.py must not see CAPTURE_FILE during a replay
+
+        key = capture.request_key(endpoint, request)
+        with self._lock:
+            record = self._next(self._by_key[key]) or self._next(self._by_endpoint[endpoint])
+            if record is None:
+                self.misses[endpoint] += 1
+                return None
+            record["used"] = True
+            self.served[endpoint] += 1
+            return record
+
+    def respond(self, endpoint, request):
+        record = self.take(endpoint, request)
+        if record is None:
+            raise ReplayMiss(f"no recorded {endpoint} response left")
+        if self.speed:
+            time.sleep(record["seconds"] / self.speed)
+        if "error" in record:
+            raise _rebuild_error(record["error"])
+        return record["response"]
+
+
+# Plaid SDK responses allow both response.field and response["field"]
+class Response(dict):
+    __getattr__ = dict.__getitem__
+
+
+class ReplayPlaid:
+    def __init__(self, recording):
+        self.recording = recording
+
+    def __getattr__(self, method):
+        def call(request=None, **kwargs):
+            response = self.recording.respond(f"plaid.{method}", request)
+            return Response(response) if isinstance(response, dict) else response
+
+        return call
+
+
+class ReplayModel:
+    def __init__(self, recording, model_name):
+        self.recording = recording
+        self.model_name = model_name
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        text = self.recording.respond("gemini", {"model": self.model_name, "prompt": prompt})
+        if stream:
+            words = text.split(" ")
+            return iter(types.SimpleNamespace(text=w + (" " if i < len(words) - 1 else ""))
+                        for i, w in enumerate(words))
+        return types.SimpleNamespace(text=text)
+
+
+class ReplayGenAI:
+    def __init__(self, recording):
+        self.recording = recording
+
+    def configure(self, **kwargs):
+        pass
+
+    def GenerativeModel(self, model_name, **kwargs):
+        return ReplayModel(self.recording, model_name)
+
+
+def load(path):
+    requests, upstream_records = [], []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                (requests if record["type"] == "request" else upstream_records).append(record)
+    requests.sort(key=lambda r: r["t"])
+    upstream_records.sort(key=lambda r: r["t"])
+    return requests, upstream_records
+
+
+# The user a request belongs to: the email in the form, JSON body or path
+def user_of(record):
+    for body in (record.get("form"), record.get("json")):
+        if isinstance(body, dict) and body.get("email"):
+            return body["email"]
+    for part, value in zip((record.get("route") or "").split("/"), record["path"].split("/")):
+        if part == "<email>":
+            return value
+    return None
+
+
+# Recorded request headers, with validators from the capture replaced by the
+# ones this replay handed out for the same responses
+def replay_headers(record, validators):
+    headers = dict(record.get("headers") or {})
+    if "If-None-Match" in headers:
+        headers["If-None-Match"] = ", ".join(
+            validators.get(tag.strip(), tag.strip()) for tag in headers["If-None-Match"].split(","))
+    if "If-Modified-Since" in headers:
+        headers["If-Modified-Since"] = validators.get(headers["If-Modified-Since"], headers["If-Modified-Since"])
+    return headers
+
+
+def send(client, record, validators):
+    kwargs = {"query_string": record.get("args") or None, "headers": replay_headers(record, validators)}
+    if record.get("json") is not None:
+        kwargs["json"] = record["json"]
+    elif record.get("form"):
+        kwargs["data"] = record["form"]
+    return client.open(record["path"], method=record["method"], **kwargs)
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix="quitbet-replay-")
+    users_db = os.path.join(workdir, "quitbet.db")
+    if args.users_db:
+        shutil.copy(args.users_db, users_db)
+    os.environ["USERS_DB"] = users_db
+    os.environ["TXN_DB"] = users_db
+    os.environ["PLAID_WEBHOOK_VERIFY"] = "0"  # recorded webhooks carry no valid signature
+    os.environ.pop("CAPTURE_FILE", None)
+    os.chdir(workdir)
+    sys.path.insert(0, benchmark.ROOT)
+    random.seed(args.seed)
+    warnings.filterwarnings("ignore")
+
+    import app as app_module
+    import upstream
+
+    requests, upstream_records = load(args.capture)
+    if not requests:
+        raise SystemExit(f"No requests in {args.capture}")
+    recording = Recording(upstream_records, args.speed)
+    app_module.plaid_client = upstream.ResilientPlaid(ReplayPlaid(recording))
+    app_module.genai = ReplayGenAI(recording)
+
+    # One lane per user, in order of each user's first request; requests
+    # without a user get a lane of their own
+    lanes = {}
+    for n, record in enumerate(requests):
+        lanes.setdefault(user_of(record) or n, []).append(record)
+
+    recorder = benchmark.Recorder()
+    mismatched = defaultdict(int)
+    first = requests[0]["t"]
+
+    def replay(lane):
+        client = app_module.app.test_client()
+        validators = {}  # recorded ETag / Last-Modified -> the one replayed in its place
+        for record in lane:
+            if args.speed:
+                delay = (record["t"] - first) / args.speed - (time.perf_counter() - started)
+                if delay > 0:
+                    time.sleep(delay)
+            sent = time.perf_counter()
+            response = send(client, record, validators)
+            for name, recorded in (record.get("validators") or {}).items():
+                if response.headers.get(name):
+                    validators[recorded] = response.headers[name]
+            route = f"{record['method']} {record.get('route') or record['path']}"
+            recorder.record(route, time.perf_counter() - sent, response.status_code < 500)
+            if response.status_code != record["status"]:
+                mismatched[route] += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        for future in [pool.submit(replay, lane) for lane in lanes.values()]:
+            future.result()
+    wall = time.perf_counter() - started
+
+    result = recorder.summary(wall)
+    result["mode"] = f"replay x{args.speed:g}" if args.speed else "replay max"
+    result["status_mismatches"] = dict(mismatched)
+    result["upstream_served"] = dict(recording.served)
+    result["upstream_misses"] = dict(recording.misses)
+    result["config"] = {k: v for k, v in vars(args).items() if k not in ("output", "compare")}
+    result["commit"] = benchmark.git_commit()
+    result["timestamp"] = time.strftime("%Y-%m-%dT%H:%M:%S%z")
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay captured QuitBet traffic with recorded upstream responses")
+    parser.add_argument("capture", help="JSONL written with CAPTURE_FILE set")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="pace multiplier for request gaps and upstream latency; 0 = no waiting")
+    parser.add_argument("--workers", type=int, default=16, help="requests in flight at once, at most")
+    parser.add_argument("--seed", type=int, default=0, help="seed for random (retry jitter, fake data)")
+    parser.add_argument("--users-db", help="users database to start from (copied first)")
+    parser.add_argument("--output", help="where to write the JSON results")
+    parser.add_argument("--compare", help="earlier results JSON to diff against")
+    args = parser.parse_args()
+
+    args.capture = os.path.abspath(args.capture)
+    args.users_db = args.users_db and os.path.abspath(args.users_db)
+    output = args.output and os.path.abspath(args.output)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    result = run(args)
+    benchmark.print_summary(result, baseline)
+    print(f"status mismatches: {result['status_mismatches'] or 'none'}  upstream served: {result['upstream_served']}"
+          f"  misses: {result['upstream_misses'] or 'none'}")
+
+    if output is None:
+        results_dir = os.path.join(benchmark.ROOT, "bench_results")
+        os.makedirs(results_dir, exist_ok=True)
+        output = os.path.join(results_dir, f"{result['commit']}-replay-{int(time.time())}.json")
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"📝 Results written to {output}")
@@ -0,0 +1,94 @@
+import argparse
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ratelimit import RateLimiter
+
+# Background sweeps that precompute each user's progress and daily check-in so
+# /transactions/<email> only has to read stored state.
+#
+# In-process: set SCHEDULER_ENABLED=1 and app.py starts a Scheduler thread.
+# Out of process: `python scheduler.py --once` (cron) or `python scheduler.py`.
+
+SCHEDULER_INTERVAL = float(os.getenv("SCHEDULER_INTERVAL", "3600"))  # seconds between sweeps
+SCHEDULER_WORKERS = int(os.getenv("SCHEDULER_WORKERS", "4"))
+
+# Per-upstream limits shared by all sweep workers (requests per second)
+plaid_limiter = RateLimiter(float(os.getenv("PLAID_RATE_LIMIT", "5")))
+gemini_limiter = RateLimiter(float(os.getenv("GEMINI_RATE_LIMIT", "1")))
+
+
+# Run `job(email)` for every email on a bounded worker pool; one failing user
+# never stops the sweep
+def sweep(emails, job, workers=SCHEDULER_WORKERS):
+    started = time.monotonic()
+    done = failed = 0
+
+    def run(email):
+        try:
+            job(email)
+            return True
+        except Exception as e:
+            print(f"⚠️ Precompute failed for {email}: {e}")
+            return False
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sweep") as pool:
+        for ok in pool.map(run, emails):
+            if ok:
+                done += 1
+            else:
+                failed += 1
+
+    return {"users": done, "failed": failed, "seconds": round(time.monotonic() - started, 2)}
+
+
+class Scheduler:
+    def __init__(self, run_sweep, interval=SCHEDULER_INTERVAL):
+        self.run_sweep = run_sweep
+        self.interval = interval
+        self.last_result = None
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="scheduler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _loop(self):
+        while not self._stopped.is_set():
+            try:
+                self.last_result = self.run_sweep()
+                print(f"🗓️ Sweep finished: {self.last_result}")
+            except Exception as e:
+                print(f"⚠️ Sweep failed: {e}")
+            self._stopped.wait(self.interval)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute QuitBet progress and daily check-ins")
+    parser.add_argument("--once", action="store_true", help="run a single sweep and exit")
+    parser.add_argument("--interval", type=float, default=SCHEDULER_INTERVAL, help="seconds between sweeps")
+    args = parser.parse_args()
+
+    import app
+
+    if args.once:
+        print(app.run_sweep())
+    else:
+        scheduler = Scheduler(app.run_sweep, args.interval)
+        scheduler.start()
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            scheduler.stop()
+    app.user_store.close()
@@ -0,0 +1,109 @@
+import asyncio
+import os
+import threading
+from collections import defaultdict
+
+import metrics
+
+# Request coalescing and per-user admission control.
+#
+# SingleFlight.do(key, fn): the first caller for a key runs fn; callers that
+# arrive while it is running wait for it and get the same result (or the same
+# exception) instead of repeating the work. Nothing is cached afterwards; the
+# next call after it finishes runs fn again.
+#
+# Admission caps how many requests one user can have in flight, so a user with
+# a pile of tabs open can't occupy every worker thread.
+
+USER_MAX_IN_FLIGHT = int(os.getenv("USER_MAX_IN_FLIGHT", "4"))
+
+coalesced = metrics.register(metrics.Counter(
+    "quitbet_singleflight_total", "Coalesced calls by kind and role (leader ran it, follower waited)"))
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        coalesced.inc(kind=key[0], role="leader" if leader else "follower")
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        try:
+            call.value = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.value
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+
+# The same for coroutines on one event loop. The shared task is shielded, so a
+# follower that gives up (client disconnect, timeout) doesn't cancel it for
+# everyone else.
+class AsyncSingleFlight:
+    def __init__(self):
+        self._tasks = {}
+
+    async def do(self, key, make_coroutine):
+        task = self._tasks.get(key)
+        coalesced.inc(kind=key[0], role="follower" if task is not None else "leader")
+        if task is None:
+            task = self._tasks[key] = asyncio.ensure_future(make_coroutine())
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        return await asyncio.shield(task)
+
+    def in_flight(self):
+        return len(self._tasks)
+
+
+class Admission:
+    def __init__(self, limit=USER_MAX_IN_FLIGHT):
+        self.limit = limit
+        self.rejected = 0
+        self._in_flight = defaultdict(int)
+        self._lock = threading.Lock()
+
+    # False when the user already has `limit` requests running
+    def try_enter(self, user):
+        with self._lock:
+            if self._in_flight[user] >= self.limit:
+                self.rejected += 1
+                return False
+            self._in_flight[user] += 1
+            return True
+
+    def leave(self, user):
+        with self._lock:
+            self._in_flight[user] -= 1
+            if self._in_flight[user] <= 0:
+                del self._in_flight[user]
+
+    def stats(self):
+        with self._lock:
+            return {"limit": self.limit, "users_in_flight": len(self._in_flight), "rejected": self.rejected}
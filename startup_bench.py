@@ -0,0 +1,84 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+# Cold-start benchmark: imports the app in a fresh interpreter a few times and
+# reports wall time plus the slowest modules from `python -X importtime`.
+#
+#   python startup_bench.py                  # table of the slowest imports
+#   python startup_bench.py --max-ms 800     # exit 1 if import takes longer (CI)
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+TIMER = ("import time, warnings; warnings.filterwarnings('ignore'); started = time.perf_counter(); "
+         "import {module}; print(time.perf_counter() - started)")
+
+
+def run_once(module, env):
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", TIMER.format(module=module)],
+                            cwd=ROOT, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr[-2000:])
+    return float(result.stdout.strip().splitlines()[-1]), parse_importtime(result.stderr)
+
+
+# Lines look like "import time:      1234 |      56789 |   package.module"
+def parse_importtime(stderr):
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure how long the app takes to import")
+    parser.add_argument("--module", default="app")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=15, help="slowest top-level imports to list")
+    parser.add_argument("--max-ms", type=float, help="fail if the median import exceeds this")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    # A scratch database so the measurement doesn't depend on local data
+    workdir = tempfile.mkdtemp(prefix="quitbet-startup-")
+    env = dict(os.environ, USERS_DB=os.path.join(workdir, "quitbet.db"), WARMUP="0")
+
+    walls = []
+    per_module = {}
+    for _ in range(args.runs):
+        wall, modules = run_once(args.module, env)
+        walls.append(wall)
+        for name, (self_us, cumulative_us) in modules.items():
+            per_module.setdefault(name, []).append(cumulative_us)
+
+    median_ms = statistics.median(walls) * 1000
+    # Only the top-level packages: they're what the app chooses to import
+    top_level = {name: statistics.median(v) / 1000 for name, v in per_module.items() if "." not in name}
+    slowest = sorted(top_level.items(), key=lambda kv: kv[1], reverse=True)[:args.top]
+
+    print(f"import {args.module}: median {median_ms:.0f} ms over {args.runs} runs "
+          f"({', '.join(f'{w * 1000:.0f}' for w in walls)} ms)")
+    print(f"{'module':<40}{'cumulative ms':>14}")
+    for name, ms in slowest:
+        print(f"{name:<40}{ms:>14.1f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"module": args.module, "median_ms": round(median_ms, 1),
+                       "runs_ms": [round(w * 1000, 1) for w in walls],
+                       "modules_ms": {name: round(ms, 1) for name, ms in slowest}}, f, indent=2)
+
+    if args.max_ms is not None and median_ms > args.max_ms:
+        print(f"❌ Import took {median_ms:.0f} ms, budget is {args.max_ms:.0f} ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,498 @@
+import atexit
+import contextvars
+import copy
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+
+
+# Pluggable user storage.
+#
+# Every backend exposes the same three calls:
+#   load_all()             -> {email: user_dict}
+#   save(users, emails)    -> persist the given users (None = all of them)
+#   close()
+#
+# The JSON backend can only rewrite the whole file; the SQLite backend writes
+# just the rows belonging to the emails that changed.
+
+
+class JsonUserStore:
+    writes_whole_file = True
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def load_all(self):
+        if os.path.exists(self.path):
+            with open(self.path, "r") as f:
+                return json.load(f)
+        return {}
+
+    # Write to a temp file next to the target and rename it into place, so a
+    # crash mid-write never leaves a truncated users.json behind
+    def save(self, users, emails=None):
+        with self._lock:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            fd, tmp_path = tempfile.mkstemp(prefix=".users-", suffix=".json", dir=directory)
+            try:
+                with os.fdopen(fd, "w") as f:
+                    json.dump(users, f, indent=2)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+
+    def close(self):
+        pass
+
+
+# Columns that get their own typed column; anything else ends up in `extra`
+USER_COLUMNS = ("password", "daily_spend_estimate")
+PROGRESS_COLUMNS = ("last_gambling_date", "days_clean", "money_saved", "last_checkin_date")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    email TEXT PRIMARY KEY,
+    password TEXT,
+    daily_spend_estimate NUMERIC,
+    extra TEXT
+);
+CREATE TABLE IF NOT EXISTS tokens (
+    email TEXT PRIMARY KEY REFERENCES users(email) ON DELETE CASCADE,
+    access_token TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS progress (
+    email TEXT PRIMARY KEY REFERENCES users(email) ON DELETE CASCADE,
+    last_gambling_date TEXT,
+    days_clean INTEGER,
+    money_saved REAL,
+    last_checkin_date TEXT,
+    extra TEXT
+);
+CREATE TABLE IF NOT EXISTS weekly_checkin (
+    email TEXT PRIMARY KEY REFERENCES users(email) ON DELETE CASCADE,
+    actual_spent REAL,
+    goal_to_save REAL,
+    limit_amount NUMERIC
+);
+-- Plaid webhooks only name the Item, so look users up by item_id
+CREATE INDEX IF NOT EXISTS users_item_id ON users (json_extract(extra, '$.item_id'));
+"""
+
+
+# WAL lets readers run alongside the single writer
+def connect_sqlite(path):
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA foreign_keys=ON")
+    return conn
+
+
+class SqliteUserStore:
+    writes_whole_file = False
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.executescript(SCHEMA)
+        # A forked worker must never reuse the parent's connections
+        os.register_at_fork(after_in_child=self._forget_connections)
+
+    def _forget_connections(self):
+        self._local = threading.local()
+
+    # One connection per thread
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = connect_sqlite(self.path)
+        return conn
+
+    def is_empty(self):
+        return self._conn().execute("SELECT 1 FROM users LIMIT 1").fetchone() is None
+
+    def list_emails(self):
+        return [row[0] for row in self._conn().execute("SELECT email FROM users")]
+
+    def email_for_item(self, item_id):
+        row = self._conn().execute(
+            "SELECT email FROM users WHERE json_extract(extra, '$.item_id') = ?", (item_id,)).fetchone()
+        return row[0] if row else None
+
+    def load_all(self):
+        conn = self._conn()
+        users = {}
+        for email, password, estimate, extra in conn.execute(
+                "SELECT email, password, daily_spend_estimate, extra FROM users"):
+            users[email] = _row_to_user(password, estimate, extra)
+
+        for email, token in conn.execute("SELECT email, access_token FROM tokens"):
+            users[email]["access_token"] = token
+
+        for row in conn.execute(
+                "SELECT email, last_gambling_date, days_clean, money_saved, last_checkin_date, extra FROM progress"):
+            users[row[0]]["progress"] = _row_to_progress(row[1:])
+
+        for email, actual, goal, limit in conn.execute(
+                "SELECT email, actual_spent, goal_to_save, limit_amount FROM weekly_checkin"):
+            users[email]["weekly_checkin"] = {"actual_spent": actual, "goal_to_save": goal, "limit": limit}
+
+        return users
+
+    def load_user(self, email):
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT password, daily_spend_estimate, extra FROM users WHERE email = ?", (email,)).fetchone()
+        if row is None:
+            return None
+        user = _row_to_user(*row)
+
+        token = conn.execute("SELECT access_token FROM tokens WHERE email = ?", (email,)).fetchone()
+        if token:
+            user["access_token"] = token[0]
+
+        row = conn.execute(
+            "SELECT last_gambling_date, days_clean, money_saved, last_checkin_date, extra FROM progress WHERE email = ?",
+            (email,)).fetchone()
+        if row:
+            user["progress"] = _row_to_progress(row)
+
+        row = conn.execute(
+            "SELECT actual_spent, goal_to_save, limit_amount FROM weekly_checkin WHERE email = ?",
+            (email,)).fetchone()
+        if row:
+            user["weekly_checkin"] = {"actual_spent": row[0], "goal_to_save": row[1], "limit": row[2]}
+        return user
+
+    def save(self, users, emails=None):
+        if emails is None:
+            emails = list(users)
+        conn = self._conn()
+        with conn:
+            for email in emails:
+                user = users.get(email)
+                if user is None:
+                    conn.execute("DELETE FROM users WHERE email = ?", (email,))
+                else:
+                    _write_user(conn, email, user)
+
+    # Apply (email, base, user) edits made to copies loaded as `base`: only the
+    # fields that differ from base are written, on top of the row as it is
+    # now, so another process's concurrent edits to other fields survive.
+    # base=None (not loaded before) writes the user as given.
+    def save_changes(self, changes):
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")  # nobody writes between the read and the write
+            for email, base, user in changes:
+                if user is None:
+                    if base is not None:
+                        conn.execute("DELETE FROM users WHERE email = ?", (email,))
+                    continue
+                current = self.load_user(email) if base is not None else None
+                _write_user(conn, email, user if current is None else merge_changes(base, user, current))
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+def _row_to_user(password, estimate, extra):
+    user = json.loads(extra) if extra else {}
+    user["password"] = password
+    if estimate is not None:
+        user["daily_spend_estimate"] = estimate
+    return user
+
+
+def _row_to_progress(row):
+    progress = json.loads(row[4]) if row[4] else {}
+    progress.update({
+        "last_gambling_date": row[0],
+        "days_clean": row[1],
+        "money_saved": row[2],
+    })
+    if row[3] is not None:
+        progress["last_checkin_date"] = row[3]
+    return progress
+
+
+_MISSING = object()
+
+
+# `current` with every key that went from base to mine applied; nested dicts
+# (progress, weekly_checkin) are merged key by key
+def merge_changes(base, mine, current):
+    merged = dict(current)
+    for key in base.keys() | mine.keys():
+        old, new = base.get(key, _MISSING), mine.get(key, _MISSING)
+        if old == new:
+            continue
+        if isinstance(old, dict) and isinstance(new, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge_changes(old, new, merged[key])
+        elif new is _MISSING:
+            merged.pop(key, None)
+        else:
+            merged[key] = new
+    return merged
+
+
+def _write_user(conn, email, user):
+    extra = {k: v for k, v in user.items()
+             if k not in USER_COLUMNS and k not in ("access_token", "progress", "weekly_checkin")}
+    conn.execute(
+        "INSERT INTO users (email, password, daily_spend_estimate, extra) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT(email) DO UPDATE SET password = excluded.password, "
+        "daily_spend_estimate = excluded.daily_spend_estimate, extra = excluded.extra",
+        (email, user.get("password"), user.get("daily_spend_estimate"), json.dumps(extra) if extra else None))
+
+    if user.get("access_token"):
+        conn.execute(
+            "INSERT INTO tokens (email, access_token) VALUES (?, ?) "
+            "ON CONFLICT(email) DO UPDATE SET access_token = excluded.access_token",
+            (email, user["access_token"]))
+    else:
+        conn.execute("DELETE FROM tokens WHERE email = ?", (email,))
+
+    progress = user.get("progress")
+    if progress is not None:
+        extra = {k: v for k, v in progress.items() if k not in PROGRESS_COLUMNS}
+        conn.execute(
+            "INSERT INTO progress (email, last_gambling_date, days_clean, money_saved, last_checkin_date, extra) "
+            "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(email) DO UPDATE SET "
+            "last_gambling_date = excluded.last_gambling_date, days_clean = excluded.days_clean, "
+            "money_saved = excluded.money_saved, last_checkin_date = excluded.last_checkin_date, "
+            "extra = excluded.extra",
+            (email, progress.get("last_gambling_date"), progress.get("days_clean"),
+             progress.get("money_saved"), progress.get("last_checkin_date"),
+             json.dumps(extra) if extra else None))
+    else:
+        conn.execute("DELETE FROM progress WHERE email = ?", (email,))
+
+    checkin = user.get("weekly_checkin")
+    if checkin is not None:
+        conn.execute(
+            "INSERT INTO weekly_checkin (email, actual_spent, goal_to_save, limit_amount) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(email) DO UPDATE SET actual_spent = excluded.actual_spent, "
+            "goal_to_save = excluded.goal_to_save, limit_amount = excluded.limit_amount",
+            (email, checkin.get("actual_spent"), checkin.get("goal_to_save"), checkin.get("limit")))
+    else:
+        conn.execute("DELETE FROM weekly_checkin WHERE email = ?", (email,))
+
+
+# Write-behind wrapper around any backend.
+#
+# save() only marks users dirty; flush() writes every dirty user in one go.
+# The app flushes once at request teardown, and optionally a background thread
+# flushes every `interval` seconds or as soon as `max_dirty` users pile up.
+class WriteBehindStore:
+    def __init__(self, backend, interval=None, max_dirty=None):
+        self.backend = backend
+        self.interval = interval
+        self.max_dirty = max_dirty
+        self.flush_count = 0
+        self._users = None
+        self._dirty = {}  # email -> the user dict to write (None = deleted)
+        self._changes = {}  # email -> [(base, user)] for SharedUsers, see save_changes()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._thread_pid = None
+        atexit.register(self.close)
+
+    def load_all(self):
+        self._users = self.backend.load_all()
+        return self._users
+
+    # Hold on to the user dicts themselves, so a flush from another thread
+    # writes exactly what the caller saved. Users from SharedUsers also keep
+    # the copy they were loaded as, so only what changed gets written.
+    def save(self, users, emails=None):
+        snapshot = getattr(users, "snapshot", None)
+        with self._lock:
+            self._users = users
+            for email in (list(users) if emails is None else emails):
+                user = self._dirty[email] = users.get(email)
+                if snapshot is not None:
+                    edits = self._changes.setdefault(email, [])
+                    if not any(saved is user for _, saved in edits):
+                        edits.append((snapshot(email), user))
+            pending = len(self._dirty)
+        if self.max_dirty and pending >= self.max_dirty:
+            self._wake.set()
+
+    def pending(self):
+        with self._lock:
+            return len(self._dirty)
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                if not self._dirty:
+                    return 0
+                dirty, self._dirty = self._dirty, {}
+                changes, self._changes = self._changes, {}
+            try:
+                if changes:
+                    self.backend.save_changes(
+                        [(email, base, user) for email in sorted(changes) for base, user in changes[email]])
+                rest = [email for email in dirty if email not in changes]
+                if rest:
+                    source = self._users if self.backend.writes_whole_file else dirty
+                    self.backend.save(source, sorted(rest))
+            except Exception:
+                # Keep them dirty so the next flush retries (newer saves win)
+                with self._lock:
+                    self._dirty = {**dirty, **self._dirty}
+                    self._changes = {email: changes.get(email, []) + self._changes.get(email, [])
+                                     for email in changes.keys() | self._changes.keys()}
+                raise
+            self.flush_count += 1
+            return len(dirty)
+
+    # Threads don't survive fork(), so a pre-forking server calls this again
+    # in every worker
+    def start(self):
+        if self._thread_pid != os.getpid():
+            self._thread = None
+        if self._thread is None and (self.interval or self.max_dirty):
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name="user-store-flusher", daemon=True)
+            self._thread.start()
+            self._thread_pid = os.getpid()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"⚠️ Background flush failed: {e}")
+
+    def close(self):
+        if self._thread is not None and self._thread_pid == os.getpid():
+            self._stopped.set()
+            self._wake.set()
+            self._thread.join()
+            self._thread = None
+        self.flush()
+        self.backend.close()
+
+
+# Users mapping for running several worker processes against one SQLite file.
+#
+# Nothing is held in memory between requests: inside a scope() (one per
+# request, or per scheduler job; tracked in a context variable so concurrent
+# requests on an asyncio event loop get separate scopes) each user is loaded
+# from the database on first access and the same dict is returned for the rest
+# of the scope, so handlers can keep mutating users[email] and calling
+# save_users() as usual. Every process therefore sees the latest committed
+# state. A copy of each user as loaded is kept too, and a flush only writes the
+# fields that differ from it, so two processes changing the same user at once
+# don't overwrite each other's edits.
+class SharedUsers(MutableMapping):
+    def __init__(self, backend):
+        self.backend = backend
+        self._cache = contextvars.ContextVar(f"shared_users_{id(self)}", default=None)
+        self._loaded = contextvars.ContextVar(f"shared_users_loaded_{id(self)}", default=None)
+
+    @contextmanager
+    def scope(self):
+        tokens = None
+        if self._cache.get() is None:
+            tokens = self._cache.set({}), self._loaded.set({})
+        try:
+            yield self
+        finally:
+            if tokens is not None:
+                self._cache.reset(tokens[0])
+                self._loaded.reset(tokens[1])
+
+    def _load(self, email):
+        cache = self._cache.get()
+        if cache is not None and email in cache:
+            return cache[email]
+        user = self.backend.load_user(email)
+        if cache is not None:
+            cache[email] = user
+            self._loaded.get()[email] = copy.deepcopy(user)
+        return user
+
+    # The user as it was loaded in this scope (None: new, or not loaded)
+    def snapshot(self, email):
+        loaded = self._loaded.get()
+        return loaded.get(email) if loaded is not None else None
+
+    def __getitem__(self, email):
+        user = self._load(email)
+        if user is None:
+            raise KeyError(email)
+        return user
+
+    def __setitem__(self, email, user):
+        cache = self._cache.get()
+        if cache is None:
+            raise RuntimeError("SharedUsers can only be modified inside scope()")
+        cache[email] = user
+
+    def __delitem__(self, email):
+        self[email]
+        self._cache.get()[email] = None
+
+    def __contains__(self, email):
+        return self._load(email) is not None
+
+    def __iter__(self):
+        return iter(self.backend.list_emails())
+
+    def __len__(self):
+        return len(self.backend.list_emails())
+
+    # One query for everything instead of one per user (read-only snapshot)
+    def items(self):
+        return self.backend.load_all().items()
+
+
+# One-shot import of an existing users.json into a SQLite database
+def migrate_json_to_sqlite(json_path, db_path):
+    users = JsonUserStore(json_path).load_all()
+    store = SqliteUserStore(db_path)
+    store.save(users)
+    store.close()
+    return len(users)
+
+
+def open_store(backend, json_path, db_path):
+    if backend == "json":
+        return JsonUserStore(json_path)
+    if backend == "sqlite":
+        store = SqliteUserStore(db_path)
+        # First start on SQLite: carry over whatever users.json already holds
+        if store.is_empty() and os.path.exists(json_path):
+            store.save(JsonUserStore(json_path).load_all())
+        return store
+    raise ValueError(f"Unknown USERS_BACKEND: {backend}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] != "migrate":
+        print("usage: python storage.py migrate <users.json> <quitbet.db>")
+        sys.exit(1)
+    count = migrate_json_to_sqlite(sys.argv[2], sys.argv[3])
+    print(f"✅ Migrated {count} users from {sys.argv[2]} to {sys.argv[3]}")
@@ -0,0 +1,25 @@
+import time
+
+import ai_pool
+import fakes
+import model_router
+import upstream
+
+
+# Gemini hangs: the call gives up when the page stops waiting, retries and
+# fallback tier included, instead of holding the pool thread for minutes
+def test_generation_stops_at_ai_timeout(monkeypatch):
+    monkeypatch.setattr(ai_pool, "AI_TIMEOUT", 0.5)
+    monkeypatch.setattr(fakes.FakeGenerativeModel, "latency", fakes.Latency("fixed:30"))
+    upstream.breakers.clear()
+    router = model_router.ModelRouter(lambda: fakes.FakeGenAI())
+
+    started = time.monotonic()
+    future = ai_pool.submit(router.generate, "insight", "prompt")
+    assert ai_pool.result_or(future, "fallback") == "fallback"
+    try:
+        future.result(timeout=5)
+    except TimeoutError:
+        pass
+    assert time.monotonic() - started < 1.5
+    upstream.breakers.clear()
@@ -0,0 +1,15 @@
+from benchmark import percentile
+
+
+def test_nearest_rank():
+    values = list(range(1, 21))
+    assert percentile(values, 95) == values[18]
+    assert percentile(values, 100) == 20
+    assert percentile(list(range(1, 11)), 50) == 5
+    assert percentile(list(range(1, 101)), 7) == 7
+
+
+def test_bounds():
+    assert percentile([], 50) is None
+    assert percentile([3], 99) == 3
+    assert percentile([1, 2, 3], 0) == 1
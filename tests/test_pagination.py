@@ -0,0 +1,48 @@
+import time
+from datetime import date, timedelta
+
+import pytest
+
+import fakes
+import upstream
+from txn_store import iter_transactions
+
+
+@pytest.fixture
+def plaid():
+    upstream.breakers.clear()
+    upstream._last_good.clear()
+    yield upstream.ResilientPlaid(fakes.FakePlaid(history_days=61))
+    upstream.breakers.clear()
+    upstream._last_good.clear()
+
+
+def open_breaker():
+    breaker = upstream.get_breaker("plaid")
+    breaker.state = "open"
+    breaker.opened_at = time.monotonic()
+
+
+def fetch(plaid, start, end):
+    return [t["transaction_id"] for t in iter_transactions(plaid, "access-sandbox-test", start, end, page_size=50)]
+
+
+# With the breaker open, each page comes back as remembered for that offset
+def test_pages_with_breaker_open(plaid):
+    end = date.today()
+    start = end - timedelta(days=60)
+    fetched = fetch(plaid, start, end)
+    assert len(fetched) == 122
+
+    open_breaker()
+    assert fetch(plaid, start, end) == fetched
+
+
+# A window that was never fetched isn't answered with another window's pages
+def test_other_window_with_breaker_open(plaid):
+    end = date.today()
+    fetch(plaid, end - timedelta(days=60), end)
+
+    open_breaker()
+    with pytest.raises(upstream.CircuitOpenError):
+        fetch(plaid, end - timedelta(days=30), end)
@@ -0,0 +1,37 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+
+import prompts
+
+
+def history(days=60):
+    txns, gambling = [], []
+    for n in range(days):
+        day = date(2026, 9, 1) + timedelta(days=n)
+        txns.append({"name": f"Store number {n}", "amount": 10 + n, "date": day,
+                     "datetime": datetime(day.year, day.month, day.day, n % 24)})
+        bet = {"name": f"Sportsbook number {n}", "amount": 50 + n, "date": day,
+               "datetime": datetime(day.year, day.month, day.day, n % 24)}
+        txns.append(bet)
+        gambling.append(bet)
+    return txns, gambling
+
+
+PATTERNS = {"gambling_count": 60, "rolling_7": 400.0, "rolling_30": 1500.0, "peak_hour": 23,
+            "peak_weekday": "Saturday", "weekly_limit": 500, "week_to_date": 120.0}
+
+
+@pytest.mark.parametrize("budget", [700, 300, 200, 120, 40])
+def test_prompts_stay_within_budget(budget):
+    txns, gambling = history()
+    insight = prompts.insight_prompt("someone@test.io", txns, gambling, patterns=PATTERNS, budget=budget)
+    question = prompts.question_prompt(txns, gambling, 3, budget=budget)
+    assert prompts.estimate_tokens(insight) <= budget
+    assert prompts.estimate_tokens(question) <= budget
+
+
+def test_roomy_budget_keeps_everything():
+    txns, gambling = history(5)
+    prompt = prompts.insight_prompt("someone@test.io", txns, gambling, patterns=PATTERNS, budget=5000)
+    assert "Gambling by hour" in prompt and "Heaviest betting day" in prompt
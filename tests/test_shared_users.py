@@ -0,0 +1,46 @@
+import storage
+
+
+def open_worker(path):
+    store = storage.WriteBehindStore(storage.SqliteUserStore(path))
+    return store, storage.SharedUsers(store.backend)
+
+
+# Two workers change the same user at once; each flush keeps the other's edit
+def test_concurrent_edits_both_survive(tmp_path):
+    path = str(tmp_path / "quitbet.db")
+    storage.SqliteUserStore(path).save({"u@test.io": {
+        "password": "x", "access_token": "access-1",
+        "progress": {"last_gambling_date": "2026-10-01", "days_clean": 3, "money_saved": 30.0}}})
+    store_a, users_a = open_worker(path)
+    store_b, users_b = open_worker(path)
+
+    with users_a.scope(), users_b.scope():
+        dashboard = users_a["u@test.io"]
+        survey = users_b["u@test.io"]
+
+        survey["weekly_checkin"] = {"actual_spent": 1, "goal_to_save": 2, "limit": 500}
+        store_b.save(users_b, ["u@test.io"])
+        store_b.flush()
+
+        dashboard["progress"]["days_clean"] = 4
+        store_a.save(users_a, ["u@test.io"])
+        store_a.flush()
+
+    user = storage.SqliteUserStore(path).load_user("u@test.io")
+    assert user["weekly_checkin"] == {"actual_spent": 1, "goal_to_save": 2, "limit": 500}
+    assert user["progress"]["days_clean"] == 4
+    assert user["access_token"] == "access-1"
+
+
+def test_removed_field_is_removed(tmp_path):
+    path = str(tmp_path / "quitbet.db")
+    storage.SqliteUserStore(path).save({"u@test.io": {"password": "x", "access_token": "access-1"}})
+    store, users = open_worker(path)
+
+    with users.scope():
+        del users["u@test.io"]["access_token"]
+        store.save(users, ["u@test.io"])
+        store.flush()
+
+    assert "access_token" not in storage.SqliteUserStore(path).load_user("u@test.io")
@@ -0,0 +1,60 @@
+import json
+
+import pytest
+
+import fakes
+import txn_store
+
+
+class MutationError(Exception):
+    def __init__(self):
+        super().__init__("mutation during pagination")
+        self.status = 400
+        self.body = json.dumps({"error_code": txn_store.MUTATION_DURING_PAGINATION})
+
+
+# FakePlaid whose sync fails on the given calls (1-based)
+class FlakyPlaid(fakes.FakePlaid):
+    def __init__(self, fail_on, error):
+        super().__init__(history_days=30, page_size=25)
+        self.fail_on = fail_on
+        self.error = error
+        self.cursors = []
+
+    def transactions_sync(self, request, **kwargs):
+        self.cursors.append(request.get("cursor"))
+        if len(self.cursors) in self.fail_on:
+            raise self.error
+        return super().transactions_sync(request, **kwargs)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return txn_store.TransactionStore(str(tmp_path / "txns.db"))
+
+
+def test_restarts_from_original_cursor(store):
+    plaid = FlakyPlaid({2}, MutationError())
+    counts = txn_store.sync_user(plaid, store, "u@test.io", "access-sandbox-test")
+
+    assert plaid.cursors[:3] == [None, "25", None]
+    assert counts["added"] == 60
+    assert len(store.list_transactions("u@test.io")) == 60
+    assert store.get_cursor("u@test.io") == "60"
+
+
+def test_failure_mid_sync_stores_nothing(store):
+    plaid = FlakyPlaid({2}, TimeoutError("slow"))
+    with pytest.raises(TimeoutError):
+        txn_store.sync_user(plaid, store, "u@test.io", "access-sandbox-test")
+
+    assert store.list_transactions("u@test.io") == []
+    assert store.get_cursor("u@test.io") is None
+
+
+def test_before_call_runs_for_every_request(store):
+    plaid = FlakyPlaid({2}, MutationError())
+    calls = []
+    txn_store.sync_user(plaid, store, "u@test.io", "access-sandbox-test", before_call=lambda: calls.append(1))
+
+    assert len(calls) == len(plaid.cursors) == 5
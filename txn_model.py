@@ -0,0 +1,144 @@
+from datetime import date, datetime
+
+# Normalized transaction record.
+#
+# Transactions arrive as Plaid model objects (/transactions/get), dicts from
+# the local store or the demo generator. Each is converted once into a slotted
+# Transaction: the date becomes an ordinal, the hour is parsed out of the
+# timestamp, and the merchant key is computed up front. The gambling flag is
+# filled in by classify(). After that nothing on the request path parses a
+# date or looks up a key by name again.
+#
+# Records still answer txn.get("name") and txn.date, so the classifier, the
+# prompt builders and the templates take them as they are.
+
+
+def _get(txn, name):
+    try:
+        return txn.get(name)
+    except AttributeError:
+        return getattr(txn, name, None)
+
+
+# Ordinals by ISO date string; a two-year history has ~730 distinct dates
+_ordinals = {}
+
+
+def _day(value):
+    if isinstance(value, str):
+        ordinal = _ordinals.get(value)
+        if ordinal is None:
+            if len(_ordinals) > 4096:
+                _ordinals.clear()
+            ordinal = _ordinals[value] = date.fromisoformat(value[:10]).toordinal()
+        return ordinal
+    if isinstance(value, datetime):
+        return value.date().toordinal()
+    return value.toordinal()
+
+
+# "2024-05-01T21:14:00Z": the hour is characters 11-12, no need to parse
+def _hour(value):
+    if isinstance(value, str):
+        return int(value[11:13]) if len(value) >= 13 and value[13:14] == ":" else -1
+    return value.hour if isinstance(value, datetime) else -1
+
+
+def _category(pfc, category):
+    if pfc is not None and not isinstance(pfc, str):
+        pfc = pfc.get("detailed") or pfc.get("primary")
+    return pfc, tuple(category) if category else None
+
+
+class Transaction:
+    __slots__ = ("transaction_id", "name", "merchant_name", "amount", "day", "hour",
+                 "category", "personal_finance_category", "pending", "winnings", "merchant_key", "gambling")
+
+    def __init__(self, transaction_id, name, merchant_name, amount, day, hour=-1, category=None,
+                 personal_finance_category=None, pending=False, winnings=None):
+        self.transaction_id = transaction_id
+        self.name = name
+        self.merchant_name = merchant_name
+        self.amount = amount
+        self.day = day
+        self.hour = hour
+        self.category = category
+        self.personal_finance_category = personal_finance_category
+        self.pending = pending
+        self.winnings = winnings
+        self.merchant_key = (merchant_name or name or "").strip().lower()
+        self.gambling = None
+
+    @classmethod
+    def from_plaid(cls, txn):
+        # Dicts (store, demo data, async client) take the direct path
+        get = txn.get if isinstance(txn, dict) else lambda name: _get(txn, name)
+        pfc, category = _category(get("personal_finance_category"), get("category"))
+        timestamp = get("datetime") or get("authorized_datetime")
+        winnings = get("winnings")
+        return cls(
+            get("transaction_id"),
+            get("name"),
+            get("merchant_name"),
+            float(get("amount") or 0),
+            _day(get("date")),
+            _hour(timestamp) if timestamp else -1,
+            category,
+            pfc,
+            bool(get("pending")),
+            None if winnings is None else float(winnings),
+        )
+
+    @property
+    def date(self):
+        return date.fromordinal(self.day)
+
+    def get(self, name, default=None):
+        value = getattr(self, name, None)
+        return default if value is None else value
+
+    def __repr__(self):
+        return f"Transaction({self.date} {self.name!r} {self.amount:.2f})"
+
+
+def from_plaid(txns):
+    return [Transaction.from_plaid(txn) for txn in txns]
+
+
+# Sets .gambling on every record. Records sharing name, merchant and category
+# share a verdict, so the classifier sees each distinct one once rather than
+# every transaction
+def classify(records, classifier):
+    groups = {}
+    for record in records:
+        key = (record.name, record.merchant_name, record.personal_finance_category, record.category)
+        group = groups.get(key)
+        if group is None:
+            groups[key] = [record]
+        else:
+            group.append(record)
+    for group, flagged in zip(groups.values(), classifier.classify([group[0] for group in groups.values()])):
+        for record in group:
+            record.gambling = flagged
+    return records
+
+
+# Newest first, in place; gambling-only lists taken afterwards keep the order
+def sort_newest_first(records):
+    records.sort(key=lambda r: r.day, reverse=True)
+    return records
+
+
+# The NumPy columns analytics.analyze() works on, straight from the slots
+def columns(records):
+    import numpy as np  # imported on first use, like analytics
+
+    count = len(records)
+    return {
+        "day": np.fromiter((r.day for r in records), dtype=np.int32, count=count),
+        "amount": np.fromiter((r.amount for r in records), dtype=np.float64, count=count),
+        "hour": np.fromiter((r.hour for r in records), dtype=np.int8, count=count),
+        "gambling": np.fromiter((bool(r.gambling) for r in records), dtype=bool, count=count),
+        "winnings": np.fromiter((np.nan if r.winnings is None else r.winnings for r in records),
+                                dtype=np.float64, count=count),
+    }
@@ -0,0 +1,287 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from datetime import date, datetime
+
+from storage import connect_sqlite
+
+# Local copy of every user's Plaid transactions, kept current with
+# /transactions/sync. Each user has a cursor; a sync only pulls what was
+# added, modified or removed since that cursor, and pages are served straight
+# from the local table.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transactions (
+    email TEXT NOT NULL,
+    transaction_id TEXT NOT NULL,
+    name TEXT,
+    merchant_name TEXT,
+    amount REAL,
+    date TEXT,
+    datetime TEXT,
+    category TEXT,
+    personal_finance_category TEXT,
+    pending INTEGER,
+    PRIMARY KEY (email, transaction_id)
+);
+CREATE INDEX IF NOT EXISTS transactions_by_date ON transactions (email, date);
+CREATE TABLE IF NOT EXISTS sync_state (
+    email TEXT PRIMARY KEY,
+    cursor TEXT,
+    synced_at REAL
+);
+CREATE TABLE IF NOT EXISTS txn_versions (
+    email TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    changed_at REAL
+);
+"""
+
+COLUMNS = ("transaction_id", "name", "merchant_name", "amount", "date", "datetime",
+           "category", "personal_finance_category", "pending")
+
+
+def _iso(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def _txn_row(email, txn):
+    pfc = txn.get("personal_finance_category")
+    if pfc is not None and not isinstance(pfc, str):
+        pfc = pfc.get("detailed") or pfc.get("primary")
+    category = txn.get("category")
+    return (
+        email,
+        txn.get("transaction_id"),
+        txn.get("name"),
+        txn.get("merchant_name"),
+        txn.get("amount"),
+        _iso(txn.get("date")),
+        _iso(txn.get("datetime") or txn.get("authorized_datetime")),
+        json.dumps(list(category)) if category else None,
+        pfc,
+        1 if txn.get("pending") else 0,
+    )
+
+
+def _row_to_txn(row):
+    txn = dict(zip(COLUMNS, row))
+    txn["category"] = json.loads(txn["category"]) if txn["category"] else None
+    txn["pending"] = bool(txn["pending"])
+    return txn
+
+
+class TransactionStore:
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._conn().executescript(SCHEMA)
+        os.register_at_fork(after_in_child=self._forget_connections)
+
+    def _forget_connections(self):
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = connect_sqlite(self.path)
+        return conn
+
+    def get_cursor(self, email):
+        row = self._conn().execute("SELECT cursor FROM sync_state WHERE email = ?", (email,)).fetchone()
+        return row[0] if row else None
+
+    def last_synced(self, email):
+        row = self._conn().execute("SELECT synced_at FROM sync_state WHERE email = ?", (email,)).fetchone()
+        return row[0] if row else None
+
+    def is_stale(self, email, max_age):
+        synced_at = self.last_synced(email)
+        return synced_at is None or time.time() - synced_at > max_age
+
+    # Apply a whole sync, its (added, modified, removed) pages in order, and
+    # move the cursor to where it ended, all in one transaction
+    def apply_sync(self, email, pages, cursor):
+        conn = self._conn()
+        with conn:
+            changed = False
+            for added, modified, removed in pages:
+                rows = [_txn_row(email, txn) for txn in list(added) + list(modified)]
+                conn.executemany(
+                    f"INSERT OR REPLACE INTO transactions (email, {', '.join(COLUMNS)}) "
+                    f"VALUES ({', '.join('?' * (len(COLUMNS) + 1))})", rows)
+                conn.executemany(
+                    "DELETE FROM transactions WHERE email = ? AND transaction_id = ?",
+                    [(email, r.get("transaction_id")) for r in removed])
+                changed = changed or bool(rows or removed)
+            if changed:
+                self._bump_version(conn, email)
+            conn.execute(
+                "INSERT INTO sync_state (email, cursor, synced_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(email) DO UPDATE SET cursor = excluded.cursor, synced_at = excluded.synced_at",
+                (email, cursor, time.time()))
+
+    # Goes up whenever the user's stored transactions change; an empty sync page
+    # leaves it alone, so it can key caches of anything derived from them
+    def _bump_version(self, conn, email):
+        conn.execute(
+            "INSERT INTO txn_versions (email, version, changed_at) VALUES (?, 1, ?) "
+            "ON CONFLICT(email) DO UPDATE SET version = version + 1, changed_at = excluded.changed_at",
+            (email, time.time()))
+
+    # (version, changed_at), (0, None) before anything was stored
+    def version(self, email):
+        row = self._conn().execute(
+            "SELECT version, changed_at FROM txn_versions WHERE email = ?", (email,)).fetchone()
+        return (row[0], row[1]) if row else (0, None)
+
+    def list_transactions(self, email, start_date=None, end_date=None):
+        sql = f"SELECT {', '.join(COLUMNS)} FROM transactions WHERE email = ?"
+        params = [email]
+        if start_date:
+            sql += " AND date >= ?"
+            params.append(_iso(start_date))
+        if end_date:
+            sql += " AND date <= ?"
+            params.append(_iso(end_date))
+        sql += " ORDER BY date DESC, transaction_id"
+        return [_row_to_txn(row) for row in self._conn().execute(sql, params)]
+
+    # Keyset pagination in list_transactions() order (newest date first, then
+    # transaction id): up to `limit` rows after `after`, a (date, transaction_id)
+    # pair from the last row of the previous page
+    def page(self, email, start_date=None, end_date=None, after=None, limit=100):
+        sql = f"SELECT {', '.join(COLUMNS)} FROM transactions WHERE email = ?"
+        params = [email]
+        if start_date:
+            sql += " AND date >= ?"
+            params.append(_iso(start_date))
+        if end_date:
+            sql += " AND date <= ?"
+            params.append(_iso(end_date))
+        if after:
+            sql += " AND (date < ? OR (date = ? AND transaction_id > ?))"
+            params.extend([after[0], after[0], after[1]])
+        sql += " ORDER BY date DESC, transaction_id LIMIT ?"
+        params.append(limit)
+        return [_row_to_txn(row) for row in self._conn().execute(sql, params)]
+
+    # A new access token means a new Plaid item: start over from an empty cursor
+    def reset(self, email):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM transactions WHERE email = ?", (email,))
+            conn.execute("DELETE FROM sync_state WHERE email = ?", (email,))
+            self._bump_version(conn, email)
+
+
+# Plaid's answer when the data changed while a sync was paging through it: the
+# whole loop has to start over from the cursor it started with
+MUTATION_DURING_PAGINATION = "TRANSACTIONS_SYNC_MUTATION_DURING_PAGINATION"
+SYNC_RESTARTS = int(os.getenv("PLAID_SYNC_RESTARTS", "3"))
+
+
+def is_mutation_during_pagination(exc):
+    body = getattr(exc, "body", None)  # plaid.ApiException: JSON text; async_clients.PlaidHTTPError: dict
+    if isinstance(body, (str, bytes)):
+        try:
+            body = json.loads(body)
+        except ValueError:
+            return False
+    return isinstance(body, dict) and body.get("error_code") == MUTATION_DURING_PAGINATION
+
+
+def _counts(pages):
+    return {key: sum(len(page[n]) for page in pages) for n, key in enumerate(("added", "modified", "removed"))}
+
+
+# Pull everything that changed since the stored cursor. Pages are collected in
+# memory and applied together with the final cursor once has_more is false, so
+# the store never holds a partial update; a failed sync leaves the stored
+# cursor where it was and the next one starts from it again.
+#
+# `before_call`, if given, runs before every /transactions/sync request,
+# restarts included; pass a rate limiter's acquire to spend one token per call.
+def sync_user(plaid_client, store, email, access_token, before_call=None):
+    from plaid.model.transactions_sync_request import TransactionsSyncRequest
+
+    start = store.get_cursor(email)
+    for attempt in range(SYNC_RESTARTS + 1):
+        cursor, pages = start, []
+        try:
+            while True:
+                if cursor:
+                    sync_request = TransactionsSyncRequest(access_token=access_token, cursor=cursor)
+                else:
+                    sync_request = TransactionsSyncRequest(access_token=access_token)
+                if before_call is not None:
+                    before_call()
+                response = plaid_client.transactions_sync(sync_request)
+                pages.append((response["added"], response["modified"], response["removed"]))
+                cursor = response["next_cursor"]
+                if not response["has_more"]:
+                    break
+        except Exception as e:
+            if attempt < SYNC_RESTARTS and is_mutation_during_pagination(e):
+                continue
+            raise
+        store.apply_sync(email, pages, cursor)
+        return _counts(pages)
+
+
+# sync_user() for the async REST client (async_clients.py), which takes and
+# returns plain JSON bodies
+async def sync_user_async(plaid_client, store, email, access_token):
+    start = await asyncio.to_thread(store.get_cursor, email)
+    for attempt in range(SYNC_RESTARTS + 1):
+        cursor, pages = start, []
+        try:
+            while True:
+                body = {"access_token": access_token}
+                if cursor:
+                    body["cursor"] = cursor
+                response = await plaid_client.transactions_sync(body)
+                pages.append((response["added"], response["modified"], response["removed"]))
+                cursor = response["next_cursor"]
+                if not response["has_more"]:
+                    break
+        except Exception as e:
+            if attempt < SYNC_RESTARTS and is_mutation_during_pagination(e):
+                continue
+            raise
+        # SQLite may wait on another writer's lock; not on the event loop
+        await asyncio.to_thread(store.apply_sync, email, pages, cursor)
+        return _counts(pages)
+
+
+# /transactions/get returns at most `count` transactions per call; walk the
+# offset until total_transactions is reached, yielding one page at a time so
+# callers can classify or aggregate without holding the whole history
+def iter_transaction_pages(plaid_client, access_token, start_date, end_date, page_size=500):
+    from plaid.model.transactions_get_request import TransactionsGetRequest
+    from plaid.model.transactions_get_request_options import TransactionsGetRequestOptions
+
+    offset = 0
+    while True:
+        txn_request = TransactionsGetRequest(
+            access_token=access_token,
+            start_date=start_date,
+            end_date=end_date,
+            options=TransactionsGetRequestOptions(count=page_size, offset=offset)
+        )
+        response = plaid_client.transactions_get(txn_request)
+        page = response['transactions']
+        if page:
+            yield page
+        offset += len(page)
+        if not page or offset >= response['total_transactions']:
+            return
+
+
+def iter_transactions(plaid_client, access_token, start_date, end_date, page_size=500):
+    for page in iter_transaction_pages(plaid_client, access_token, start_date, end_date, page_size):
+        yield from page
@@ -0,0 +1,330 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+
+# Resilient calls to Plaid and Gemini.
+#
+# Every upstream call goes through call(), which applies a per-endpoint
+# deadline, retries idempotent calls with jittered exponential backoff, and
+# keeps a circuit breaker per upstream. While a breaker is open calls fail fast
+# with CircuitOpenError, or return the last good response for the same key if
+# one was recorded.
+
+PLAID_POOL_SIZE = int(os.getenv("PLAID_POOL_SIZE", "20"))
+UPSTREAM_RETRIES = int(os.getenv("UPSTREAM_RETRIES", "2"))
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "0.2"))  # seconds
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))
+BREAKER_RESET = float(os.getenv("BREAKER_RESET", "30"))  # seconds before a trial call
+LAST_GOOD_SIZE = 1024
+
+# Seconds allowed for one attempt at each endpoint
+DEADLINES = {
+    "plaid.link_token_create": float(os.getenv("PLAID_LINK_TIMEOUT", "10")),
+    "plaid.item_public_token_exchange": float(os.getenv("PLAID_EXCHANGE_TIMEOUT", "10")),
+    "plaid.transactions_sync": float(os.getenv("PLAID_TRANSACTIONS_TIMEOUT", "20")),
+    "plaid.transactions_get": float(os.getenv("PLAID_TRANSACTIONS_TIMEOUT", "20")),
+    "gemini": float(os.getenv("GEMINI_TIMEOUT", "30")),
+}
+DEFAULT_DEADLINE = 15.0
+
+# Plaid calls that are safe to repeat
+IDEMPOTENT_PLAID = {"transactions_sync", "transactions_get", "link_token_create", "webhook_verification_key_get"}
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+# While traffic is being captured (capture.py) this is called after every
+# attempt at an upstream call as recorder(endpoint, request, response, error,
+# seconds)
+recorder = None
+
+
+def _attempt(endpoint, request, fn, deadline):
+    if recorder is None or request is None:
+        return fn(deadline)
+    started = time.perf_counter()
+    try:
+        response = fn(deadline)
+    except Exception as e:
+        recorder(endpoint, request, None, e, time.perf_counter() - started)
+        raise
+    recorder(endpoint, request, response, None, time.perf_counter() - started)
+    return response
+
+
+async def _attempt_async(endpoint, request, fn, deadline):
+    if recorder is None or request is None:
+        return await fn(deadline)
+    started = time.perf_counter()
+    try:
+        response = await fn(deadline)
+    except Exception as e:
+        recorder(endpoint, request, None, e, time.perf_counter() - started)
+        raise
+    recorder(endpoint, request, response, None, time.perf_counter() - started)
+    return response
+
+
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold=BREAKER_FAILURES, reset_timeout=BREAKER_RESET):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.calls = 0
+        self.failures = 0
+        self.short_circuits = 0
+        self.fallbacks = 0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    # closed: everything goes through; open: nothing does until reset_timeout
+    # has passed; half_open: exactly one trial call decides which way to go
+    def allow(self):
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                self._trial_in_flight = False
+            if self.state == "closed":
+                return True
+            if self.state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            self.short_circuits += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.calls += 1
+            self.consecutive_failures = 0
+            self.state = "closed"
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.calls += 1
+            self.failures += 1
+            self.consecutive_failures += 1
+            if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "open_for": round(time.monotonic() - self.opened_at, 1) if self.state == "open" else None,
+                "calls": self.calls,
+                "failures": self.failures,
+                "short_circuits": self.short_circuits,
+                "fallbacks_served": self.fallbacks,
+            }
+
+
+breakers = {}
+_breakers_lock = threading.Lock()
+
+_last_good = OrderedDict()
+_last_good_lock = threading.Lock()
+
+
+def get_breaker(name):
+    with _breakers_lock:
+        if name not in breakers:
+            breakers[name] = CircuitBreaker(name)
+        return breakers[name]
+
+
+def breaker_states():
+    with _breakers_lock:
+        return {name: breaker.snapshot() for name, breaker in breakers.items()}
+
+
+def _remember(key, value):
+    with _last_good_lock:
+        _last_good[key] = value
+        _last_good.move_to_end(key)
+        while len(_last_good) > LAST_GOOD_SIZE:
+            _last_good.popitem(last=False)
+
+
+def _recall(key):
+    with _last_good_lock:
+        return _last_good.get(key, _MISSING)
+
+
+_MISSING = object()
+
+
+# Timeouts, connection resets, 429s and 5xx are worth retrying and count
+# against the breaker; anything else (bad request, auth) is the caller's problem
+def is_transient(exc):
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return True
+    status = getattr(exc, "status", None) or getattr(exc, "code", None)
+    if isinstance(status, int) and (status == 429 or status >= 500):
+        return True
+    name = type(exc).__name__
+    return any(marker in name for marker in
+               ("Timeout", "Unavailable", "DeadlineExceeded", "ResourceExhausted", "MaxRetry", "Protocol"))
+
+
+# `request` is what was asked, kept for capture.py; it isn't sent anywhere.
+# `expires_at` (time.monotonic()) bounds the whole call: each attempt's
+# deadline is cut to the time left, and no retry starts past it.
+def call(breaker_name, endpoint, fn, idempotent=True, fallback_key=None, deadline=None, request=None,
+         expires_at=None):
+    breaker, last_good_key, short_circuit = _before_call(breaker_name, endpoint, fallback_key)
+    if short_circuit is not _MISSING:
+        return short_circuit
+
+    if deadline is None:
+        deadline = DEADLINES.get(endpoint, DEFAULT_DEADLINE)
+    attempts = 1 + (UPSTREAM_RETRIES if idempotent else 0)
+    for attempt in range(attempts):
+        try:
+            value = _attempt(endpoint, request, fn, _time_left(endpoint, deadline, expires_at))
+        except Exception as e:
+            delay = _after_failure(breaker, endpoint, e, attempt, attempts)
+            if expires_at is not None and time.monotonic() + delay >= expires_at:
+                breaker.record_failure()
+                raise
+            time.sleep(delay)
+            continue
+        return _after_success(breaker, last_good_key, value)
+
+
+def _time_left(endpoint, deadline, expires_at):
+    if expires_at is None:
+        return deadline
+    left = expires_at - time.monotonic()
+    if left <= 0:
+        raise TimeoutError(f"no time left for {endpoint}")
+    return min(deadline, left)
+
+
+# Same as call() for coroutines: `fn(deadline)` is awaited and backoff sleeps
+# don't block the event loop. Breakers and last-good responses are shared.
+async def call_async(breaker_name, endpoint, fn, idempotent=True, fallback_key=None, deadline=None,
+                     request=None):
+    breaker, last_good_key, short_circuit = _before_call(breaker_name, endpoint, fallback_key)
+    if short_circuit is not _MISSING:
+        return short_circuit
+
+    if deadline is None:
+        deadline = DEADLINES.get(endpoint, DEFAULT_DEADLINE)
+    attempts = 1 + (UPSTREAM_RETRIES if idempotent else 0)
+    for attempt in range(attempts):
+        try:
+            value = await _attempt_async(endpoint, request, fn, deadline)
+        except Exception as e:
+            await asyncio.sleep(_after_failure(breaker, endpoint, e, attempt, attempts))
+            continue
+        return _after_success(breaker, last_good_key, value)
+
+
+# Returns the breaker, the last-good key and, while the breaker is open, the
+# remembered response (raises CircuitOpenError when there is none)
+def _before_call(breaker_name, endpoint, fallback_key):
+    breaker = get_breaker(breaker_name)
+    last_good_key = (endpoint, fallback_key) if fallback_key is not None else None
+
+    if not breaker.allow():
+        if last_good_key is not None:
+            value = _recall(last_good_key)
+            if value is not _MISSING:
+                breaker.fallbacks += 1
+                return breaker, last_good_key, value
+        metrics.upstream_errors.inc(upstream=breaker.name, endpoint=endpoint, kind="circuit_open")
+        raise CircuitOpenError(f"{breaker.name} circuit is open")
+    return breaker, last_good_key, _MISSING
+
+
+# Re-raises unless the failure is transient and attempts are left; otherwise
+# returns how long to back off before the next attempt
+def _after_failure(breaker, endpoint, exc, attempt, attempts):
+    if not is_transient(exc):
+        breaker.record_success()  # upstream answered; the request was just bad
+        metrics.upstream_errors.inc(upstream=breaker.name, endpoint=endpoint, kind="rejected")
+        raise exc
+    metrics.upstream_errors.inc(upstream=breaker.name, endpoint=endpoint, kind="transient")
+    if attempt + 1 >= attempts:
+        breaker.record_failure()
+        raise exc
+    # Full jitter: sleep anywhere up to the exponential backoff
+    return random.uniform(0, RETRY_BASE_DELAY * (2 ** attempt))
+
+
+def _after_success(breaker, last_good_key, value):
+    breaker.record_success()
+    if last_good_key is not None:
+        _remember(last_good_key, value)
+    return value
+
+
+# The whole request: a paged call must only ever get back the page it asked for
+def _plaid_fallback_key(method, args):
+    request = args[0] if args else None
+    if method == "transactions_get" and request is not None:
+        options = request.get("options")
+        count = options.get("count") if options is not None else None
+        offset = options.get("offset") if options is not None else None
+        return (request.get("access_token"), str(request.get("start_date")), str(request.get("end_date")),
+                count, offset)
+    return None
+
+
+# Drop-in wrapper around plaid_api.PlaidApi: every method call gets a deadline,
+# retries (when idempotent) and the "plaid" circuit breaker
+class ResilientPlaid:
+    def __init__(self, client):
+        self._client = client
+
+    def __getattr__(self, method):
+        target = getattr(self._client, method)
+        if not callable(target):
+            return target
+
+        def wrapper(*args, **kwargs):
+            def attempt(deadline):
+                return target(*args, _request_timeout=deadline, **kwargs)
+
+            return call("plaid", f"plaid.{method}", attempt,
+                        idempotent=method in IDEMPOTENT_PLAID,
+                        fallback_key=_plaid_fallback_key(method, args),
+                        request=args[0] if args else kwargs)
+
+        return wrapper
+
+
+# The same for the async REST client in async_clients.py
+class ResilientAsyncPlaid:
+    def __init__(self, client):
+        self._client = client
+
+    def __getattr__(self, method):
+        target = getattr(self._client, method)
+        if not callable(target):
+            return target
+
+        async def wrapper(*args, **kwargs):
+            async def attempt(deadline):
+                return await target(*args, _request_timeout=deadline, **kwargs)
+
+            return await call_async("plaid", f"plaid.{method}", attempt,
+                                    idempotent=method in IDEMPOTENT_PLAID,
+                                    fallback_key=_plaid_fallback_key(method, args),
+                                    request=args[0] if args else kwargs)
+
+        return wrapper
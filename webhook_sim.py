@@ -0,0 +1,152 @@
+import argparse
+import base64
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+import warnings
+
+# Sends Plaid-style transaction webhooks for local testing.
+#
+#   python webhook_sim.py --local
+#       in-process run against the fakes: connects a bank, then sends a
+#       signed webhook, a redelivery of it, a later update with the same body,
+#       a tampered one and a stale one, and prints
+#       how each was handled. The fake Plaid serves the simulator's signing key,
+#       so the full verification path runs.
+#
+#   python webhook_sim.py --url http://localhost:5000/plaid/webhook --item-id <item id>
+#       posts to a running server. Plaid would not know our signing key, so
+#       start that server with PLAID_WEBHOOK_VERIFY=0.
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def _b64(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+# A fresh P-256 signing key and its public JWK, as /webhook_verification_key/get returns it
+def make_key(kid="sim-key"):
+    from cryptography.hazmat.primitives.asymmetric import ec
+
+    private_key = ec.generate_private_key(ec.SECP256R1())
+    numbers = private_key.public_key().public_numbers()
+    jwk = {"alg": "ES256", "crv": "P-256", "kid": kid, "kty": "EC", "use": "sig",
+           "x": _b64(numbers.x.to_bytes(32, "big")), "y": _b64(numbers.y.to_bytes(32, "big")),
+           "created_at": int(time.time()), "expired_at": None}
+    return private_key, jwk
+
+
+def sign(body, private_key, kid, issued_at=None):
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.hazmat.primitives.asymmetric.utils import decode_dss_signature
+
+    header = _b64(json.dumps({"alg": "ES256", "kid": kid, "typ": "JWT"}).encode())
+    payload = _b64(json.dumps({
+        "iat": int(time.time() if issued_at is None else issued_at),
+        "request_body_sha256": hashlib.sha256(body).hexdigest(),
+    }).encode())
+    r, s = decode_dss_signature(private_key.sign(f"{header}.{payload}".encode(), ec.ECDSA(hashes.SHA256())))
+    return f"{header}.{payload}.{_b64(r.to_bytes(32, 'big') + s.to_bytes(32, 'big'))}"
+
+
+def webhook_body(item_id, code="SYNC_UPDATES_AVAILABLE"):
+    return json.dumps({
+        "webhook_type": "TRANSACTIONS",
+        "webhook_code": code,
+        "item_id": item_id,
+        "initial_update_complete": True,
+        "historical_update_complete": True,
+        "environment": "sandbox",
+    }).encode()
+
+
+def post(url, body, token=None):
+    headers = {"Content-Type": "application/json"}
+    if token:
+        headers["Plaid-Verification"] = token
+    req = urllib.request.Request(url, data=body, headers=headers, method="POST")
+    try:
+        with urllib.request.urlopen(req, timeout=10) as response:
+            return response.status, json.loads(response.read() or b"{}")
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read() or b"{}")
+
+
+def run_local(code):
+    workdir = tempfile.mkdtemp(prefix="quitbet-webhooks-")
+    os.environ.setdefault("USERS_DB", os.path.join(workdir, "quitbet.db"))
+    os.environ.setdefault("TXN_DB", os.environ["USERS_DB"])
+    os.environ.setdefault("PLAID_WEBHOOK_URL", "http://localhost:5000/plaid/webhook")
+    os.environ["PLAID_WEBHOOK_VERIFY"] = "1"
+    os.chdir(workdir)
+    sys.path.insert(0, ROOT)
+    warnings.filterwarnings("ignore")
+
+    import app as app_module
+    import fakes
+
+    fake_plaid = fakes.install(app_module)
+    private_key, jwk = make_key()
+    fake_plaid.webhook_keys[jwk["kid"]] = jwk
+
+    client = app_module.app.test_client()
+    email = "webhooks@test.dev"
+    client.post("/signup", data={"email": email, "password": "sim"})
+    client.post("/exchange_token", json={"public_token": "public-sim", "email": email})
+    app_module.webhook_jobs.join()  # initial sync queued by the token exchange
+    with app_module.user_scope():
+        item_id = app_module.users[email]["item_id"]
+
+    def send(label, body, token):
+        response = client.post("/plaid/webhook", data=body, headers={"Plaid-Verification": token},
+                               content_type="application/json")
+        print(f"{label:<14} {response.status_code} {response.get_json()}")
+
+    # Plaid sends the same body for every update on an Item; only a redelivery
+    # of the same signed delivery is a duplicate
+    body = webhook_body(item_id, code)
+    token = sign(body, private_key, jwk["kid"])
+    send("signed", body, token)
+    send("duplicate", body, token)
+    app_module.webhook_jobs.join()
+    send("next update", body, sign(body, private_key, jwk["kid"], issued_at=time.time() + 1))
+    send("tampered", body.replace(b"sandbox", b"production"), sign(body, private_key, jwk["kid"]))
+    stale = webhook_body(item_id, code)
+    send("stale", stale, sign(stale, private_key, jwk["kid"], issued_at=time.time() - 3600))
+    unknown = webhook_body("item-unknown", code)
+    send("unknown item", unknown, sign(unknown, private_key, jwk["kid"]))
+
+    app_module.webhook_jobs.join()
+    with app_module.user_scope():
+        progress = app_module.users[email].get("progress")
+    stored = app_module.transaction_store.list_transactions(email)
+    print(f"jobs: {app_module.webhook_jobs.stats()}")
+    print(f"plaid calls: {fake_plaid.calls}")
+    print(f"stored transactions: {len(stored)}  progress: {progress}")
+    app_module.user_store.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Send simulated Plaid transaction webhooks")
+    parser.add_argument("--local", action="store_true", help="run in-process against the fakes")
+    parser.add_argument("--url", default="http://localhost:5000/plaid/webhook")
+    parser.add_argument("--item-id", help="Item to notify about (with --url)")
+    parser.add_argument("--code", default="SYNC_UPDATES_AVAILABLE", help="webhook_code to send")
+    parser.add_argument("--repeat", type=int, default=1, help="send the same body this many times")
+    args = parser.parse_args()
+
+    if args.local:
+        run_local(args.code)
+    else:
+        if not args.item_id:
+            parser.error("--item-id is required with --url")
+        body = webhook_body(args.item_id, args.code)
+        for _ in range(args.repeat):
+            print(post(args.url, body))
@@ -0,0 +1,140 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Plaid webhook verification and de-duplication.
+#
+# Every webhook carries a `Plaid-Verification` header: an ES256 JWT whose
+# payload holds the time it was issued and the SHA-256 of the request body.
+# The signing key is fetched once per key id from
+# /webhook_verification_key/get and cached.
+# https://plaid.com/docs/api/webhooks/webhook-verification/
+
+WEBHOOK_VERIFY = os.getenv("PLAID_WEBHOOK_VERIFY", "1") == "1"
+WEBHOOK_MAX_AGE = int(os.getenv("WEBHOOK_MAX_AGE", "300"))  # seconds
+WEBHOOK_DEDUPE_TTL = int(os.getenv("WEBHOOK_DEDUPE_TTL", str(WEBHOOK_MAX_AGE)))  # seconds
+
+# Transaction webhook codes that mean "there is new data for this Item"
+TRANSACTION_CODES = {
+    "SYNC_UPDATES_AVAILABLE",
+    "INITIAL_UPDATE",
+    "HISTORICAL_UPDATE",
+    "DEFAULT_UPDATE",
+    "TRANSACTIONS_REMOVED",
+}
+
+
+class WebhookError(Exception):
+    pass
+
+
+def _b64decode(segment):
+    return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+
+
+def body_hash(body):
+    return hashlib.sha256(body).hexdigest()
+
+
+# Verification keys by key id; `fetch(kid)` returns the JWK dict
+class KeyCache:
+    def __init__(self, fetch):
+        self.fetch = fetch
+        self._keys = {}
+        self._lock = threading.Lock()
+
+    def get(self, kid):
+        with self._lock:
+            key = self._keys.get(kid)
+        # A key Plaid has since rotated out is fetched again to see if it expired
+        if key is None or key.get("expired_at"):
+            key = self.fetch(kid)
+            with self._lock:
+                self._keys[kid] = key
+        return key
+
+
+def _verify_signature(signing_input, signature, jwk):
+    try:
+        from cryptography.exceptions import InvalidSignature
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.asymmetric import ec
+        from cryptography.hazmat.primitives.asymmetric.utils import encode_dss_signature
+    except ImportError:
+        raise WebhookError("the cryptography package is needed to verify webhooks")
+
+    if len(signature) != 64:
+        raise WebhookError("malformed signature")
+    public_key = ec.EllipticCurvePublicNumbers(
+        int.from_bytes(_b64decode(jwk["x"]), "big"),
+        int.from_bytes(_b64decode(jwk["y"]), "big"),
+        ec.SECP256R1(),
+    ).public_key()
+    # JWS signatures are raw r || s; cryptography wants DER
+    der = encode_dss_signature(int.from_bytes(signature[:32], "big"), int.from_bytes(signature[32:], "big"))
+    try:
+        public_key.verify(der, signing_input, ec.ECDSA(hashes.SHA256()))
+    except InvalidSignature:
+        raise WebhookError("bad signature")
+
+
+# Raise WebhookError unless `token` is a fresh, valid signature over `body`;
+# returns the token's payload
+def verify(body, token, keys, max_age=WEBHOOK_MAX_AGE, now=None):
+    if not token:
+        raise WebhookError("missing Plaid-Verification header")
+    try:
+        header_b64, payload_b64, signature_b64 = token.split(".")
+        header = json.loads(_b64decode(header_b64))
+        payload = json.loads(_b64decode(payload_b64))
+        signature = _b64decode(signature_b64)
+    except ValueError:
+        raise WebhookError("malformed verification token")
+
+    if header.get("alg") != "ES256":
+        raise WebhookError(f"unexpected algorithm {header.get('alg')!r}")
+    jwk = keys.get(header.get("kid"))
+    if jwk is None or jwk.get("expired_at"):
+        raise WebhookError("unknown or expired verification key")
+    _verify_signature(f"{header_b64}.{payload_b64}".encode(), signature, jwk)
+
+    now = time.time() if now is None else now
+    if now - payload.get("iat", 0) > max_age:
+        raise WebhookError("verification token is too old")
+    if not hmac.compare_digest(str(payload.get("request_body_sha256", "")), body_hash(body)):
+        raise WebhookError("body does not match the signed hash")
+    return payload
+
+
+# One delivery: Plaid sends the same body for every SYNC_UPDATES_AVAILABLE on
+# an Item, so the body alone can't tell a redelivery from a new update, but the
+# signed issue time can
+def delivery_key(payload):
+    return f"{payload.get('iat')}:{payload.get('request_body_sha256')}"
+
+
+# Plaid delivers at least once and retries on timeouts, so the same delivery
+# can show up more than once; remember what was seen for `ttl` seconds (by
+# default WEBHOOK_MAX_AGE, after which its token is rejected anyway)
+class Deduper:
+    def __init__(self, ttl=WEBHOOK_DEDUPE_TTL, max_size=10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._seen = OrderedDict()  # digest -> first seen (oldest first)
+        self._lock = threading.Lock()
+
+    def seen(self, digest):
+        now = time.monotonic()
+        with self._lock:
+            while self._seen and (now - next(iter(self._seen.values())) > self.ttl
+                                  or len(self._seen) >= self.max_size):
+                self._seen.popitem(last=False)
+            if digest in self._seen:
+                return True
+            self._seen[digest] = now
+            return False
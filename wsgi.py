@@ -0,0 +1,8 @@
+# WSGI entry point for production:  gunicorn -c gunicorn.conf.py wsgi:application
+#
+# With preload_app the app is imported once in the gunicorn master and shared
+# copy-on-write by the workers; gunicorn.conf.py starts the background threads
+# in each worker after the fork.
+from app import create_app
+
+application = create_app(start_services=False)